@@ -1,13 +1,49 @@
-from flask import request, session
+from flask import request, session, Response, stream_with_context
 from flask_restful import Resource
 import two_factor
-from datetime import datetime
+import rate_limit
+from passwords import HashingBusy
+import serializers
+import session_cache
+from database import use_replica
+import budget
+import forecast
+import goal_summary
+import spending
+import lookup
+import dashboard
+import export
+import provisioning
+import generate
+import ingest
+import categorize
+import transactions
+import audit
+import instrumentation
+from instrumentation import phase
+from sqlalchemy.exc import IntegrityError
+from datetime import date
 
 
 # Local imports
-from config import app, db, api
+from config import app, db, api, hasher
 
-from models import Household, User, Bank, Transactions, Categories, Goals, MonthlyExpenses, ExpenseItem, LoginAttempts
+from models import Household, User, Bank, CategoryRule, loader_profile
+
+# operational endpoints (/metrics, /session_cache_stats, /provision) are for admins only
+def is_admin():
+    user_id = session.get('user_id')
+    return bool(user_id) and db.session.query(User.id).filter(User.id == user_id,
+                                                              User.admin.is_(True)).first() is not None
+
+limiter = rate_limit.create_limiter(app)
+sessionCache = session_cache.create_session_cache(app)
+two_factor.configure(app)
+auditWriter = audit.create_audit_writer(app)
+instruments = instrumentation.configure(app, authorize=is_admin)
+forecastCache = forecast.create_forecast_cache(app)
+dashboardCache = dashboard.create_dashboard_cache(app)
+lookupCache = lookup.create_lookup_cache(app)
 
 class CreateSuperUser(Resource):
     def post(self):
@@ -15,7 +51,8 @@ class CreateSuperUser(Resource):
             data = request.get_json()
             newHousehold = Household(name = data.get("household_name"), key = data.get("key"))
             db.session.add(newHousehold)
-            db.session.commit()
+            # flush for the id, the household is committed together with its first user
+            db.session.flush()
             uri = two_factor.createNewURI(user_name = data.get("user_name"))
             newUser = User(user_name = data.get("user_name"), 
                            admin = True,
@@ -30,9 +67,14 @@ class CreateSuperUser(Resource):
 
             db.session.add(newUser)
             db.session.commit()
-            return uri[1], newUser.to_dict()
+            # the otp uri for the authenticator app, and the same user fields /create_user returns
+            return {**serializers.UserSummary.dump(newUser), 'otp_uri': uri[1]}
+        except HashingBusy:
+            db.session.rollback()
+            return {'error': 'Server Busy'}, 503
         except Exception as e:
             print(e)
+            db.session.rollback()
             return {'error': 'Account not Created'}, 402
         
 api.add_resource(CreateSuperUser, '/create_super_user')
@@ -46,7 +88,9 @@ class CreateUser(Resource):
             data = request.get_json()
             householdName = data.get("household_name")
             householdKey = data.get("key")
-            household = Household.query.filter(Household.name == householdName, Household.key == householdKey).first()
+            householdId = lookup.household_id_by_code(lookupCache, householdName, householdKey)
+            if householdId is None:
+                return {'error': 'Account not Created'}, 402
 
             uri = two_factor.createNewURI(user_name = data.get("user_name"))
             newUser = User(user_name = data.get("user_name"), 
@@ -56,46 +100,88 @@ class CreateUser(Resource):
                            email = data.get("email"),
                            date_of_birth = data.get("date_of_birth"),
                            OTPkey = uri[0],
-                           household_id = household.id
+                           household_id = householdId
                            )
             newUser.password_hash = data.get("password_hash")
             db.session.add(newUser)
             db.session.commit()
-            return newUser.to_dict()
+            return serializers.respond(serializers.UserSummary, newUser)
+        except HashingBusy:
+            db.session.rollback()
+            return {'error': 'Server Busy'}, 503
         except Exception as e:
             print(e)
+            db.session.rollback()
             return {'error': 'Account not Created'}, 402
         
 api.add_resource(CreateUser, '/create_user')
 
+# bulk onboarding for admins, body is JSON ({"members": [...]} or a list) or CSV (Content-Type: text/csv)
+class Provision(Resource):
+    def post(self):
+        if not is_admin():
+            return {'message': '401: Not Authorized'}, 401
+        try:
+            members = list(provisioning.read_members(request.stream, 'csv' if request.mimetype == 'text/csv' else 'json'))
+        except ValueError as e:
+            return {'error': f'Malformed member list: {e}'}, 400
+        if len(members) > app.config['PROVISION_MAX_ROWS']:
+            return {'error': f'At most {app.config["PROVISION_MAX_ROWS"]} members per request'}, 413
+        try:
+            return provisioning.provision(members, dry_run=request.args.get('dry_run') == '1')
+        except HashingBusy:
+            return {'error': 'Server Busy'}, 503
+        except IntegrityError:
+            # a user name taken by a concurrent request after validation
+            return {'error': 'Members conflict with existing users, nothing was created'}, 409
+
+
+api.add_resource(Provision, '/provision')
+provisioning.register_cli(app)
+generate.register_cli(app)
+
 # test curl command
 # curl --header "Content-Type: application/json" \--request POST \--data '{"household_name":"test","key":"test","user_name":"xyz111122","password_hash":"xyz","first_name":"test","last_name":"test","email":"test@gmail","date_of_birth":"3/3/2023"}' \http://127.0.0.1:5555/create_user
 
 class Login(Resource):
     def post(self):
 
-        #logic for login attempts (max 5 attempts per every 3 hours)
-        time_of_attempt = datetime.now()
-        attempts = LoginAttempts.query.filter(LoginAttempts.ip_address == request.remote_addr, 
-                                              LoginAttempts.attempt_date == time_of_attempt.date(),
-                                              LoginAttempts.attempt_time >= (time_of_attempt.time().hour - 3)).all()
-        if len(attempts) >= 4:
-            return {'error': 'Too Many Attempts'}, 401
+        #logic for login attempts (max attempts per ip and per user_name inside a sliding window)
+        data = request.get_json(silent=True)
+        name = data.get('user_name') if isinstance(data, dict) else None
+        if not isinstance(name, str):
+            return {'error': 'user_name must be text'}, 400
+        with phase('ratelimit'):
+            if limiter.is_limited(request.remote_addr, name):
+                return {'error': 'Too Many Attempts'}, 401
+            limiter.record(request.remote_addr)
 
-        data = request.get_json()
-        name = data['user_name']
         password = data['password']
         otpCode = data['otpCode']
-        if user := User.query.filter(User.user_name == name).first():
-            if user.authenticate(password) and two_factor.authenticateUser(OTPkey = user.OTPkey, OTPcode = otpCode):
-                session['user_id'] = user.id
-                newLogin = LoginAttempts(ip_address = request.remote_addr, success = True)
-                db.session.add(newLogin)
-                db.session.commit()
-                return user.to_dict(), 200
-        newLogin = LoginAttempts(ip_address = request.remote_addr, success = False)
-        db.session.add(newLogin)
-        db.session.commit()
+        with phase('lookup'):
+            user = lookup.user_by_name(lookupCache, name)
+        if user:
+            try:
+                with phase('password'):
+                    authenticated = user.authenticate(password)
+            except HashingBusy:
+                return {'error': 'Server Busy'}, 503
+            if authenticated:
+                with phase('totp'):
+                    authenticated = two_factor.authenticateUser(OTPkey = user.OTPkey, OTPcode = otpCode, user_id = user.id)
+            if authenticated:
+                user_id = session['user_id'] = user.id
+                auditWriter.record(request.remote_addr, True)
+                with phase('commit'):
+                    # picks up a password rehash from authenticate, if there was one
+                    db.session.commit()
+                # reload with the full profile so serializing doesn't lazy load per relationship
+                with phase('load'):
+                    user = User.query.options(*loader_profile(User, 'full')).populate_existing().filter(User.id == user_id).one()
+                with phase('serialize'):
+                    return serializers.respond(serializers.UserFull, user)
+        limiter.record_failure(name)
+        auditWriter.record(request.remote_addr, False)
         return {'error': 'Unauthorized'}, 401
 
 
@@ -103,16 +189,250 @@ api.add_resource(Login, '/login')
 
 # check session
 class CheckSession(Resource):
+    @use_replica
     def get(self):
-        if user := User.query.filter(User.id == session.get('user_id')).first():
-            print(user)
-            return user.to_dict(rules = ["-uri"])
-        else:
+        user_id = session.get('user_id')
+        if not user_id:
             return {'message': '401: Not Authorized'}, 401
+        # cache hits never touch the database
+        if (payload := sessionCache.get(user_id)) is None:
+            if not (user := db.session.get(User, user_id)):
+                return {'message': '401: Not Authorized'}, 401
+            payload = serializers.dumps(serializers.UserSummary.dump(user))
+            sessionCache.set(user_id, payload)
+        return Response(payload, mimetype='application/json')
 
 
 api.add_resource(CheckSession, '/check_session')
 
+# session cache counters for monitoring, admins only
+class SessionCacheStats(Resource):
+    def get(self):
+        if not is_admin():
+            return {'message': '401: Not Authorized'}, 401
+        return sessionCache.stats
+
+
+api.add_resource(SessionCacheStats, '/session_cache_stats')
+
+def is_household_member(household_id):
+    user_id = session.get('user_id')
+    return bool(user_id) and db.session.query(User.id).filter(User.id == user_id,
+                                                              User.household_id == household_id).first() is not None
+
+# budget rollup for a household, optional ?start=YYYY-MM&end=YYYY-MM
+class BudgetSummary(Resource):
+    def get(self, household_id):
+        if not is_household_member(household_id):
+            return {'message': '401: Not Authorized'}, 401
+        try:
+            start = budget.parse_month(request.args.get('start'))
+            end = budget.parse_month(request.args.get('end'))
+        except ValueError:
+            return {'error': 'Months must be formatted YYYY-MM'}, 400
+        return budget.budget_summary(household_id, start, end)
+
+
+api.add_resource(BudgetSummary, '/households/<int:household_id>/budget_summary')
+
+# income and expense forecast from the household's monthly budgets
+# optional ?start=YYYY-MM&end=YYYY-MM&window=6&horizon=12
+class Forecast(Resource):
+    def get(self, household_id):
+        version = dashboard.member_version(household_id, session.get('user_id'))
+        if version is None:
+            return {'message': '401: Not Authorized'}, 401
+        try:
+            start = budget.parse_month(request.args.get('start'))
+            end = budget.parse_month(request.args.get('end'))
+        except ValueError:
+            return {'error': 'Months must be formatted YYYY-MM'}, 400
+        if start and end and start > end:
+            return {'error': 'start must not be after end'}, 400
+        if start and end and (end.year - start.year) * 12 + end.month - start.month >= forecast.MAX_HISTORY_MONTHS:
+            return {'error': f'At most {forecast.MAX_HISTORY_MONTHS} months of history per forecast'}, 400
+        window = request.args.get('window', 6, type=int)
+        horizon = request.args.get('horizon', 12, type=int)
+        if not 1 <= window <= 120 or not 1 <= horizon <= 120:
+            return {'error': 'window and horizon must be between 1 and 120 months'}, 400
+        try:
+            return forecast.forecast(forecastCache, household_id, version, start, end, window, horizon)
+        except ValueError as e:
+            return {'error': str(e)}, 400
+
+
+api.add_resource(Forecast, '/households/<int:household_id>/forecast')
+
+# goal totals for a household, read from the maintained summary row
+class GoalSummary(Resource):
+    def get(self, household_id):
+        if not is_household_member(household_id):
+            return {'message': '401: Not Authorized'}, 401
+        return goal_summary.summary(household_id)
+
+
+api.add_resource(GoalSummary, '/households/<int:household_id>/goal_summary')
+goal_summary.register_cli(app)
+
+# spending per month and category from the rollup table, optional ?start=YYYY-MM&end=YYYY-MM
+class HouseholdSpending(Resource):
+    def get(self, household_id):
+        if not is_household_member(household_id):
+            return {'message': '401: Not Authorized'}, 401
+        try:
+            start = budget.parse_month(request.args.get('start'))
+            end = budget.parse_month(request.args.get('end'))
+        except ValueError:
+            return {'error': 'Months must be formatted YYYY-MM'}, 400
+        return spending.monthly_spending(household_id, start, end)
+
+
+api.add_resource(HouseholdSpending, '/households/<int:household_id>/spending')
+spending.register_cli(app)
+
+# whole household view in two statements, conditional GET via If-None-Match
+class HouseholdDashboard(Resource):
+    def get(self, household_id):
+        version = dashboard.member_version(household_id, session.get('user_id'))
+        if version is None:
+            return {'message': '401: Not Authorized'}, 401
+        month = dashboard.current_month()
+        etag = dashboard.etag(household_id, version, month)
+        headers = {'ETag': etag, 'Cache-Control': 'private, no-cache'}
+        if request.if_none_match.contains(etag.strip('"')):
+            return Response(status=304, headers=headers)
+        payload = dashboard.render(dashboardCache, household_id, version, month)
+        return Response(payload, mimetype='application/json', headers=headers)
+
+
+api.add_resource(HouseholdDashboard, '/households/<int:household_id>/dashboard')
+
+# streamed full history, ?format=ndjson&cursor= or ?format=csv&table=transactions&after_id=
+class HouseholdExport(Resource):
+    def get(self, household_id):
+        if not is_household_member(household_id):
+            return {'message': '401: Not Authorized'}, 401
+        args = request.args
+        batchSize = app.config['EXPORT_BATCH_SIZE']
+        try:
+            if args.get('format', 'ndjson') == 'ndjson':
+                if args.get('cursor'):
+                    export.decode_cursor(args['cursor'])
+                body = export.ndjson(household_id, args.get('cursor'), batchSize)
+                mimetype = 'application/x-ndjson'
+            elif args.get('format') == 'csv':
+                table = args.get('table')
+                if table not in export.TABLES:
+                    raise ValueError(f'table must be one of {", ".join(export.TABLES)}')
+                body = export.csv_rows(household_id, table, int(args.get('after_id', 0)), batchSize)
+                mimetype = 'text/csv'
+            else:
+                raise ValueError('format must be ndjson or csv')
+        except ValueError as e:
+            return {'error': str(e)}, 400
+        return Response(stream_with_context(body), mimetype=mimetype,
+                        headers={'Cache-Control': 'no-store', 'X-Accel-Buffering': 'no'})
+
+
+api.add_resource(HouseholdExport, '/households/<int:household_id>/export')
+export.register_cli(app)
+
+def owns_bank(bank_id):
+    user_id = session.get('user_id')
+    return bool(user_id) and db.session.query(Bank.id).filter(Bank.id == bank_id,
+                                                              Bank.user_id == user_id).first() is not None
+
+# bulk import of a bank feed, body is NDJSON (default) or CSV (Content-Type: text/csv)
+class TransactionImport(Resource):
+    def post(self, bank_id):
+        if not owns_bank(bank_id):
+            return {'message': '401: Not Authorized'}, 401
+        if request.mimetype == 'text/csv':
+            records = ingest.read_csv(request.stream)
+        else:
+            records = ingest.read_ndjson(request.stream)
+        try:
+            return ingest.ingest(bank_id, records, app.config['INGEST_BATCH_SIZE'],
+                                 categorize.matcher_for_bank(bank_id))
+        except ValueError as e:
+            return {'error': f'Malformed feed: {e}'}, 400
+
+
+api.add_resource(TransactionImport, '/banks/<int:bank_id>/transactions/import')
+
+# paginated history, ?cursor=&limit=&category=<id|none>&start=YYYY-MM-DD&end=YYYY-MM-DD&fields=id,date,...
+class BankTransactions(Resource):
+    def get(self, bank_id):
+        if not owns_bank(bank_id):
+            return {'message': '401: Not Authorized'}, 401
+        args = request.args
+        try:
+            return transactions.list_transactions(
+                bank_id,
+                cursor = args.get('cursor'),
+                limit = int(args.get('limit', transactions.DEFAULT_PAGE_SIZE)),
+                fields = args.get('fields').split(',') if args.get('fields') else None,
+                categories_id = args.get('category'),
+                start = date.fromisoformat(args['start']) if args.get('start') else None,
+                end = date.fromisoformat(args['end']) if args.get('end') else None)
+        except ValueError as e:
+            return {'error': str(e)}, 400
+
+
+api.add_resource(BankTransactions, '/banks/<int:bank_id>/transactions')
+
+# category rules shared by a household (or private to a user with "personal": true)
+class CategoryRules(Resource):
+    def get(self, household_id):
+        if not is_household_member(household_id):
+            return {'message': '401: Not Authorized'}, 401
+        rules = CategoryRule.query.filter((CategoryRule.household_id == household_id) |
+                                          (CategoryRule.user_id == session['user_id'])
+                                          ).order_by(CategoryRule.priority, CategoryRule.id).all()
+        return serializers.CategoryRuleSummary.dump_many(rules)
+
+    def post(self, household_id):
+        if not is_household_member(household_id):
+            return {'message': '401: Not Authorized'}, 401
+        try:
+            data = request.get_json()
+            if data.get("match_type") == 'regex':
+                categorize.validate_regex(data.get("pattern"))
+            personal = data.get("personal", False)
+            newRule = CategoryRule(match_type = data.get("match_type"),
+                                   pattern = data.get("pattern"),
+                                   min_amount_cents = data.get("min_amount_cents"),
+                                   max_amount_cents = data.get("max_amount_cents"),
+                                   priority = data.get("priority", 100),
+                                   categories_id = data.get("categories_id"),
+                                   user_id = session['user_id'] if personal else None,
+                                   household_id = None if personal else household_id
+                                   )
+            db.session.add(newRule)
+            db.session.commit()
+            return serializers.CategoryRuleSummary.dump(newRule), 201
+        except (ValueError, TypeError) as e:
+            db.session.rollback()
+            return {'error': f'Rule not Created: {e}'}, 400
+        except Exception:
+            app.logger.exception('category rule not created')
+            db.session.rollback()
+            return {'error': 'Rule not Created'}, 400
+
+
+api.add_resource(CategoryRules, '/households/<int:household_id>/category_rules')
+
+# re-applies the category rules to a bank's uncategorized or out-of-date transactions
+class Recategorize(Resource):
+    def post(self, bank_id):
+        if not owns_bank(bank_id):
+            return {'message': '401: Not Authorized'}, 401
+        return categorize.recategorize_bank(bank_id, app.config['INGEST_BATCH_SIZE'])
+
+
+api.add_resource(Recategorize, '/banks/<int:bank_id>/recategorize')
+ingest.register_cli(app)
+
 # logout
 class Logout(Resource):
     def delete(self):
@@ -123,5 +443,15 @@ class Logout(Resource):
 api.add_resource(Logout, '/logout')
 
 
+def shutdown():
+    # called by the production servers (gunicorn worker_exit, asgi lifespan) before a
+    # worker exits: write out queued login attempts, stop the hashing pool, close connections
+    auditWriter.close()
+    hasher.shutdown()
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose()
+
+
 if __name__ == '__main__':
     app.run(port=5555, debug=True)
@@ -0,0 +1,275 @@
+import asyncio
+import io
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from http.cookies import SimpleCookie
+
+from itsdangerous import BadSignature
+from sqlalchemy import select
+from sqlalchemy.engine import make_url
+
+import database
+import serializers
+from app import app, sessionCache, shutdown
+from models import User
+from session_cache import MemoryBackend, NullBackend
+
+
+# ASGI entry point
+#
+#   cd server && uvicorn asgi:application --workers 4 --port 5555
+#   cd server && GUNICORN_WORKER_CLASS=uvicorn.workers.UvicornWorker gunicorn -c gunicorn.conf.py asgi:application
+#
+# the flask views run unchanged on a thread pool (ASGI_THREADS threads per worker) through
+# WsgiBridge. GET /check_session, polled by every open tab, is answered on the event loop
+# instead: the session cookie is verified here, a session cache hit returns straight away
+# and a miss reads the user with SQLAlchemy's async engine (aiosqlite / asyncpg / aiomysql),
+# so it never waits for a thread that's busy with bcrypt.
+# request bodies are streamed into wsgi.input a message at a time, so the NDJSON import
+# and /provision keep their bounded memory under this entry point too.
+# lifespan shutdown drains the audit writer and stops the hashing pool (app.shutdown).
+
+ASYNC_DRIVERS = {'sqlite': 'aiosqlite', 'postgresql': 'asyncpg', 'mysql': 'aiomysql'}
+
+NOT_AUTHORIZED = serializers.dumps({'message': '401: Not Authorized'})
+
+
+def async_url(url):
+    url = make_url(url)
+    driver = ASYNC_DRIVERS.get(url.get_backend_name())
+    return url.set(drivername=f'{url.get_backend_name()}+{driver}') if driver else None
+
+
+class RequestBody(io.RawIOBase):
+    # wsgi.input read from the ASGI receive channel. the view's thread asks the loop for
+    # the next http.request message only once it has used up the last one, so at most
+    # one message of the body is held in memory
+
+    def __init__(self, receive, loop):
+        self._receive = receive
+        self._loop = loop
+        self._chunk = memoryview(b'')
+        self._more = True
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self._chunk and self._more:
+            message = asyncio.run_coroutine_threadsafe(self._receive(), self._loop).result()
+            if message['type'] == 'http.disconnect':
+                raise ConnectionResetError('client disconnected')
+            self._chunk = memoryview(message.get('body', b''))
+            self._more = message.get('more_body', False)
+        n = min(len(buffer), len(self._chunk))
+        buffer[:n] = self._chunk[:n]
+        self._chunk = self._chunk[n:]
+        return n
+
+
+def wsgi_environ(scope, body):
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope['query_string'].decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f'HTTP/{scope["http_version"]}',
+        'REMOTE_ADDR': client[0],
+        'REMOTE_PORT': str(client[1]),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': body,
+        # the stream ends with the last http.request message, chunked uploads included
+        'wsgi.input_terminated': True,
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope['headers']:
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name == 'CONTENT_TYPE' or name == 'CONTENT_LENGTH':
+            environ[name] = value
+            continue
+        key = f'HTTP_{name}'
+        environ[key] = f'{environ[key]},{value}' if key in environ else value
+    return environ
+
+
+class WsgiBridge:
+    # runs the wsgi app on a plain thread pool, any free thread takes the next request.
+    # (asgiref's WsgiToAsgi goes through a thread-sensitive SyncToAsync, which under
+    # concurrent load failed requests with "CurrentThreadExecutor already quit".)
+    # response chunks are handed back to the loop as the app yields them, so streamed
+    # responses aren't buffered. the request body is read the same way, as the view asks for it.
+
+    def __init__(self, wsgi_app, threads):
+        self.wsgi_app = wsgi_app
+        self.executor = ThreadPoolExecutor(threads, thread_name_prefix='wsgi')
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+
+    async def __call__(self, scope, receive, send):
+        loop = asyncio.get_running_loop()
+        body = io.BufferedReader(RequestBody(receive, loop))
+        await loop.run_in_executor(self.executor, self._run, loop, wsgi_environ(scope, body), send)
+
+    def _run(self, loop, environ, send):
+        started = {}
+
+        def deliver(message):
+            asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+        def start_response(status, headers, exc_info=None):
+            if exc_info and started.get('sent'):
+                raise exc_info[1].with_traceback(exc_info[2])
+            started['status'] = int(status.split(' ', 1)[0])
+            started['headers'] = [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers]
+
+        def start():
+            if not started.get('sent'):
+                started['sent'] = True
+                deliver({'type': 'http.response.start', 'status': started['status'], 'headers': started['headers']})
+
+        response = self.wsgi_app(environ, start_response)
+        try:
+            for chunk in response:
+                if chunk:
+                    start()
+                    deliver({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            start()
+            deliver({'type': 'http.response.body', 'body': b''})
+        finally:
+            if hasattr(response, 'close'):
+                response.close()
+
+
+class CheckSessionEndpoint:
+
+    def __init__(self, flask_app, cache):
+        self.signer = flask_app.session_interface.get_signing_serializer(flask_app)
+        self.cookie_name = flask_app.config['SESSION_COOKIE_NAME']
+        self.max_age = int(flask_app.permanent_session_lifetime.total_seconds())
+        self.cache = cache
+        # the memory backend is a dict under a lock, anything else (sqlite) is file i/o
+        # and goes to a thread so it doesn't hold up the loop
+        self.cache_blocks = not isinstance(cache.backend, (MemoryBackend, NullBackend))
+        # the same columns serializers.UserSummary dumps
+        self.columns = [User.__table__.c[key] for key, _ in serializers.UserSummary.fields]
+        self.engine = None
+
+    def start(self, url):
+        from sqlalchemy.ext.asyncio import create_async_engine
+        self.engine = create_async_engine(url, **database.engine_options(url))
+
+    async def stop(self):
+        if self.engine is not None:
+            await self.engine.dispose()
+            self.engine = None
+
+    def _user_id(self, scope):
+        for name, value in scope['headers']:
+            if name == b'cookie':
+                morsel = SimpleCookie(value.decode('latin-1')).get(self.cookie_name)
+                if morsel is None:
+                    continue
+                try:
+                    return self.signer.loads(morsel.value, max_age=self.max_age).get('user_id')
+                except BadSignature:
+                    return None
+        return None
+
+    async def __call__(self, scope, receive, send):
+        user_id = self._user_id(scope)
+        if not user_id:
+            return await self._respond(send, scope, 401, NOT_AUTHORIZED)
+        if (payload := await self._cache(self.cache.get, user_id)) is None:
+            async with self.engine.connect() as conn:
+                row = (await conn.execute(select(*self.columns).where(User.id == user_id))).first()
+            if row is None:
+                return await self._respond(send, scope, 401, NOT_AUTHORIZED)
+            payload = serializers.dumps(serializers.UserSummary.dump(row))
+            await self._cache(self.cache.set, user_id, payload)
+        await self._respond(send, scope, 200, payload)
+
+    async def _cache(self, fn, *args):
+        if self.cache_blocks:
+            return await asyncio.to_thread(fn, *args)
+        return fn(*args)
+
+    async def _respond(self, send, scope, status, body):
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        headers = [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode()),
+                   (b'vary', b'Cookie')]
+        # same answer flask-cors gives the wsgi views
+        if any(name == b'origin' for name, _ in scope['headers']):
+            headers.append((b'access-control-allow-origin', b'*'))
+        await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+        await send({'type': 'http.response.body', 'body': body})
+
+
+class Application:
+
+    def __init__(self, flask_app):
+        self.flask_app = flask_app
+        self.wsgi = WsgiBridge(flask_app, flask_app.config['ASGI_THREADS'])
+        self.check_session = CheckSessionEndpoint(flask_app, sessionCache) if flask_app.config.get('ASYNC_CHECK_SESSION') else None
+        self._started = False
+        self._lock = asyncio.Lock()
+
+    async def startup(self):
+        async with self._lock:
+            if self._started:
+                return
+            self._started = True
+            if self.check_session is None:
+                return
+            # reads follow use_replica, so they go to the replica when there is one
+            url = (self.flask_app.config.get('ASYNC_DATABASE_URL')
+                   or async_url(self.flask_app.config.get('SQLALCHEMY_BINDS', {}).get('replica', {}).get('url')
+                                or self.flask_app.config['SQLALCHEMY_DATABASE_URI']))
+            try:
+                if url is None:
+                    raise ImportError('no async driver for this database')
+                self.check_session.start(url)
+            except ImportError as e:
+                self.flask_app.logger.warning('async /check_session disabled, serving it from flask: %s', e)
+                self.check_session = None
+
+    async def shutdown(self):
+        if self.check_session is not None:
+            await self.check_session.stop()
+        # lets requests already on the pool finish first
+        await asyncio.to_thread(self.wsgi.close)
+        await asyncio.to_thread(shutdown)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self._lifespan(receive, send)
+        if not self._started:
+            await self.startup()
+        if (self.check_session is not None and scope['type'] == 'http'
+                and scope['path'] == '/check_session' and scope['method'] == 'GET'):
+            return await self.check_session(scope, receive, send)
+        await self.wsgi(scope, receive, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await self.startup()
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self.shutdown()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+
+application = Application(app)
@@ -0,0 +1,192 @@
+import atexit
+import json
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+try:
+    import fcntl
+except ImportError:
+    # no flock on Windows, where there's also no multi-process server to share the file with
+    fcntl = None
+
+import click
+
+from config import db
+from models import LoginAttempts, utcnow
+
+
+# background writer for the LoginAttempts audit log
+# login requests only put a row on a bounded queue. a single thread drains it and
+# inserts in batches, whenever batch_size rows are waiting or flush_interval has passed.
+# rows that can't be written (queue full, database down) are appended to a local
+# NDJSON spill file and replayed on the next successful flush. the spill file is shared
+# by every worker process, so it's read, truncated and appended under an flock.
+# lines that can't be read back (a worker killed mid-write) are moved to <spill>.bad
+# rather than blocking the rows behind them.
+
+
+class AuditWriter:
+
+    def __init__(self, app, batch_size=200, flush_interval=1.0, max_queue=10000, spill_path='login_attempts.spill'):
+        self.app = app
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.spill_path = spill_path
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._spill_lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='login-audit-writer', daemon=True)
+            self._thread.start()
+            atexit.register(self.close)
+        return self
+
+    def record(self, ip_address, success):
+        row = {'ip_address': ip_address, 'success': success, 'attempted_at': utcnow()}
+        if self._thread is None:
+            self._write([row])
+            return
+        try:
+            self._queue.put_nowait(row)
+        except queue.Full:
+            self._spill([row])
+
+    def _run(self):
+        while not self._stopping.is_set():
+            batch = self._drain(timeout=self.flush_interval)
+            if batch:
+                try:
+                    self._write(batch)
+                except Exception:
+                    # the thread has to outlive a bad batch, or every later row is lost
+                    self.app.logger.exception('login audit writer dropped %d rows', len(batch))
+
+    def _drain(self, timeout):
+        batch = []
+        deadline = time.monotonic() + timeout
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, rows):
+        try:
+            rows = self._take_spill() + rows
+            with self.app.app_context():
+                with db.engine.begin() as conn:
+                    conn.execute(LoginAttempts.__table__.insert(), rows)
+        except Exception as e:
+            self.app.logger.warning('login audit write failed, spilling %d rows: %s', len(rows), e)
+            self._spill(rows)
+
+    @contextmanager
+    def _locked_spill(self, mode):
+        # the thread lock covers this process, the flock the other workers (released on close)
+        with self._spill_lock:
+            with open(self.spill_path, mode) as f:
+                if fcntl is not None:
+                    fcntl.flock(f, fcntl.LOCK_EX)
+                yield f
+
+    def _spill(self, rows):
+        os.makedirs(os.path.dirname(os.path.abspath(self.spill_path)), exist_ok=True)
+        with self._locked_spill('ab+') as f:
+            # finish a line left partial by a crash, so it doesn't swallow the first new row
+            end = f.seek(0, os.SEEK_END)
+            if end:
+                f.seek(end - 1)
+                if f.read(1) != b'\n':
+                    f.write(b'\n')
+            f.write(b''.join(json.dumps({**row, 'attempted_at': row['attempted_at'].isoformat()}).encode() + b'\n'
+                             for row in rows))
+
+    def _take_spill(self):
+        # truncated rather than removed, a worker waiting to append may already have it open
+        try:
+            with self._locked_spill('rb+') as f:
+                lines = f.readlines()
+                f.seek(0)
+                f.truncate()
+        except FileNotFoundError:
+            return []
+        rows, bad = [], []
+        for line in lines:
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+                rows.append({'ip_address': row['ip_address'], 'success': row['success'],
+                             'attempted_at': datetime.fromisoformat(row['attempted_at'])})
+            except (ValueError, TypeError, KeyError):
+                bad.append(line if line.endswith(b'\n') else line + b'\n')
+        if bad:
+            self.app.logger.warning('login audit spill had %d unreadable lines, moving them to %s.bad',
+                                    len(bad), self.spill_path)
+            try:
+                with open(self.spill_path + '.bad', 'ab') as f:
+                    f.write(b''.join(bad))
+            except OSError as e:
+                self.app.logger.warning('could not keep unreadable spill lines: %s', e)
+        return rows
+
+    def _has_spill(self):
+        try:
+            return os.path.getsize(self.spill_path) > 0
+        except OSError:
+            return False
+
+    def flush(self):
+        rows = []
+        while True:
+            try:
+                rows.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        if rows or self._has_spill():
+            self._write(rows)
+
+    def close(self):
+        # stop the thread, then write whatever it didn't get to
+        if self._thread is not None:
+            self._stopping.set()
+            self._thread.join(timeout=self.flush_interval + 5)
+            self._thread = None
+        self.flush()
+
+
+def prune_login_attempts(retention_days):
+    cutoff = utcnow() - timedelta(days=retention_days)
+    deleted = LoginAttempts.query.filter(LoginAttempts.attempted_at < cutoff).delete(synchronize_session=False)
+    db.session.commit()
+    return deleted
+
+
+def create_audit_writer(app):
+    writer = AuditWriter(app,
+                         batch_size=app.config.get('AUDIT_BATCH_SIZE', 200),
+                         flush_interval=app.config.get('AUDIT_FLUSH_INTERVAL', 1.0),
+                         max_queue=app.config.get('AUDIT_MAX_QUEUE', 10000),
+                         spill_path=app.config.get('AUDIT_SPILL_PATH', 'login_attempts.spill'))
+    if app.config.get('AUDIT_ASYNC', True):
+        writer.start()
+
+    @app.cli.command('prune-login-attempts')
+    @click.option('--days', type=int, default=None, help='keep this many days (default AUDIT_RETENTION_DAYS)')
+    def prune_command(days):
+        """Delete login attempts older than the retention period."""
+        days = app.config.get('AUDIT_RETENTION_DAYS', 90) if days is None else days
+        click.echo(f'deleted {prune_login_attempts(days)} login attempts older than {days} days')
+
+    return writer
@@ -0,0 +1,207 @@
+# end-to-end API benchmark against a seeded temp database
+#
+#   cd server && python benchmarks/api_suite.py [--households 50] [--requests 200] [--threads 8] [--output results.json]
+#
+# every endpoint is measured twice: sequentially through the Flask test client (with
+# the SQL statements each request sends counted), and through a threaded HTTP load
+# generator against a real server socket. results are written as JSON, tagged with
+# the current git commit, so runs from different commits can be diffed.
+
+import argparse
+import http.client
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from itertools import count
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+tmp = tempfile.mkdtemp()
+os.environ.setdefault('DATABASE_URL', f'sqlite:///{os.path.join(tmp, "bench.db")}')
+os.environ.setdefault('BCRYPT_LOG_ROUNDS', '4')
+os.environ.setdefault('PASSWORD_HASH_WORKERS', '0')
+os.environ.setdefault('LOGIN_MAX_ATTEMPTS', '1000000000')
+os.environ.setdefault('TOTP_REPLAY_BACKEND', 'none')
+os.environ.setdefault('TOTP_VALID_WINDOW', '1')
+os.environ.setdefault('AUDIT_SPILL_PATH', os.path.join(tmp, 'login_attempts.spill'))
+
+import pyotp
+from werkzeug.serving import WSGIRequestHandler, make_server
+
+from app import app
+from config import db
+from query_counter import count_queries
+import seed
+
+
+class QuietHandler(WSGIRequestHandler):
+
+    def log_request(self, *args, **kwargs):
+        pass
+
+
+def summarize(samples, elapsed=None):
+    samples = sorted(samples)
+    result = {'requests': len(samples),
+              'p50_ms': samples[len(samples) // 2] * 1000,
+              'p95_ms': samples[int(len(samples) * 0.95)] * 1000,
+              'p99_ms': samples[int(len(samples) * 0.99)] * 1000,
+              'mean_ms': statistics.fmean(samples) * 1000}
+    if elapsed:
+        result['throughput_rps'] = len(samples) / elapsed
+    return result
+
+
+class Endpoints:
+    # builds the (method, path, json body) for the nth request to each endpoint
+
+    def __init__(self, credentials, household):
+        self.credentials = list(credentials.items())
+        self.household = household
+        self.counter = count()
+
+    def login(self, n):
+        user_name, key = self.credentials[n % len(self.credentials)]
+        return 'POST', '/login', {'user_name': user_name, 'password': seed.FAKE_PASSWORD,
+                                  'otpCode': pyotp.TOTP(key).now()}
+
+    def check_session(self, n):
+        return 'GET', '/check_session', None
+
+    def _new_user(self):
+        i = next(self.counter)
+        return {'user_name': f'bench-{os.getpid()}-{i}', 'password_hash': 'benchpassword',
+                'first_name': 'Bench', 'last_name': 'User', 'email': f'bench{i}@example.com',
+                'date_of_birth': '1/1/1990'}
+
+    def create_user(self, n):
+        return 'POST', '/create_user', {**self._new_user(), 'household_name': self.household[0],
+                                        'key': self.household[1]}
+
+    def create_super_user(self, n):
+        return 'POST', '/create_super_user', {**self._new_user(), 'household_name': f'bench household {n}',
+                                              'key': 'benchkey'}
+
+
+ENDPOINTS = ['login', 'check_session', 'create_user', 'create_super_user']
+
+
+def run_test_client(endpoints, name, requests):
+    client = app.test_client()
+    # check_session needs a logged-in session
+    method, path, body = endpoints.login(0)
+    client.post(path, json=body)
+    samples = []
+    statements = []
+    for n in range(requests):
+        method, path, body = getattr(endpoints, name)(n)
+        with count_queries(db.engine) as queries:
+            start = time.perf_counter()
+            response = client.open(path, method=method, json=body)
+            samples.append(time.perf_counter() - start)
+        if response.status_code >= 400:
+            raise RuntimeError(f'{name} returned {response.status_code}: {response.get_data(as_text=True)}')
+        statements.append(len(queries))
+    result = summarize(samples)
+    result['sql_statements_mean'] = statistics.fmean(statements)
+    result['sql_statements_max'] = max(statements)
+    return result
+
+
+def run_http(endpoints, name, requests, threads, port):
+    samples = []
+    errors = [0]
+    lock = threading.Lock()
+    jobs = iter(range(requests))
+
+    def worker():
+        conn = http.client.HTTPConnection('127.0.0.1', port)
+        method, path, body = endpoints.login(0)
+        conn.request(method, path, json.dumps(body), {'Content-Type': 'application/json'})
+        response = conn.getresponse()
+        response.read()
+        cookie = response.getheader('Set-Cookie', '').split(';')[0]
+        while True:
+            with lock:
+                n = next(jobs, None)
+            if n is None:
+                break
+            method, path, body = getattr(endpoints, name)(n)
+            headers = {'Content-Type': 'application/json', 'Cookie': cookie}
+            start = time.perf_counter()
+            conn.request(method, path, json.dumps(body) if body is not None else None, headers)
+            response = conn.getresponse()
+            response.read()
+            elapsed = time.perf_counter() - start
+            with lock:
+                samples.append(elapsed)
+                if response.status >= 400:
+                    errors[0] += 1
+        conn.close()
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    start = time.perf_counter()
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    result = summarize(samples, time.perf_counter() - start)
+    result['errors'] = errors[0]
+    result['threads'] = threads
+    return result
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--households', type=int, default=50)
+    parser.add_argument('--users-per-household', type=int, default=3)
+    parser.add_argument('--transactions-per-bank', type=int, default=200)
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--output', default='bench_results.json')
+    args = parser.parse_args()
+
+    with app.app_context():
+        db.create_all()
+        credentials = seed.seed_fake(args.households, args.users_per_household,
+                                     transactions_per_bank=args.transactions_per_bank)
+        from models import Household
+        first = db.session.get(Household, 1)
+        endpoints = Endpoints(credentials, (first.name, seed.FAKE_HOUSEHOLD_KEY))
+
+        results = {'commit': git_commit(),
+                   'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                   'config': vars(args),
+                   'test_client': {},
+                   'http': {}}
+        for name in ENDPOINTS:
+            results['test_client'][name] = run_test_client(endpoints, name, args.requests)
+
+    server = make_server('127.0.0.1', 0, app, threaded=True, request_handler=QuietHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    for name in ENDPOINTS:
+        results['http'][name] = run_http(endpoints, name, args.requests, args.threads, server.server_port)
+    server.shutdown()
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    for mode in ('test_client', 'http'):
+        for name, r in results[mode].items():
+            extra = (f'{r["sql_statements_mean"]:.1f} sql/req' if mode == 'test_client'
+                     else f'{r["throughput_rps"]:.0f} req/s, {r["errors"]} errors')
+            print(f'{mode:>11} {name:<18} p50 {r["p50_ms"]:6.2f}ms  p95 {r["p95_ms"]:6.2f}ms  '
+                  f'p99 {r["p99_ms"]:6.2f}ms  {extra}')
+    print(f'results written to {args.output}')
@@ -0,0 +1,92 @@
+# startup budget check, meant to run in CI
+#
+#   cd server && python benchmarks/import_budget.py [--module app] [--budget-ms 150] [--total-budget-ms N] [--runs 7]
+#
+# imports the module in fresh interpreters under `python -X importtime`, with the
+# framework stack (flask, sqlalchemy, flask_sqlalchemy, flask_restful, flask_cors)
+# imported first, so the budget covers what this repo adds on top of it. the
+# framework floor swings with the machine (430-780ms on one shared CPU for the same
+# tree) while our own share stays around 75-125ms, so only ours is budgeted by
+# default; --total-budget-ms also caps framework + module for a known CI machine.
+# fails (exit status 1) when the median goes over budget, or when a dependency that
+# is supposed to load on first use shows up at startup. prints the slowest imports
+# either way, so a regression points at its cause.
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# what any app on this stack pays before a line of ours runs
+FRAMEWORK = ('flask', 'sqlalchemy.orm', 'flask_sqlalchemy', 'flask_restful', 'flask_cors')
+
+# only loaded by the code paths that need them
+DEFERRED = ('alembic', 'flask_migrate', 'numpy', 'faker', 'qrcode', 'PIL', 'pyarrow', 'pyotp',
+            'sqlalchemy.dialects.postgresql', 'concurrent.futures.process')
+
+
+def import_times(module):
+    # ({module and everything it imported: (self_us, cumulative_us)}, framework_us) for one cold import
+    env = dict(os.environ)
+    env.setdefault('DATABASE_URL', f'sqlite:///{os.path.join(tempfile.gettempdir(), "import_budget.db")}')
+    env.pop('FLASK_RUN_FROM_CLI', None)
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {", ".join(FRAMEWORK)}; import {module}'],
+                            cwd=SERVER_DIR, env=env, capture_output=True, text=True)
+    if result.returncode != 0:
+        sys.exit(f'importing {module} failed:\n{result.stderr}')
+    times = {}
+    framework = 0
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        own, cumulative, name = line[len('import time:'):].split('|')
+        times[name.strip()] = (int(own), int(cumulative))
+        if name.strip() == module:
+            break
+        # a top level line (one space after the bar) closes a framework import and everything under it
+        if not name[1:].startswith(' '):
+            framework += int(cumulative)
+            times = {}
+    return times, framework
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--module', default='app')
+    parser.add_argument('--budget-ms', type=float, default=150, help='for the module, on top of the framework')
+    parser.add_argument('--total-budget-ms', type=float, default=None, help='for framework + module, off by default')
+    parser.add_argument('--runs', type=int, default=7)
+    parser.add_argument('--top', type=int, default=15)
+    args = parser.parse_args()
+
+    runs = [import_times(args.module) for _ in range(args.runs)]
+    own = [times[args.module][1] / 1000 for times, _ in runs]
+    total = [(times[args.module][1] + framework) / 1000 for times, framework in runs]
+    median = statistics.median(own)
+    median_total = statistics.median(total)
+    last = runs[-1][0]
+
+    print(f'import {args.module}: median {median:.0f}ms on top of the framework over {args.runs} runs '
+          f'(min {min(own):.0f}ms, max {max(own):.0f}ms), budget {args.budget_ms:.0f}ms')
+    print(f'with the framework: median {median_total:.0f}ms (min {min(total):.0f}ms, max {max(total):.0f}ms)'
+          + (f', budget {args.total_budget_ms:.0f}ms' if args.total_budget_ms else ', not budgeted'))
+    print(f'slowest imports (cumulative, last run):')
+    for name, (self_us, cumulative) in sorted(last.items(), key=lambda item: -item[1][1])[1:args.top + 1]:
+        print(f'  {cumulative / 1000:8.1f}ms  {self_us / 1000:7.1f}ms self  {name}')
+
+    failures = []
+    if median > args.budget_ms:
+        failures.append(f'median import time {median:.0f}ms is over the {args.budget_ms:.0f}ms budget')
+    if args.total_budget_ms and median_total > args.total_budget_ms:
+        failures.append(f'median import time with the framework {median_total:.0f}ms '
+                        f'is over the {args.total_budget_ms:.0f}ms budget')
+    eager = sorted(name for name in last if name in DEFERRED)
+    if eager:
+        failures.append(f'imported at startup but should load on first use: {", ".join(eager)}')
+    for failure in failures:
+        print(f'FAIL: {failure}')
+    sys.exit(1 if failures else 0)
@@ -0,0 +1,92 @@
+# login throughput against a file-backed database at 1/4/16 concurrent workers
+#
+#   cd server && python benchmarks/login_throughput.py [--seconds 5] [--workers 1 4 16]
+#
+# every worker is a thread with its own test client, so the numbers show how the
+# database (pool, WAL, busy_timeout) holds up under concurrent login writes.
+
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+tmp = tempfile.mkdtemp()
+os.environ.setdefault('DATABASE_URL', f'sqlite:///{os.path.join(tmp, "bench.db")}')
+os.environ.setdefault('BCRYPT_LOG_ROUNDS', '4')
+os.environ.setdefault('PASSWORD_HASH_WORKERS', '0')
+os.environ.setdefault('LOGIN_MAX_ATTEMPTS', '1000000000')
+# every worker reuses the current code, so replay protection has to be off
+os.environ.setdefault('TOTP_REPLAY_BACKEND', 'none')
+os.environ.setdefault('TOTP_VALID_WINDOW', '1')
+
+import pyotp
+
+from app import app
+from config import db
+from models import Household, User
+
+
+def seed(users):
+    db.create_all()
+    household = Household(name='bench', key='bench')
+    db.session.add(household)
+    db.session.flush()
+    keys = {}
+    for i in range(users):
+        key = pyotp.random_base32()
+        user = User(user_name=f'bench{i}', admin=False, first_name='Bench', last_name='User',
+                    email=f'bench{i}@example.com', date_of_birth='1/1/1990', OTPkey=key,
+                    household_id=household.id)
+        user.password_hash = 'benchpassword'
+        db.session.add(user)
+        keys[user.user_name] = key
+    db.session.commit()
+    return keys
+
+
+def run(workers, seconds, keys):
+    names = list(keys)
+    counts = [0] * workers
+    errors = [0] * workers
+    stop = time.perf_counter() + seconds
+
+    def worker(n):
+        client = app.test_client()
+        i = n
+        while time.perf_counter() < stop:
+            name = names[i % len(names)]
+            response = client.post('/login', json={'user_name': name, 'password': 'benchpassword',
+                                                   'otpCode': pyotp.TOTP(keys[name]).now()})
+            if response.status_code == 200:
+                counts[n] += 1
+            else:
+                errors[n] += 1
+            i += workers
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(workers)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    return sum(counts) / elapsed, sum(errors)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 4, 16])
+    args = parser.parse_args()
+
+    with app.app_context():
+        keys = seed(args.users)
+        print(f'database: {db.engine.url}')
+    for workers in args.workers:
+        rate, errors = run(workers, args.seconds, keys)
+        print(f'{workers:>3} workers: {rate:8.1f} logins/s ({errors} errors)')
@@ -0,0 +1,109 @@
+# signup and login cost as the number of households grows
+#
+#   cd server && python benchmarks/lookup_scaling.py [--sizes 10000 100000 1000000] [--requests 300]
+#
+# grows one file-backed database to each size (a household with one member per row,
+# written with multi-row Core inserts), then times /create_user into random existing
+# households and /login as random existing users, with the lookup cache cleared (every
+# lookup goes to the index) and warm. with the join code and user_name indexed the
+# per-request numbers should stay flat from the smallest size to the largest.
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+tmp = tempfile.mkdtemp()
+os.environ.setdefault('DATABASE_URL', f'sqlite:///{os.path.join(tmp, "lookup.db")}')
+os.environ.setdefault('BCRYPT_LOG_ROUNDS', '4')
+os.environ.setdefault('PASSWORD_HASH_WORKERS', '0')
+os.environ.setdefault('LOGIN_MAX_ATTEMPTS', '1000000000')
+os.environ.setdefault('TOTP_REPLAY_BACKEND', 'none')
+os.environ.setdefault('TOTP_VALID_WINDOW', '1')
+os.environ.setdefault('AUDIT_ASYNC', '1')
+
+import pyotp
+from sqlalchemy import insert
+
+from app import app, lookupCache
+from config import db, hasher
+from models import Household, User, join_code
+
+PASSWORD = 'benchpassword'
+OTP_KEY = pyotp.random_base32()
+
+
+def grow(start, stop, password_hash, chunk=20000):
+    for low in range(start, stop, chunk):
+        high = min(low + chunk, stop)
+        db.session.execute(insert(Household), [
+            {'id': i + 1, 'name': f'household{i}', 'join_code_hash': join_code(f'household{i}', f'key{i}')}
+            for i in range(low, high)])
+        db.session.execute(insert(User), [
+            {'user_name': f'member{i}', '_password_hash': password_hash, 'admin': True,
+             'first_name': 'Bench', 'last_name': 'User', 'email': f'member{i}@example.com',
+             'date_of_birth': '1/1/1990', 'OTPkey': OTP_KEY, 'household_id': i + 1}
+            for i in range(low, high)])
+        db.session.commit()
+
+
+def timed(requests, send):
+    start = time.perf_counter()
+    errors = sum(send(n) != 200 for n in range(requests))
+    return (time.perf_counter() - start) * 1000 / requests, errors
+
+
+def measure(client, size, requests, rng, signups):
+    households = [rng.randrange(size) for _ in range(requests)]
+    users = [rng.randrange(size) for _ in range(requests)]
+
+    def signup(n):
+        signups[0] += 1
+        i = households[n]
+        return client.post('/create_user', json={
+            'household_name': f'household{i}', 'key': f'key{i}', 'user_name': f'signup{signups[0]}',
+            'password_hash': PASSWORD, 'first_name': 'New', 'last_name': 'Member',
+            'email': 'new@example.com', 'date_of_birth': '1/1/1990'}).status_code
+
+    def login(n):
+        return client.post('/login', json={'user_name': f'member{users[n]}', 'password': PASSWORD,
+                                           'otpCode': pyotp.TOTP(OTP_KEY).now()}).status_code
+
+    lookupCache.clear()
+    signup_ms, signup_errors = timed(requests, signup)
+    lookupCache.clear()
+    cold_ms, cold_errors = timed(requests, login)
+    warm_ms, warm_errors = timed(requests, login)
+    return {'signup_ms': signup_ms, 'login_cold_ms': cold_ms, 'login_warm_ms': warm_ms,
+            'errors': signup_errors + cold_errors + warm_errors}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000])
+    parser.add_argument('--requests', type=int, default=300)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    client = app.test_client()
+    signups = [0]
+    with app.app_context():
+        db.create_all()
+        password_hash = hasher.hash(PASSWORD)
+        print(f'database: {db.engine.url}')
+    size = 0
+    print(f'{"households":>11} {"load s":>7} {"signup ms":>10} {"login ms (cold)":>16} {"login ms (warm)":>16}')
+    for target in sorted(args.sizes):
+        start = time.perf_counter()
+        with app.app_context():
+            grow(size, target, password_hash)
+        load = time.perf_counter() - start
+        size = target
+        r = measure(client, size, args.requests, rng, signups)
+        print(f'{size:>11} {load:>7.1f} {r["signup_ms"]:>10.2f} {r["login_cold_ms"]:>16.2f} '
+              f'{r["login_warm_ms"]:>16.2f}' + (f'  ({r["errors"]} errors)' if r['errors'] else ''))
@@ -0,0 +1,108 @@
+# throughput of the development server against the production serving modes
+#
+#   cd server && python benchmarks/serving.py [--modes dev,gunicorn,uvicorn] [--requests 2000] [--threads 32]
+#
+# seeds a temp database, then starts each server as a subprocess on a free port and
+# drives /check_session and /login through it with the threaded load generator from
+# api_suite. every server is stopped with SIGTERM, so the graceful shutdown path runs too.
+
+import argparse
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SERVER_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+tmp = tempfile.mkdtemp()
+os.environ.setdefault('DATABASE_URL', f'sqlite:///{os.path.join(tmp, "serving.db")}')
+# every worker has to sign and read the same session cookies
+os.environ.setdefault('SECRET_KEY', 'benchmark-secret')
+os.environ.setdefault('PASSWORD_HASH_WORKERS', '2')
+
+from api_suite import Endpoints, run_http, git_commit
+from app import app
+from config import db
+import seed
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def commands(port, workers, threads):
+    return {
+        'dev': [sys.executable, '-c',
+                f'from app import app; app.run(host="127.0.0.1", port={port}, threaded=True)'],
+        'gunicorn': [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', '--bind', f'127.0.0.1:{port}',
+                     '--workers', str(workers), '--threads', str(threads), 'wsgi:app'],
+        'uvicorn': [sys.executable, '-m', 'uvicorn', 'asgi:application', '--host', '127.0.0.1',
+                    '--port', str(port), '--workers', str(workers), '--log-level', 'warning', '--no-access-log'],
+    }
+
+
+def wait_for(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=1):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f'server on port {port} did not start')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--modes', default='dev,gunicorn,uvicorn')
+    parser.add_argument('--households', type=int, default=20)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--login-requests', type=int, default=200)
+    parser.add_argument('--threads', type=int, default=32, help='load generator threads')
+    parser.add_argument('--workers', type=int, default=2, help='server worker processes')
+    parser.add_argument('--server-threads', type=int, default=8, help='threads per gunicorn worker')
+    parser.add_argument('--output', default='serving_results.json')
+    args = parser.parse_args()
+
+    with app.app_context():
+        db.create_all()
+        credentials = seed.seed_fake(args.households, 3, transactions_per_bank=50)
+        from models import Household
+        first = db.session.get(Household, 1)
+        endpoints = Endpoints(credentials, (first.name, seed.FAKE_HOUSEHOLD_KEY))
+
+    results = {'commit': git_commit(), 'config': vars(args), 'modes': {}}
+    for mode in args.modes.split(','):
+        port = free_port()
+        server = subprocess.Popen(commands(port, args.workers, args.server_threads)[mode], cwd=SERVER_DIR,
+                                  stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            wait_for(port)
+            results['modes'][mode] = {
+                'check_session': run_http(endpoints, 'check_session', args.requests, args.threads, port),
+                'login': run_http(endpoints, 'login', args.login_requests, args.threads, port),
+            }
+        finally:
+            server.send_signal(signal.SIGTERM)
+            try:
+                results['modes'].setdefault(mode, {})['shutdown_exit_code'] = server.wait(timeout=60)
+            except subprocess.TimeoutExpired:
+                server.kill()
+                results['modes'][mode]['shutdown_exit_code'] = 'killed'
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    for mode, endpoints_results in results['modes'].items():
+        for name, r in endpoints_results.items():
+            if isinstance(r, dict):
+                print(f'{mode:>9} {name:<14} {r["throughput_rps"]:7.0f} req/s  p50 {r["p50_ms"]:7.2f}ms  '
+                      f'p99 {r["p99_ms"]:7.2f}ms  {r["errors"]} errors')
+    print(f'results written to {args.output}')
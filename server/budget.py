@@ -0,0 +1,117 @@
+from datetime import date
+
+from sqlalchemy import func
+
+from config import db
+from models import User, Bank, Transactions, Categories, Goals, MonthlyExpenses, ExpenseItem
+
+
+# household budget rollups, every total is computed in SQL with GROUP BY
+# amounts are integer cents
+
+
+def parse_month(value):
+    # 'YYYY-MM' -> first day of that month
+    if not value:
+        return None
+    year, month = value.split('-')[:2]
+    return date(int(year), int(month), 1)
+
+
+def _month_filter(query, start, end):
+    if start:
+        query = query.filter(MonthlyExpenses.month >= start)
+    if end:
+        query = query.filter(MonthlyExpenses.month <= end)
+    return query
+
+
+def category_totals(household_id, start=None, end=None):
+    query = db.session.query(
+        ExpenseItem.categories_id,
+        Categories.categories_name,
+        func.count(ExpenseItem.id),
+        func.coalesce(func.sum(ExpenseItem.planned_amount_cents), 0),
+    ).join(MonthlyExpenses, ExpenseItem.monthly_expenses_id == MonthlyExpenses.id
+    ).outerjoin(Categories, ExpenseItem.categories_id == Categories.id
+    ).filter(MonthlyExpenses.household_id == household_id)
+    query = _month_filter(query, start, end).group_by(ExpenseItem.categories_id, Categories.categories_name)
+    return [{'categories_id': categories_id,
+             'categories_name': name,
+             'items': items,
+             'planned_cents': planned}
+            for categories_id, name, items, planned in query]
+
+
+def _month_end(month):
+    # first day of the month after
+    return date(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+
+def category_spending(household_id, start=None, end=None):
+    query = db.session.query(
+        Transactions.categories_id,
+        Categories.categories_name,
+        func.count(Transactions.id),
+        func.coalesce(func.sum(Transactions.amount_cents), 0),
+    ).join(Bank, Transactions.bank_id == Bank.id
+    ).join(User, Bank.user_id == User.id
+    ).outerjoin(Categories, Transactions.categories_id == Categories.id
+    ).filter(User.household_id == household_id)
+    if start:
+        query = query.filter(Transactions.date >= start)
+    if end:
+        query = query.filter(Transactions.date < _month_end(end))
+    query = query.group_by(Transactions.categories_id, Categories.categories_name)
+    return {categories_id: (name, count, spent) for categories_id, name, count, spent in query}
+
+
+def income_by_month(household_id, start=None, end=None):
+    query = db.session.query(
+        MonthlyExpenses.month,
+        func.sum(MonthlyExpenses.user_expected_income_cents),
+        func.sum(MonthlyExpenses.actual_income_cents),
+        func.sum(MonthlyExpenses.user_expected_monthly_expenses_total_cents),
+    ).filter(MonthlyExpenses.household_id == household_id)
+    query = _month_filter(query, start, end).group_by(MonthlyExpenses.month).order_by(MonthlyExpenses.month)
+    return [{'month': month.isoformat() if month else None,
+             'expected_income_cents': expected,
+             'actual_income_cents': actual,
+             'income_variance_cents': actual - expected,
+             'expected_expenses_cents': expenses}
+            for month, expected, actual, expenses in query]
+
+
+def goal_progress(household_id):
+    count, target, current = db.session.query(
+        func.count(Goals.id),
+        func.coalesce(func.sum(Goals.target_amount_cents), 0),
+        func.coalesce(func.sum(Goals.current_amount_cents), 0),
+    ).filter(Goals.household_id == household_id).one()
+    return {'goals': count,
+            'target_cents': target,
+            'current_cents': current,
+            'percent_complete': round(current * 100 / target, 2) if target else None}
+
+
+def budget_summary(household_id, start=None, end=None):
+    months = income_by_month(household_id, start, end)
+    categories = category_totals(household_id, start, end)
+    spending = category_spending(household_id, start, end)
+    for category in categories:
+        _, count, spent = spending.pop(category['categories_id'], (None, 0, 0))
+        category['transactions'] = count
+        category['actual_cents'] = spent
+        category['remaining_cents'] = category['planned_cents'] - spent
+    # spending in categories with nothing planned
+    for categories_id, (name, count, spent) in spending.items():
+        categories.append({'categories_id': categories_id, 'categories_name': name, 'items': 0,
+                           'planned_cents': 0, 'transactions': count, 'actual_cents': spent,
+                           'remaining_cents': -spent})
+    return {'household_id': household_id,
+            'start': start.isoformat() if start else None,
+            'end': end.isoformat() if end else None,
+            'categories': categories,
+            'months': months,
+            'income_variance_cents': sum(m['income_variance_cents'] for m in months),
+            'goals': goal_progress(household_id)}
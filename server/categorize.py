@@ -0,0 +1,230 @@
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+
+from sqlalchemy import bindparam, or_, update
+
+import dashboard
+import spending
+from config import db
+from models import User, Bank, Transactions, CategoryRule
+
+
+# rule-based transaction categorization
+# all of a user's rules (their own plus their household's) are compiled into one
+# regex made of optional lookaheads, one per rule, so a single match call tells us
+# every rule whose text matches. the first of those (by priority) whose amount
+# range also fits decides the category. text matches are cached per normalized
+# description, since feeds repeat the same merchants constantly.
+# a regex rule has to mean the same once it's pasted next to the others, so patterns
+# with backreferences, named groups or global inline flags are refused when the rule
+# is created. if the combined regex still doesn't compile (rules stored before that
+# check), every rule is matched on its own instead.
+
+CACHE_SIZE = 10000
+MATCHER_CACHE_SIZE = 1024
+
+
+def _lookahead(i, pattern):
+    return f'(?=(?:.*?(?P<r{i}>{pattern}))?)'
+
+
+def _scan(pattern):
+    # yields (escaped, rest) at every character outside character classes, rest is
+    # the pattern from there on (for an escape, from the escaped character)
+    i = 0
+    in_class = False
+    while i < len(pattern):
+        char = pattern[i]
+        if char == '\\':
+            if not in_class:
+                yield True, pattern[i + 1:]
+            i += 2
+            continue
+        if char == '[' and not in_class:
+            in_class = True
+            i += 1
+            # a ] right after [ or [^ is a literal
+            if pattern[i:i + 1] == '^':
+                i += 1
+            if pattern[i:i + 1] == ']':
+                i += 1
+            continue
+        if char == ']' and in_class:
+            in_class = False
+        elif not in_class:
+            yield False, pattern[i:]
+        i += 1
+
+
+def validate_regex(pattern):
+    # raises ValueError unless the pattern still means the same once combined with other rules
+    try:
+        re.compile(pattern)
+    except (re.error, TypeError) as e:
+        raise ValueError(f'invalid regex: {e}')
+    for escaped, rest in _scan(pattern):
+        if escaped and rest[:1] in '123456789':
+            raise ValueError('backreferences are not allowed')
+        if not escaped and rest.startswith(('(?P', '(?(')):
+            raise ValueError('named groups and group references are not allowed')
+        if not escaped and re.match(r'\(\?[aiLmsux]+\)', rest):
+            raise ValueError('inline flags must be scoped to a group, e.g. (?i:...)')
+    # the same wrapping the matcher uses, next to another rule
+    try:
+        re.compile(_lookahead(0, 'x') + _lookahead(1, pattern), re.IGNORECASE | re.DOTALL)
+    except re.error as e:
+        raise ValueError(f'invalid regex: {e}')
+
+
+def normalize(description):
+    return ' '.join((description or '').upper().split())
+
+
+def rules_version(rules):
+    return hashlib.sha1(repr(tuple(rules)).encode('utf-8')).hexdigest()[:16]
+
+
+class Matcher:
+
+    def __init__(self, rules):
+        # rules are (id, match_type, pattern, min_cents, max_cents, categories_id), already in priority order
+        self.rules = tuple(rules)
+        self.version = rules_version(self.rules)
+        patterns = [re.escape(normalize(pattern)) if match_type == 'substring' else pattern
+                    for _, match_type, pattern, *_rest in self.rules]
+        self._regex = None
+        self._patterns = None
+        try:
+            if patterns:
+                self._regex = re.compile(''.join(_lookahead(i, p) for i, p in enumerate(patterns)),
+                                         re.IGNORECASE | re.DOTALL)
+        except re.error:
+            # a rule that can't be combined, match each on its own (rules that don't compile never match)
+            self._patterns = [self._compile(p) for p in patterns]
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _compile(pattern):
+        try:
+            return re.compile(pattern, re.IGNORECASE | re.DOTALL)
+        except re.error:
+            return None
+
+    def _text_matches(self, description):
+        key = normalize(description)
+        with self._lock:
+            hit = self._cache.get(key)
+            if hit is not None:
+                self._cache.move_to_end(key)
+                return hit
+        if self._regex is not None:
+            groups = self._regex.match(key).groupdict()
+            hit = tuple(i for i in range(len(self.rules)) if groups[f'r{i}'] is not None)
+        else:
+            hit = tuple(i for i, regex in enumerate(self._patterns) if regex is not None and regex.search(key))
+        with self._lock:
+            self._cache[key] = hit
+            if len(self._cache) > CACHE_SIZE:
+                self._cache.popitem(last=False)
+        return hit
+
+    def categorize(self, description, amount_cents=None):
+        if not self.rules:
+            return None
+        for i in self._text_matches(description):
+            _, _, _, low, high, categories_id = self.rules[i]
+            if low is not None and (amount_cents is None or amount_cents < low):
+                continue
+            if high is not None and (amount_cents is None or amount_cents > high):
+                continue
+            return categories_id
+        return None
+
+
+def load_rules(user_id, household_id):
+    scope = [CategoryRule.user_id == user_id]
+    if household_id is not None:
+        scope.append(CategoryRule.household_id == household_id)
+    query = db.session.query(CategoryRule.id, CategoryRule.match_type, CategoryRule.pattern,
+                             CategoryRule.min_amount_cents, CategoryRule.max_amount_cents,
+                             CategoryRule.categories_id
+                             ).filter(or_(*scope)
+                             # a user's own rules beat household rules at the same priority
+                             ).order_by(CategoryRule.priority, CategoryRule.user_id.is_(None), CategoryRule.id)
+    return [tuple(row) for row in query]
+
+
+# compiled matchers by owner, least recently used dropped first
+_matchers = OrderedDict()
+_matchers_lock = threading.Lock()
+
+
+def matcher_for_bank(bank_id):
+    owner = db.session.query(User.id, User.household_id).join(Bank, Bank.user_id == User.id
+                                                             ).filter(Bank.id == bank_id).first()
+    if owner is None:
+        return Matcher([])
+    owner = tuple(owner)
+    rules = load_rules(*owner)
+    # keep the compiled matcher (and its description cache) while the rules don't change
+    with _matchers_lock:
+        cached = _matchers.get(owner)
+        if cached is not None and cached.version == rules_version(rules):
+            _matchers.move_to_end(owner)
+            return cached
+    matcher = Matcher(rules)
+    with _matchers_lock:
+        _matchers[owner] = matcher
+        _matchers.move_to_end(owner)
+        while len(_matchers) > MATCHER_CACHE_SIZE:
+            _matchers.popitem(last=False)
+    return matcher
+
+
+def recategorize_bank(bank_id, batch_size=1000):
+    # only rows that have never been categorized, or were categorized by an older
+    # version of the rules, are read. rows categorized by hand are left alone.
+    # rows are walked in id order one batch at a time, so memory stays bounded.
+    # every changed row moves its amount between categories in the spending rollup.
+    matcher = matcher_for_bank(bank_id)
+    statement = update(Transactions.__table__).where(Transactions.__table__.c.id == bindparam('row_id')
+                                                     ).values(categories_id=bindparam('new_categories_id'),
+                                                              rules_version=bindparam('new_rules_version'))
+    result = {'rules_version': matcher.version, 'scanned': 0, 'changed': 0}
+    householdId = spending.household_for_bank(db.session.connection(), bank_id)
+    deltas = {}
+    last_id = 0
+    try:
+        while True:
+            rows = db.session.query(Transactions.id, Transactions.transaction_description,
+                                    Transactions.amount_cents, Transactions.categories_id, Transactions.date
+                                    ).filter(Transactions.bank_id == bank_id,
+                                             Transactions.id > last_id,
+                                             or_(Transactions.rules_version.is_(None) & Transactions.categories_id.is_(None),
+                                                 Transactions.rules_version != matcher.version)
+                                    ).order_by(Transactions.id).limit(batch_size).all()
+            if not rows:
+                break
+            updates = []
+            for row_id, description, amount, current, day in rows:
+                new = matcher.categorize(description, amount)
+                if new != current:
+                    result['changed'] += 1
+                    spending.add(deltas, householdId, day, current, -1, -(amount or 0))
+                    spending.add(deltas, householdId, day, new, 1, amount)
+                updates.append({'row_id': row_id, 'new_categories_id': new,
+                                'new_rules_version': matcher.version})
+            db.session.execute(statement, updates)
+            result['scanned'] += len(rows)
+            last_id = rows[-1][0]
+        if result['changed']:
+            spending.apply(db.session.connection(), deltas)
+            dashboard.bump(db.session.connection(), bank_ids=[bank_id])
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return result
@@ -1,19 +1,14 @@
 
 from flask import Flask
 from flask_cors import CORS
-from flask_migrate import Migrate
 from flask_restful import Api
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy import MetaData
-from flask_bcrypt import Bcrypt
 import secrets
+import os
 
-
-app = Flask(__name__)
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///app.db'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-app.json.compact = False
-app.secret_key = secrets.token_hex(16)
+import passwords
+import database
 
 
 # Define metadata, instantiate db
@@ -25,16 +20,98 @@ metadata = MetaData(naming_convention={
     "pk": "pk_%(table_name)s"
 })
 
-db = SQLAlchemy(metadata=metadata)
+db = SQLAlchemy(metadata=metadata, session_options={'class_': database.RoutingSession})
+
+
+def configure(app):
+    database.configure(app)
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.json.compact = False
+    # must be shared by every worker process, or sessions only work on the worker that issued them
+    app.secret_key = os.environ.get('SECRET_KEY') or secrets.token_hex(16)
+
+    # login rate limiting (max attempts per ip / user_name inside the window)
+    app.config['RATE_LIMIT_BACKEND'] = os.environ.get('RATE_LIMIT_BACKEND', 'memory')
+    app.config['LOGIN_MAX_ATTEMPTS'] = int(os.environ.get('LOGIN_MAX_ATTEMPTS', 4))
+    app.config['LOGIN_WINDOW_SECONDS'] = int(os.environ.get('LOGIN_WINDOW_SECONDS', 3 * 60 * 60))
+
+    # password hashing (bcrypt cost factor and the size of the hashing pool)
+    app.config['BCRYPT_LOG_ROUNDS'] = int(os.environ.get('BCRYPT_LOG_ROUNDS', 12))
+    app.config['PASSWORD_HASH_WORKERS'] = int(os.environ['PASSWORD_HASH_WORKERS']) if 'PASSWORD_HASH_WORKERS' in os.environ else None
+    app.config['PASSWORD_HASH_MAX_PENDING'] = int(os.environ.get('PASSWORD_HASH_MAX_PENDING', 32))
+    app.config['PASSWORD_HASH_TIMEOUT'] = float(os.environ.get('PASSWORD_HASH_TIMEOUT', 10))
+
+    # cache for the /check_session payload
+    app.config['SESSION_CACHE_BACKEND'] = os.environ.get('SESSION_CACHE_BACKEND', 'memory')
+    app.config['SESSION_CACHE_SIZE'] = int(os.environ.get('SESSION_CACHE_SIZE', 1024))
+    app.config['SESSION_CACHE_TTL'] = float(os.environ.get('SESSION_CACHE_TTL', 60))
+
+    # user_name -> id and household join code -> id, in front of the signup and login lookups
+    app.config['LOOKUP_CACHE_SIZE'] = int(os.environ.get('LOOKUP_CACHE_SIZE', 4096))
+    app.config['LOOKUP_CACHE_TTL'] = float(os.environ.get('LOOKUP_CACHE_TTL', 300))
+
+    # two factor codes, valid_window is how many 30s steps either side of now are accepted
+    app.config['TOTP_VALID_WINDOW'] = int(os.environ.get('TOTP_VALID_WINDOW', 0))
+    app.config['TOTP_CACHE_SIZE'] = int(os.environ.get('TOTP_CACHE_SIZE', 4096))
+    app.config['TOTP_REPLAY_BACKEND'] = os.environ.get('TOTP_REPLAY_BACKEND', 'memory')
+
+    # login attempt audit log, written in batches by a background thread
+    app.config['AUDIT_ASYNC'] = os.environ.get('AUDIT_ASYNC', '1') == '1'
+    app.config['AUDIT_BATCH_SIZE'] = int(os.environ.get('AUDIT_BATCH_SIZE', 200))
+    app.config['AUDIT_FLUSH_INTERVAL'] = float(os.environ.get('AUDIT_FLUSH_INTERVAL', 1.0))
+    app.config['AUDIT_MAX_QUEUE'] = int(os.environ.get('AUDIT_MAX_QUEUE', 10000))
+    app.config['AUDIT_SPILL_PATH'] = os.environ.get('AUDIT_SPILL_PATH', os.path.join(app.instance_path, 'login_attempts.spill'))
+    app.config['AUDIT_RETENTION_DAYS'] = int(os.environ.get('AUDIT_RETENTION_DAYS', 90))
+
+    # rows per INSERT when importing bank feeds
+    app.config['INGEST_BATCH_SIZE'] = int(os.environ.get('INGEST_BATCH_SIZE', 1000))
 
-migrate = Migrate(app, db)
+    # memoized household forecasts
+    app.config['FORECAST_CACHE_SIZE'] = int(os.environ.get('FORECAST_CACHE_SIZE', 1024))
 
-db.init_app(app)
+    # most members accepted by one /provision request, bigger lists go through `flask provision-members`
+    app.config['PROVISION_MAX_ROWS'] = int(os.environ.get('PROVISION_MAX_ROWS', 1000))
+
+    # rows per batch read (and flushed to the client) by the streaming household export
+    app.config['EXPORT_BATCH_SIZE'] = int(os.environ.get('EXPORT_BATCH_SIZE', 1000))
+
+    # serialized household dashboards, keyed by household version
+    app.config['DASHBOARD_CACHE_SIZE'] = int(os.environ.get('DASHBOARD_CACHE_SIZE', 1024))
+
+    # async read path used by asgi.py for /check_session, derived from DATABASE_URL when unset
+    app.config['ASYNC_DATABASE_URL'] = os.environ.get('ASYNC_DATABASE_URL')
+    app.config['ASYNC_CHECK_SESSION'] = os.environ.get('ASYNC_CHECK_SESSION', '1') == '1'
+    # threads per asgi worker running the flask views
+    app.config['ASGI_THREADS'] = int(os.environ.get('ASGI_THREADS', 8))
+
+    # request instrumentation (Server-Timing, /metrics, N+1 warnings, sampled cProfile of the slowest requests)
+    app.config['INSTRUMENTATION'] = os.environ.get('INSTRUMENTATION', '0') == '1'
+    app.config['N_PLUS_ONE_THRESHOLD'] = int(os.environ.get('N_PLUS_ONE_THRESHOLD', 5))
+    app.config['PROFILE_SLOWEST'] = int(os.environ.get('PROFILE_SLOWEST', 0))
+    app.config['PROFILE_SAMPLE_RATE'] = float(os.environ.get('PROFILE_SAMPLE_RATE', 0.1))
+    app.config['PROFILE_DIR'] = os.environ.get('PROFILE_DIR', os.path.join(app.instance_path, 'profiles'))
+
+
+def create_app():
+    # extensions that cost real startup time are only set up where they're used
+    app = Flask(__name__)
+    configure(app)
+    db.init_app(app)
+    # Flask-Migrate pulls in all of alembic, only `flask db ...` needs it
+    if os.environ.get('FLASK_RUN_FROM_CLI') == 'true':
+        from flask_migrate import Migrate
+        Migrate(app, db)
+    # Instantiate CORS
+    CORS(app)
+    return app
+
+
+# every module shares this one app, built (and its routes added by app.py) on first
+# import of config. create_app() only groups the setup, it isn't a per-test factory
+app = create_app()
 
 # Instantiate REST API
 api = Api(app)
 
-# Instantiate CORS
-CORS(app)
-
-bcrypt = Bcrypt(app)
\ No newline at end of file
+# the hashing pool itself starts on the first hash
+hasher = passwords.create_hasher(app)
@@ -0,0 +1,196 @@
+import threading
+from collections import OrderedDict
+from datetime import date
+
+from sqlalchemy import event, func, inspect, literal, or_, select
+from sqlalchemy.orm import Session
+
+import serializers
+from config import db
+from models import Household, HouseholdGoalSummary, User, Bank, Transactions, Goals, MonthlyExpenses, ExpenseItem, utcnow
+
+
+# household dashboard
+# the whole view is two statements: the household row (with its goal summary) and one
+# CTE query that produces a row per member with their bank, month-to-date spending,
+# goal and latest-budget totals. the serialized payload is cached by
+# (household, version, month) and the ETag carries the same key, so a client with a
+# current copy gets a 304 after a single-row version check.
+#
+# Household.version is bumped once per flush that touches the household or anything
+# hanging off it. Core writes that bypass the session (ingest, recategorize) call
+# bump() themselves.
+
+
+def bump(connection, household_ids=(), user_ids=(), bank_ids=(), monthly_expenses_ids=()):
+    conditions = []
+    household = Household.__table__
+    if household_ids:
+        conditions.append(household.c.id.in_(household_ids))
+    if user_ids:
+        conditions.append(household.c.id.in_(select(User.household_id).where(User.id.in_(user_ids))))
+    if bank_ids:
+        conditions.append(household.c.id.in_(select(User.household_id).join(Bank, Bank.user_id == User.id)
+                                             .where(Bank.id.in_(bank_ids))))
+    if monthly_expenses_ids:
+        conditions.append(household.c.id.in_(select(MonthlyExpenses.household_id)
+                                             .where(MonthlyExpenses.id.in_(monthly_expenses_ids))))
+    if conditions:
+        connection.execute(household.update().where(or_(*conditions)).values(version=household.c.version + 1))
+
+
+def _values(obj, key):
+    # the current value plus the one it replaced, so moves bump both sides
+    history = inspect(obj).attrs[key].history
+    return {getattr(obj, key), *history.deleted}
+
+
+@event.listens_for(Session, 'after_flush')
+def _bump_changed_households(db_session, flush_context):
+    household_ids, user_ids, bank_ids, monthly_expenses_ids = set(), set(), set(), set()
+    for obj in (*db_session.new, *db_session.dirty, *db_session.deleted):
+        if obj in db_session.dirty and not db_session.is_modified(obj):
+            continue
+        if isinstance(obj, Household):
+            if obj not in db_session.new:
+                household_ids.add(obj.id)
+        elif isinstance(obj, (User, Goals, MonthlyExpenses)):
+            household_ids |= _values(obj, 'household_id')
+        elif isinstance(obj, Bank):
+            user_ids |= _values(obj, 'user_id')
+        elif isinstance(obj, Transactions):
+            bank_ids |= _values(obj, 'bank_id')
+        elif isinstance(obj, ExpenseItem):
+            monthly_expenses_ids |= _values(obj, 'monthly_expenses_id')
+    for ids in (household_ids, user_ids, bank_ids, monthly_expenses_ids):
+        ids.discard(None)
+    bump(db_session.connection(), household_ids, user_ids, bank_ids, monthly_expenses_ids)
+
+
+def member_version(household_id, user_id):
+    # the only read on a conditional GET: the household's version, if user_id belongs to it
+    if not user_id:
+        return None
+    return db.session.execute(
+        select(Household.version).join(User, User.household_id == Household.id)
+        .where(Household.id == household_id, User.id == user_id)).scalar()
+
+
+def etag(household_id, version, month):
+    return f'"{household_id}-{version}-{month:%Y%m}"'
+
+
+def build(household_id, month):
+    household = db.session.execute(
+        select(Household.id, Household.name, Household.version,
+               HouseholdGoalSummary.goals, HouseholdGoalSummary.target_amount_cents,
+               HouseholdGoalSummary.current_amount_cents, HouseholdGoalSummary.nearest_deadline)
+        .outerjoin(HouseholdGoalSummary, HouseholdGoalSummary.household_id == Household.id)
+        .where(Household.id == household_id)).one_or_none()
+    if household is None:
+        return None
+
+    members = select(User.id, User.user_name, User.first_name, User.last_name, User.admin
+                     ).where(User.household_id == household_id).cte('members')
+    member_ids = select(members.c.id)
+    # bounded on both sides, imported transactions can be dated in the future
+    next_month = date(month.year + month.month // 12, month.month % 12 + 1, 1)
+    banks = select(Bank.user_id,
+                   func.count(func.distinct(Bank.id)).label('banks'),
+                   func.count(Transactions.id).label('transactions'),
+                   func.coalesce(func.sum(Transactions.amount_cents), 0).label('spent_cents'),
+                   ).outerjoin(Transactions, (Transactions.bank_id == Bank.id) & (Transactions.date >= month)
+                                         & (Transactions.date < next_month)
+                   ).where(Bank.user_id.in_(member_ids)).group_by(Bank.user_id).cte('bank_totals')
+    goals = select(Goals.user_id,
+                   func.count(Goals.id).label('goals'),
+                   func.sum(Goals.target_amount_cents).label('target_cents'),
+                   func.sum(Goals.current_amount_cents).label('current_cents'),
+                   ).where(Goals.user_id.in_(member_ids)).group_by(Goals.user_id).cte('goal_totals')
+    # each member's most recent monthly budget
+    budgets = select(MonthlyExpenses.user_id,
+                     MonthlyExpenses.month,
+                     MonthlyExpenses.user_expected_income_cents,
+                     MonthlyExpenses.actual_income_cents,
+                     MonthlyExpenses.user_expected_monthly_expenses_total_cents,
+                     func.row_number().over(partition_by=MonthlyExpenses.user_id,
+                                            order_by=(MonthlyExpenses.month.desc(), MonthlyExpenses.id.desc()))
+                     .label('recency'),
+                     ).where(MonthlyExpenses.user_id.in_(member_ids)).cte('budgets')
+    rows = db.session.execute(
+        select(members.c.id, members.c.user_name, members.c.first_name, members.c.last_name, members.c.admin,
+               func.coalesce(banks.c.banks, 0), func.coalesce(banks.c.transactions, 0),
+               func.coalesce(banks.c.spent_cents, 0),
+               func.coalesce(goals.c.goals, 0), func.coalesce(goals.c.target_cents, 0),
+               func.coalesce(goals.c.current_cents, 0),
+               budgets.c.month, budgets.c.user_expected_income_cents, budgets.c.actual_income_cents,
+               budgets.c.user_expected_monthly_expenses_total_cents)
+        .outerjoin(banks, banks.c.user_id == members.c.id)
+        .outerjoin(goals, goals.c.user_id == members.c.id)
+        .outerjoin(budgets, (budgets.c.user_id == members.c.id) & (budgets.c.recency == literal(1)))
+        .order_by(members.c.id)).all()
+
+    member_list = [{'id': user_id, 'user_name': user_name, 'first_name': first_name,
+                    'last_name': last_name, 'admin': admin,
+                    'banks': bank_count, 'transactions_this_month': transaction_count,
+                    'spent_this_month_cents': spent,
+                    'goals': {'count': goal_count, 'target_cents': target, 'current_cents': current},
+                    'latest_budget': None if budget_month is None else {
+                        'month': budget_month.isoformat(),
+                        'expected_income_cents': expected, 'actual_income_cents': actual,
+                        'expected_expenses_cents': expenses}}
+                   for (user_id, user_name, first_name, last_name, admin, bank_count, transaction_count, spent,
+                        goal_count, target, current, budget_month, expected, actual, expenses) in rows]
+    _, name, version, goal_count, target, current, deadline = household
+    return {'household_id': household_id,
+            'name': name,
+            'version': version,
+            'month': month.isoformat(),
+            'members': member_list,
+            'spent_this_month_cents': sum(m['spent_this_month_cents'] for m in member_list),
+            'goals': {'count': goal_count or 0,
+                      'target_cents': target or 0,
+                      'current_cents': current or 0,
+                      'percent_complete': round(current * 100 / target, 2) if target else None,
+                      'nearest_deadline': deadline.isoformat() if deadline else None}}
+
+
+class DashboardCache:
+    # serialized dashboards keyed by (household, version, month), a new version is a new
+    # key so nothing needs invalidating, stale versions just age out of the LRU
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            payload = self._entries.get(key)
+            if payload is not None:
+                self._entries.move_to_end(key)
+            return payload
+
+    def set(self, key, payload):
+        with self._lock:
+            self._entries[key] = payload
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+def render(cache, household_id, version, month):
+    key = (household_id, version, month)
+    if (payload := cache.get(key)) is None:
+        payload = serializers.dumps(build(household_id, month))
+        cache.set(key, payload)
+    return payload
+
+
+def current_month():
+    # the UTC month, like every stored timestamp
+    return utcnow().date().replace(day=1)
+
+
+def create_dashboard_cache(app):
+    return DashboardCache(app.config.get('DASHBOARD_CACHE_SIZE', 1024))
@@ -0,0 +1,86 @@
+import os
+import sqlite3
+from functools import wraps
+
+from flask import g, has_app_context
+from flask_sqlalchemy.session import Session as FlaskSession
+from sqlalchemy import event
+from sqlalchemy.engine import Engine, make_url
+
+
+# environment-driven engine configuration
+#   DATABASE_URL             primary database (default sqlite:///app.db)
+#   DATABASE_REPLICA_URL     optional read replica, used by endpoints wrapped in use_replica
+#   DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_RECYCLE, DB_POOL_PRE_PING
+#   DB_STATEMENT_TIMEOUT_MS  per-statement timeout (postgres / mysql)
+#   SQLITE_BUSY_TIMEOUT_MS   how long sqlite waits on a locked database
+
+
+def engine_options(url):
+    url = make_url(url)
+    options = {
+        'pool_pre_ping': os.environ.get('DB_POOL_PRE_PING', '1') == '1',
+        'pool_recycle': int(os.environ.get('DB_POOL_RECYCLE', 1800)),
+    }
+    if url.get_backend_name() == 'sqlite':
+        if url.database in (None, '', ':memory:'):
+            # in-memory databases use a single static connection, no pool to size
+            return {}
+        options['connect_args'] = {'timeout': int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 5000)) / 1000,
+                                   'check_same_thread': False}
+        options['pool_size'] = int(os.environ.get('DB_POOL_SIZE', 5))
+        options['max_overflow'] = int(os.environ.get('DB_MAX_OVERFLOW', 10))
+        return options
+
+    options['pool_size'] = int(os.environ.get('DB_POOL_SIZE', 10))
+    options['max_overflow'] = int(os.environ.get('DB_MAX_OVERFLOW', 20))
+    timeout = os.environ.get('DB_STATEMENT_TIMEOUT_MS')
+    if timeout:
+        if url.get_backend_name() == 'postgresql':
+            options['connect_args'] = {'options': f'-c statement_timeout={int(timeout)}'}
+        elif url.get_backend_name() == 'mysql':
+            options['connect_args'] = {'init_command': f'SET SESSION MAX_EXECUTION_TIME={int(timeout)}'}
+    return options
+
+
+def configure(app):
+    url = os.environ.get('DATABASE_URL', 'sqlite:///app.db')
+    app.config['SQLALCHEMY_DATABASE_URI'] = url
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(url)
+    if replica_url := os.environ.get('DATABASE_REPLICA_URL'):
+        app.config['SQLALCHEMY_BINDS'] = {'replica': {'url': replica_url, **engine_options(replica_url)}}
+
+
+@event.listens_for(Engine, 'connect')
+def _sqlite_pragmas(dbapi_connection, connection_record):
+    # WAL lets readers carry on while a login attempt is being written
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        busy_timeout = int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 5000))
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.execute(f'PRAGMA busy_timeout={busy_timeout}')
+        cursor.execute('PRAGMA synchronous=NORMAL')
+        cursor.close()
+
+
+class RoutingSession(FlaskSession):
+    # sends reads to the replica bind while a use_replica view is running
+    # flushes always go to the primary
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and has_app_context() and g.get('use_replica'):
+            engines = self._db.engines
+            if 'replica' in engines:
+                return engines['replica']
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def use_replica(view):
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        g.use_replica = True
+        try:
+            return view(*args, **kwargs)
+        finally:
+            g.use_replica = False
+    return wrapper
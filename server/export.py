@@ -0,0 +1,209 @@
+import base64
+import csv
+import io
+import os
+from datetime import date, datetime, time
+
+import click
+from sqlalchemy import or_, select
+
+import serializers
+from config import db
+from models import Household, User, Bank, Transactions, Categories, CategoryRule, Goals, MonthlyExpenses, ExpenseItem
+
+
+# streaming export of everything a household owns
+# each table is read with a server-side cursor in yield_per batches, as plain rows
+# (no ORM objects, no relationship loading), and written out batch by batch, so memory
+# stays at one batch whatever the size of the history. tables go out in a fixed order,
+# each ordered by id, so (table, last id) is enough to resume an interrupted export.
+#
+# NDJSON is the full export: one {"type": <table>, ...columns} line per row, a
+#   {"type": "cursor", "cursor": "..."} line after every batch, and {"type": "end"} last.
+#   a client that lost the connection asks again with ?cursor=<last cursor it saw>.
+# CSV is one table at a time (?table=transactions), resumed with ?after_id=<last id>.
+# Parquet (CLI only, needs pyarrow) writes a file per table, one row group per batch.
+
+MODELS = {
+    'household': Household,
+    'users': User,
+    'banks': Bank,
+    'categories': Categories,
+    'transactions': Transactions,
+    'monthly_expenses': MonthlyExpenses,
+    'expense_items': ExpenseItem,
+    'goals': Goals,
+    'category_rules': CategoryRule,
+}
+TABLES = tuple(MODELS)
+
+# secrets stay behind
+EXCLUDED = {
+    'household': ('join_code_hash',),
+    'users': ('_password_hash', 'OTPkey'),
+    'banks': ('public_token', 'link_token', 'persistent_token'),
+}
+
+
+def encode_cursor(table, last_id):
+    return base64.urlsafe_b64encode(f'{table}|{last_id}'.encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor):
+    try:
+        table, last_id = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8').split('|')
+        last_id = int(last_id)
+    except (ValueError, UnicodeError):
+        raise ValueError('Invalid cursor')
+    if table not in TABLES:
+        raise ValueError('Invalid cursor')
+    return table, last_id
+
+
+def _criteria(household_id):
+    # {table: where clause}, each one a subquery on the household
+    users = select(User.id).where(User.household_id == household_id)
+    banks = select(Bank.id).where(Bank.user_id.in_(users))
+    budgets = select(MonthlyExpenses.id).where(or_(MonthlyExpenses.household_id == household_id,
+                                                   MonthlyExpenses.user_id.in_(users)))
+    categories = (select(Transactions.categories_id).where(Transactions.bank_id.in_(banks))
+                  .union(select(ExpenseItem.categories_id).where(ExpenseItem.monthly_expenses_id.in_(budgets))))
+    return {
+        'household': Household.id == household_id,
+        'users': User.household_id == household_id,
+        'banks': Bank.user_id.in_(users),
+        'categories': Categories.id.in_(categories),
+        'transactions': Transactions.bank_id.in_(banks),
+        'monthly_expenses': MonthlyExpenses.id.in_(budgets),
+        'expense_items': ExpenseItem.monthly_expenses_id.in_(budgets),
+        'goals': or_(Goals.household_id == household_id, Goals.user_id.in_(users)),
+        'category_rules': or_(CategoryRule.household_id == household_id, CategoryRule.user_id.in_(users)),
+    }
+
+
+def _convert(column):
+    try:
+        python_type = column.type.python_type
+    except NotImplementedError:
+        return None
+    return serializers._isoformat if python_type in (datetime, date, time) else None
+
+
+def columns(table):
+    # id first, the cursor is built from it
+    selected = [column for column in MODELS[table].__table__.columns if column.key not in EXCLUDED.get(table, ())]
+    return sorted(selected, key=lambda column: column.key != 'id')
+
+
+def batches(household_id, tables=TABLES, cursor=None, batch_size=1000):
+    # yields (table, keys, rows), rows are lists of json-ready values
+    start_table, after_id = decode_cursor(cursor) if cursor else (tables[0], 0)
+    criteria = _criteria(household_id)
+    for table in tables[tables.index(start_table):]:
+        model = MODELS[table]
+        selected = columns(table)
+        keys = [column.key for column in selected]
+        converts = [_convert(column) for column in selected]
+        statement = (select(*selected).where(criteria[table], model.id > after_id).order_by(model.id)
+                     .execution_options(yield_per=batch_size))
+        for partition in db.session.execute(statement).partitions():
+            yield table, keys, [[convert(value) if convert else value for value, convert in zip(row, converts)]
+                                for row in partition]
+        after_id = 0
+
+
+def _bytes(data):
+    return data.encode('utf-8') if isinstance(data, str) else data
+
+
+def ndjson(household_id, cursor=None, batch_size=1000):
+    for table, keys, rows in batches(household_id, cursor=cursor, batch_size=batch_size):
+        lines = [_bytes(serializers.dumps({'type': table, **dict(zip(keys, row))})) for row in rows]
+        lines.append(_bytes(serializers.dumps({'type': 'cursor', 'cursor': encode_cursor(table, rows[-1][0])})))
+        yield b'\n'.join(lines) + b'\n'
+    yield _bytes(serializers.dumps({'type': 'end'})) + b'\n'
+
+
+def csv_rows(household_id, table, after_id=0, batch_size=1000):
+    out = io.StringIO()
+    writer = csv.writer(out)
+    header = True
+    for _, keys, rows in batches(household_id, (table,), encode_cursor(table, after_id), batch_size):
+        if header:
+            writer.writerow(keys)
+            header = False
+        writer.writerows(rows)
+        yield out.getvalue()
+        out.seek(0)
+        out.truncate()
+    if header:
+        writer.writerow([column.key for column in columns(table)])
+        yield out.getvalue()
+
+
+def _parquet_schema(pyarrow, table):
+    # dates are already iso strings by the time they get here
+    types = {int: pyarrow.int64(), bool: pyarrow.bool_()}
+    fields = []
+    for column in columns(table):
+        try:
+            python_type = column.type.python_type
+        except NotImplementedError:
+            python_type = str
+        fields.append((column.key, types.get(python_type, pyarrow.string())))
+    return pyarrow.schema(fields)
+
+
+def write_parquet(household_id, directory, batch_size=1000):
+    import pyarrow
+    import pyarrow.parquet
+
+    os.makedirs(directory, exist_ok=True)
+    writers = {}
+    try:
+        for table, keys, rows in batches(household_id, batch_size=batch_size):
+            if table not in writers:
+                writers[table] = pyarrow.parquet.ParquetWriter(os.path.join(directory, f'{table}.parquet'),
+                                                               _parquet_schema(pyarrow, table))
+            # column-major, each batch becomes one row group
+            writers[table].write_table(pyarrow.Table.from_arrays(
+                [pyarrow.array(values, type=field.type) for values, field in zip(zip(*rows), writers[table].schema)],
+                schema=writers[table].schema))
+    finally:
+        for writer in writers.values():
+            writer.close()
+    return sorted(writers)
+
+
+def register_cli(app):
+
+    @app.cli.command('export-household')
+    @click.argument('household_id', type=int)
+    @click.option('--format', 'fmt', type=click.Choice(['ndjson', 'csv', 'parquet']), default='ndjson')
+    @click.option('--output', default=None,
+                  help='file for ndjson (default stdout), directory for csv and parquet (a file per table)')
+    @click.option('--cursor', default=None, help='resume an ndjson export from this cursor')
+    @click.option('--batch-size', type=int, default=None)
+    def export_command(household_id, fmt, output, cursor, batch_size):
+        """Stream a household's full history to NDJSON, CSV or Parquet."""
+        batch_size = batch_size or app.config['EXPORT_BATCH_SIZE']
+        if fmt == 'ndjson':
+            with click.open_file(output or '-', 'wb') as f:
+                for chunk in ndjson(household_id, cursor, batch_size):
+                    f.write(chunk)
+            return
+        if not output:
+            raise click.UsageError(f'{fmt} export needs --output DIRECTORY')
+        if fmt == 'parquet':
+            try:
+                tables = write_parquet(household_id, output, batch_size)
+            except ImportError:
+                raise click.ClickException('parquet export needs pyarrow (pip install pyarrow)')
+            click.echo(f'wrote {", ".join(tables)} to {output}')
+            return
+        os.makedirs(output, exist_ok=True)
+        for table in TABLES:
+            with open(os.path.join(output, f'{table}.csv'), 'w', newline='') as f:
+                for chunk in csv_rows(household_id, table, batch_size=batch_size):
+                    f.write(chunk)
+        click.echo(f'wrote {len(TABLES)} tables to {output}')
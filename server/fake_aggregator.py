@@ -0,0 +1,54 @@
+import json
+import random
+from datetime import date, timedelta
+
+
+# local stand-in for the bank aggregator feed
+# produces deterministic transaction pages so ingestion can be developed and
+# benchmarked without a network connection or live credentials
+
+MERCHANTS = [
+    ('STARBUCKS #1182', 450, 900),
+    ('WHOLE FOODS MARKET', 2500, 18000),
+    ('SHELL OIL 5744', 3000, 7500),
+    ('NETFLIX.COM', 1549, 1549),
+    ('AMAZON MKTPLACE PMTS', 999, 12000),
+    ('UBER TRIP', 800, 4500),
+    ('CITY WATER UTILITY', 4000, 9000),
+    ('RENT PAYMENT', 120000, 240000),
+    ('PAYROLL DEPOSIT', -450000, -180000),
+    ('CHIPOTLE 0921', 1100, 2600),
+]
+
+
+class FakeAggregator:
+
+    def __init__(self, seed=0, start=date(2020, 1, 1)):
+        self.seed = seed
+        self.start = start
+
+    def records(self, bank_id, count):
+        rng = random.Random(f'{self.seed}:{bank_id}')
+        day = self.start
+        for i in range(count):
+            if rng.random() < 0.3:
+                day += timedelta(days=1)
+            merchant, low, high = rng.choice(MERCHANTS)
+            yield {'external_id': f'fake-{bank_id}-{i}',
+                   'date': day.isoformat(),
+                   'amount_cents': rng.randint(low, high),
+                   'description': merchant}
+
+    def pages(self, bank_id, count, page_size=500):
+        page = []
+        for record in self.records(bank_id, count):
+            page.append(record)
+            if len(page) == page_size:
+                yield page
+                page = []
+        if page:
+            yield page
+
+    def ndjson(self, bank_id, count):
+        for record in self.records(bank_id, count):
+            yield json.dumps(record) + '\n'
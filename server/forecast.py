@@ -0,0 +1,265 @@
+import json
+import threading
+from collections import OrderedDict
+from datetime import date
+
+import click
+from sqlalchemy import Integer, cast, func, select
+
+from config import db
+from models import Household, MonthlyExpenses, ExpenseItem
+
+
+# monthly expense forecasting for households with fluctuating incomes
+# a batch of households is loaded with two GROUP BY queries and pivoted into
+# (household, month) income and (household, month, category) planned-expense arrays,
+# so rolling means, variance bands and shortfalls are computed for the whole batch
+# at once with no per-row python.
+#
+# for every household, over the trailing `window` months:
+#   income mean/std of actual_income, band = mean -/+ band_width * std
+#   category mean/std of planned spending per ExpenseItem category
+# the projection keeps the means flat and widens the income band with the horizon;
+# a month's shortfall is how far projected expenses exceed the low end of the band,
+# and each category's share of it is proportional to its share of expenses.
+# amounts are integer cents. numpy is imported on the first forecast, not at startup.
+# the history is capped at the latest MAX_HISTORY_MONTHS, so the arrays stay small
+# whatever range the budgets (or the request) span.
+
+# twice the longest trailing window the endpoint accepts
+MAX_HISTORY_MONTHS = 240
+
+
+def _month_index(value):
+    return value.year * 12 + value.month - 1
+
+
+def _month_date(index):
+    return date(int(index) // 12, int(index) % 12 + 1, 1)
+
+
+def _trailing(values, window):
+    import numpy as np
+    # rolling sums along the month axis (1) that skip NaN (months with no budget)
+    valid = ~np.isnan(values)
+    filled = np.where(valid, values, 0.0)
+
+    def window_sum(a):
+        total = np.cumsum(a, axis=1)
+        out = total.copy()
+        out[:, window:] -= total[:, :-window]
+        return out
+
+    n = window_sum(valid.astype(np.float64))
+    s = window_sum(filled)
+    sq = window_sum(filled * filled)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = s / n
+        std = np.sqrt(np.maximum(sq / n - mean * mean, 0.0))
+    return mean, std
+
+
+def load_history(household_ids, start=None, end=None):
+    import numpy as np
+    # two Core queries for the whole batch (no ORM row objects), returned as numpy columns
+    income = select(
+        MonthlyExpenses.household_id,
+        MonthlyExpenses.month,
+        func.sum(MonthlyExpenses.actual_income_cents),
+        func.sum(MonthlyExpenses.user_expected_income_cents),
+        # max() over an integer, PostgreSQL has no max(boolean)
+        func.max(cast(MonthlyExpenses.is_fluctuating_income, Integer)),
+    ).where(MonthlyExpenses.household_id.in_(household_ids), MonthlyExpenses.month.is_not(None))
+    planned = select(
+        MonthlyExpenses.household_id,
+        MonthlyExpenses.month,
+        ExpenseItem.categories_id,
+        func.sum(ExpenseItem.planned_amount_cents),
+    ).join(MonthlyExpenses, ExpenseItem.monthly_expenses_id == MonthlyExpenses.id
+    ).where(MonthlyExpenses.household_id.in_(household_ids), MonthlyExpenses.month.is_not(None))
+    if start:
+        income = income.where(MonthlyExpenses.month >= start)
+        planned = planned.where(MonthlyExpenses.month >= start)
+    if end:
+        income = income.where(MonthlyExpenses.month <= end)
+        planned = planned.where(MonthlyExpenses.month <= end)
+    income = db.session.execute(income.group_by(MonthlyExpenses.household_id, MonthlyExpenses.month)).all()
+    planned = db.session.execute(planned.group_by(MonthlyExpenses.household_id, MonthlyExpenses.month,
+                                                  ExpenseItem.categories_id)).all()
+
+    def columns(rows, width):
+        if not rows:
+            return [np.empty(0, dtype=np.int64)] * width
+        households, months, *rest = zip(*rows)
+        months = np.fromiter((_month_index(m) for m in months), dtype=np.int64, count=len(months))
+        return [np.array(households, dtype=np.int64), months,
+                *(np.array([-1 if v is None else v for v in col], dtype=np.int64) for col in rest)]
+
+    return columns(income, 5), columns(planned, 4)
+
+
+def forecast_households(household_ids, start=None, end=None, window=6, horizon=12, band_width=1.0):
+    import numpy as np
+    household_ids = list(household_ids)
+    (inc_household, inc_month, actual, expected, fluctuating), (exp_household, exp_month, category, amount) = \
+        load_history(household_ids, start, end)
+    results = {}
+    if len(inc_month) == 0:
+        return {household_id: _empty(household_id, start, end) for household_id in household_ids}
+
+    last = _month_index(end) if end else int(inc_month.max())
+    if last + horizon > _month_index(date.max):
+        raise ValueError(f'the projection would run past {date.max.year}')
+    first = max(_month_index(start) if start else int(inc_month.min()), last - MAX_HISTORY_MONTHS + 1)
+    months = last - first + 1
+    keep = inc_month >= first
+    inc_household, inc_month, actual, expected, fluctuating = (
+        column[keep] for column in (inc_household, inc_month, actual, expected, fluctuating))
+    keep = exp_month >= first
+    exp_household, exp_month, category, amount = (column[keep] for column in (exp_household, exp_month, category, amount))
+    rows = {household_id: i for i, household_id in enumerate(household_ids)}
+    h = np.array([rows[x] for x in inc_household], dtype=np.int64)
+    m = inc_month - first
+
+    # (household, month) grids, NaN where a household has no budget that month
+    income = np.full((len(household_ids), months), np.nan)
+    income[h, m] = actual
+    expected_income = np.full((len(household_ids), months), np.nan)
+    expected_income[h, m] = expected
+    is_fluctuating = np.zeros(len(household_ids), dtype=bool)
+    np.logical_or.at(is_fluctuating, h, fluctuating.astype(bool))
+
+    # (household, month, category) planned spending, 0 in budgeted months without the category
+    categories, c = np.unique(category, return_inverse=True)
+    planned = np.where(np.isnan(income)[:, :, None], np.nan, 0.0) * np.ones(len(categories))
+    if len(category):
+        eh = np.array([rows[x] for x in exp_household], dtype=np.int64)
+        np.add.at(planned, (eh, exp_month - first, c), amount)
+
+    income_mean, income_std = _trailing(income, window)
+    category_mean, category_std = _trailing(planned, window)
+
+    # trailing stats as of the last month, then a flat projection with a widening band
+    mean_now = income_mean[:, -1]
+    std_now = income_std[:, -1]
+    spend_now = category_mean[:, -1, :]
+    expenses_now = np.nansum(spend_now, axis=-1)
+    steps = np.arange(1, horizon + 1)
+    spread = band_width * std_now[:, None] * np.sqrt(1 + steps / window)[None, :]
+    low = mean_now[:, None] - spread
+    high = mean_now[:, None] + spread
+    shortfall = np.maximum(expenses_now[:, None] - low, 0.0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        share = np.where(expenses_now[:, None] > 0, spend_now / expenses_now[:, None], 0.0)
+    category_shortfall = np.nansum(shortfall, axis=-1)[:, None] * share
+
+    history_months = [_month_date(first + i).isoformat() for i in range(months)]
+    projected_months = [_month_date(last + i).isoformat() for i in steps]
+    category_ids = [None if k == -1 else k for k in categories.tolist()]
+    # everything is rounded to cents in bulk, the loop below only assembles dicts
+    income_band = _cents(np.stack([mean_now, std_now, mean_now - band_width * std_now,
+                                   mean_now + band_width * std_now, expenses_now, np.nansum(shortfall, axis=-1)], axis=1))
+    history = _cents(np.stack([income, expected_income, income_mean, income_std], axis=-1))
+    category_stats = _cents(np.stack([spend_now, category_std[:, -1, :],
+                                      spend_now + band_width * category_std[:, -1, :], category_shortfall], axis=-1))
+    projection = _cents(np.stack([low, high, shortfall], axis=-1))
+    budgeted = ~np.isnan(income)
+    has_category = ~np.isnan(spend_now)
+    for household_id, i in rows.items():
+        if np.isnan(mean_now[i]):
+            results[household_id] = _empty(household_id, start, end)
+            continue
+        mean, std, low_now, high_now, expenses, total_shortfall = income_band[i]
+        results[household_id] = {
+            'household_id': household_id,
+            'start': history_months[0],
+            'end': history_months[-1],
+            'window': window,
+            'is_fluctuating_income': bool(is_fluctuating[i]),
+            'income': {'mean_cents': mean, 'std_cents': std, 'low_cents': low_now, 'high_cents': high_now},
+            'history': [dict(zip(HISTORY_FIELDS, (history_months[j], *history[i][j])))
+                        for j in np.flatnonzero(budgeted[i]).tolist()],
+            'categories': [dict(zip(CATEGORY_FIELDS, (category_ids[k], *category_stats[i][k])))
+                           for k in np.flatnonzero(has_category[i]).tolist()],
+            'projection': [{'month': projected_months[j], 'income_cents': mean, 'income_low_cents': row[0],
+                            'income_high_cents': row[1], 'expenses_cents': expenses, 'shortfall_cents': row[2]}
+                           for j, row in enumerate(projection[i])],
+            'projected_shortfall_cents': total_shortfall,
+        }
+    return results
+
+
+HISTORY_FIELDS = ('month', 'actual_income_cents', 'expected_income_cents', 'rolling_mean_cents', 'rolling_std_cents')
+CATEGORY_FIELDS = ('categories_id', 'mean_cents', 'std_cents', 'high_cents', 'projected_shortfall_cents')
+
+
+def _cents(values):
+    import numpy as np
+    # numpy floats -> nested lists of int cents, NaN -> None
+    rounded = np.rint(np.nan_to_num(values)).astype(np.int64).astype(object)
+    rounded[np.isnan(values)] = None
+    return rounded.tolist()
+
+
+def _empty(household_id, start, end):
+    return {'household_id': household_id,
+            'start': start.isoformat() if start else None,
+            'end': end.isoformat() if end else None,
+            'income': None, 'history': [], 'categories': [], 'projection': [],
+            'projected_shortfall_cents': 0}
+
+
+class ForecastCache:
+    # memoized forecasts keyed by (household, version, start, end, window, horizon).
+    # Household.version moves with every write to the household's budgets, in any
+    # worker, so a changed household is a new key and stale versions age out of the LRU
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+def forecast(cache, household_id, version, start=None, end=None, window=6, horizon=12):
+    key = (household_id, version, start, end, window, horizon)
+    if (result := cache.get(key)) is None:
+        result = forecast_households([household_id], start, end, window, horizon)[household_id]
+        cache.set(key, result)
+    return result
+
+
+def create_forecast_cache(app):
+    cache = ForecastCache(app.config.get('FORECAST_CACHE_SIZE', 1024))
+
+    @app.cli.command('forecast-households')
+    @click.option('--years', type=int, default=5, help='how far ahead to project')
+    @click.option('--window', type=int, default=6, help='trailing months for the rolling stats')
+    @click.option('--chunk', type=int, default=1000, help='households per batch')
+    @click.option('--output', type=click.File('w'), default='-', help='NDJSON output (default stdout)')
+    def forecast_command(years, window, chunk, output):
+        """Forecast every household, one JSON line per household."""
+        ids = [household_id for (household_id,) in db.session.query(Household.id).order_by(Household.id)]
+        for i in range(0, len(ids), chunk):
+            for result in forecast_households(ids[i:i + chunk], window=window, horizon=years * 12).values():
+                output.write(json.dumps(result) + '\n')
+        click.echo(f'forecast {len(ids)} households', err=True)
+
+    return cache
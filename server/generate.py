@@ -0,0 +1,412 @@
+import base64
+import itertools
+import json
+import os
+import random
+import shutil
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+import click
+from sqlalchemy import create_engine, func, insert, select
+from sqlalchemy.schema import CreateTable
+
+from config import db, hasher
+from models import Categories, join_code
+from seed import FAKE_HOUSEHOLD_KEY, FAKE_PASSWORD
+
+
+# synthetic data at production scale, for capacity testing
+#   flask generate-data --households 1000000 --workers 8
+#
+# households are generated in fixed-size chunks, each from its own Random(seed, chunk),
+# so the data only depends on --seed and --chunk-size, never on --workers. every chunk
+# is written by a worker process into its own temp SQLite shard (no indexes, local ids
+# from 1), then the shards are merged into the target in chunk order with every id and
+# foreign key shifted by the rows already there. secondary indexes are dropped before
+# the merge and built once at the end, and built again on the way out if the merge
+# fails or is interrupted (the shards merged by then stay in).
+#
+# rows go in as multi-row VALUES statements rendered once per table; SQLAlchemy's
+# executemany or insert().values([...]) spend more time building parameters and SQL
+# than SQLite spends inserting. the derived goal summary and monthly spending rollup
+# are generated alongside the goals and transactions. all users share seed.FAKE_PASSWORD
+# and all households seed.FAKE_HOUSEHOLD_KEY.
+
+LAST_NAMES = ('Smith', 'Johnson', 'Williams', 'Brown', 'Jones', 'Garcia', 'Miller', 'Davis', 'Rodriguez',
+              'Martinez', 'Hernandez', 'Lopez', 'Gonzalez', 'Wilson', 'Anderson', 'Thomas', 'Taylor', 'Moore',
+              'Jackson', 'Martin', 'Lee', 'Perez', 'Thompson', 'White', 'Harris', 'Sanchez', 'Clark', 'Ramirez',
+              'Lewis', 'Robinson', 'Walker', 'Young', 'Allen', 'King', 'Wright', 'Scott', 'Nguyen', 'Hill')
+FIRST_NAMES = ('James', 'Mary', 'Robert', 'Patricia', 'John', 'Jennifer', 'Michael', 'Linda', 'David',
+               'Elizabeth', 'William', 'Barbara', 'Richard', 'Susan', 'Joseph', 'Jessica', 'Thomas', 'Sarah',
+               'Charles', 'Karen', 'Daniel', 'Lisa', 'Matthew', 'Nancy', 'Anthony', 'Betty', 'Mark', 'Sandra',
+               'Maria', 'Ashley', 'Steven', 'Emily', 'Paul', 'Donna', 'Andrew', 'Michelle', 'Joshua', 'Carol')
+BANK_NAMES = ('Chase', 'Bank of America', 'Wells Fargo', 'Citibank', 'Capital One', 'US Bank', 'PNC',
+              'Ally', 'Discover', 'American Express', 'Navy Federal', 'Local Credit Union')
+
+# (name, description, is an expense)
+CATEGORIES = (
+    ('Housing', 'Rent, mortgage and home costs', True),
+    ('Groceries', 'Supermarkets and food shopping', True),
+    ('Dining', 'Restaurants and coffee', True),
+    ('Transportation', 'Fuel, rides and transit', True),
+    ('Utilities', 'Water, power and internet', True),
+    ('Entertainment', 'Streaming and events', True),
+    ('Shopping', 'General retail', True),
+    ('Health', 'Pharmacy and doctors', True),
+    ('Income', 'Salary and other income', False),
+)
+
+# (description, category, low cents, high cents, weight), weights are relative frequency
+PURCHASES = (
+    ('STARBUCKS #1182', 'Dining', 450, 900, 14),
+    ('CHIPOTLE 0921', 'Dining', 1100, 2600, 8),
+    ('WHOLE FOODS MARKET', 'Groceries', 2500, 18000, 10),
+    ('KROGER #0457', 'Groceries', 1800, 14000, 10),
+    ('SHELL OIL 5744', 'Transportation', 3000, 7500, 7),
+    ('UBER TRIP', 'Transportation', 800, 4500, 6),
+    ('AMAZON MKTPLACE PMTS', 'Shopping', 999, 12000, 12),
+    ('TARGET T-2210', 'Shopping', 1500, 9000, 6),
+    ('CVS PHARMACY', 'Health', 600, 5000, 4),
+    ('AMC THEATRES', 'Entertainment', 1200, 4000, 2),
+)
+PURCHASE_WEIGHTS = tuple(itertools.accumulate(p[4] for p in PURCHASES))
+
+USERS_PER_HOUSEHOLD = ((1, 2, 3, 4, 5, 6), (28, 34, 15, 13, 7, 3))
+BANKS_PER_USER = ((1, 2, 3), (50, 35, 15))
+GOALS_PER_HOUSEHOLD = ((0, 1, 2, 3, 4), (30, 30, 20, 12, 8))
+GOAL_NAMES = ('Emergency fund', 'Vacation', 'New car', 'Down payment', 'Wedding', 'College fund', 'Pay off card')
+
+# shard tables in dependency order, with the columns written and the tables their foreign keys point at
+TABLES = {
+    'household_table': (('id', 'name', 'join_code_hash', 'key_date', 'version'), {}),
+    'users_table': (('id', 'user_name', '_password_hash', 'admin', 'first_name', 'last_name', 'email',
+                     'date_of_birth', 'OTPkey', 'household_id'), {'household_id': 'household_table'}),
+    'bank_table': (('id', 'public_token', 'link_token', 'persistent_token', 'bank_name', 'account_type',
+                    'user_id'), {'user_id': 'users_table'}),
+    'transactions_table': (('id', 'transaction_description', 'external_id', 'amount_cents', 'date',
+                            'rules_version', 'bank_id', 'categories_id'), {'bank_id': 'bank_table'}),
+    'monthly_expenses_table': (('id', 'month', 'is_household_budget', 'user_expected_income_cents',
+                                'actual_income_cents', 'user_expected_monthly_expenses_total_cents',
+                                'is_fluctuating_income', 'user_id', 'household_id'),
+                               {'user_id': 'users_table', 'household_id': 'household_table'}),
+    'expense_item_table': (('id', 'item_name', 'item_desc', 'planned_amount_cents', 'monthly_expenses_id',
+                            'categories_id'), {'monthly_expenses_id': 'monthly_expenses_table'}),
+    'goals_table': (('id', 'household_budget', 'name', 'description', 'target_amount_cents',
+                     'current_amount_cents', 'deadline', 'user_id', 'household_id'),
+                    {'user_id': 'users_table', 'household_id': 'household_table'}),
+    'household_goal_summary_table': (('household_id', 'goals', 'target_amount_cents', 'current_amount_cents',
+                                      'nearest_deadline'), {'household_id': 'household_table'}),
+    'household_monthly_spending_table': (('household_id', 'month', 'categories_id', 'transactions', 'amount_cents'),
+                                         {'household_id': 'household_table'}),
+}
+
+FLUSH_ROWS = 20000
+
+
+def _month_add(month, n):
+    index = month.year * 12 + month.month - 1 + n
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def multi_row_insert(connection, table, columns, rows):
+    # one INSERT ... VALUES (...), (...), ... per slice, under SQLite's 999 parameter limit
+    if not rows:
+        return
+    if connection.dialect.paramstyle not in ('qmark', 'format'):
+        # named parameters, SQLAlchemy batches these into multi-row VALUES itself (insertmanyvalues)
+        connection.execute(insert(table), [dict(zip(columns, row)) for row in rows])
+        return
+    compiled = str(insert(table).compile(dialect=connection.dialect, column_keys=list(columns)))
+    head, group = compiled.split(' VALUES ')
+    per_statement = max(1, 999 // len(columns))
+    full = f'{head} VALUES {", ".join([group] * per_statement)}'
+    for i in range(0, len(rows), per_statement):
+        chunk = rows[i:i + per_statement]
+        sql = full if len(chunk) == per_statement else f'{head} VALUES {", ".join([group] * len(chunk))}'
+        connection.exec_driver_sql(sql, tuple(itertools.chain.from_iterable(chunk)))
+
+
+class Shard:
+    # one chunk of households, written to its own SQLite file with local ids
+
+    def __init__(self, path, chunk, first_household, options):
+        self.path = path
+        self.options = options
+        self.rng = random.Random(f'{options["seed"]}:{chunk}')
+        # the id each household will have after the merge, user names are unique through it
+        self.first_household = first_household
+        self.categories = options['categories']
+        self.months = [_month_add(date.fromisoformat(options['through']), -n) for n in range(options['months'])][::-1]
+        self.ids = dict.fromkeys(TABLES, 0)
+        self.rows = {name: [] for name in TABLES}
+        self.counts = dict.fromkeys(TABLES, 0)
+        self.engine = create_engine(f'sqlite:///{path}')
+        self.connection = self.engine.connect()
+        self.connection.exec_driver_sql('PRAGMA journal_mode=OFF')
+        self.connection.exec_driver_sql('PRAGMA synchronous=OFF')
+        for name in TABLES:
+            self.connection.execute(CreateTable(db.metadata.tables[name]))
+
+    def add(self, name, *values):
+        if name in self.ids:
+            self.ids[name] += 1
+            values = (self.ids[name], *values) if TABLES[name][0][0] == 'id' else values
+        self.rows[name].append(values)
+        if len(self.rows[name]) >= FLUSH_ROWS:
+            self.flush(name)
+        return self.ids[name]
+
+    def flush(self, name):
+        multi_row_insert(self.connection, db.metadata.tables[name], TABLES[name][0], self.rows[name])
+        self.counts[name] += len(self.rows[name])
+        self.rows[name] = []
+
+    def close(self):
+        for name in TABLES:
+            self.flush(name)
+        self.connection.commit()
+        self.connection.close()
+        self.engine.dispose()
+        return self.counts
+
+    def _choice(self, choices):
+        return self.rng.choices(*choices)[0]
+
+    def household(self, household_id):
+        rng = self.rng
+        last_name = rng.choice(LAST_NAMES)
+        name = f'{last_name} Family'
+        key_date = datetime(2019, 1, 1) + timedelta(seconds=rng.randrange(5 * 365 * 86400))
+        local_household = self.add('household_table', name, join_code(name, FAKE_HOUSEHOLD_KEY),
+                                   key_date.strftime('%Y-%m-%d %H:%M:%S.%f'), 0)
+        members = []
+        spending = {}
+        for n in range(self._choice(USERS_PER_HOUSEHOLD)):
+            first_name = rng.choice(FIRST_NAMES)
+            user_name = f'{first_name.lower()}.{last_name.lower()}{household_id}x{n}'
+            birth = date(1950, 1, 1) + timedelta(days=rng.randrange(50 * 365))
+            user_id = self.add('users_table', user_name, self.options['password_hash'], n == 0, first_name,
+                               last_name, f'{user_name}@example.com', f'{birth.month}/{birth.day}/{birth.year}',
+                               base64.b32encode(rng.randbytes(20)).decode('ascii'), local_household)
+            members.append(user_id)
+            # monthly take-home pay, lognormal around $4,500
+            salary = int(rng.lognormvariate(13.0, 0.45))
+            fluctuating = rng.random() < 0.3
+            for b in range(self._choice(BANKS_PER_USER)):
+                account_type = 'checking' if b == 0 else rng.choice(('savings', 'credit'))
+                bank_id = self.add('bank_table', f'public-{household_id}-{n}-{b}-{rng.getrandbits(64):016x}',
+                                   f'link-{household_id}-{n}-{b}-{rng.getrandbits(64):016x}',
+                                   f'access-{household_id}-{n}-{b}-{rng.getrandbits(64):016x}',
+                                   rng.choice(BANK_NAMES), account_type, user_id)
+                self.transactions(bank_id, account_type, salary, fluctuating, spending)
+            self.budgets(user_id, local_household, salary, fluctuating)
+        self.goals(local_household, members)
+        for (month, category_id), (count, amount) in sorted(spending.items()):
+            self.add('household_monthly_spending_table', local_household, month, category_id, count, amount)
+
+    def transactions(self, bank_id, account_type, salary, fluctuating, spending):
+        rng = self.rng
+        # how busy this account is, most are quiet and a few are very active
+        activity = self.options['activity'] * rng.lognormvariate(-0.18, 0.6)
+        if account_type == 'savings':
+            activity = 0
+        external = 0
+        categories = self.categories
+        for month in self.months:
+            rows = []
+            if account_type == 'checking':
+                for day in (1, 15):
+                    pay = salary // 2 if not fluctuating else int(salary / 2 * rng.uniform(0.6, 1.4))
+                    rows.append((day, 'PAYROLL DEPOSIT', -pay, 'Income'))
+                rows.append((1, 'RENT PAYMENT', int(salary * rng.uniform(0.25, 0.4)), 'Housing'))
+                rows.append((rng.randint(5, 20), 'CITY WATER UTILITY', rng.randint(4000, 9000), 'Utilities'))
+                rows.append((rng.randint(5, 20), 'NETFLIX.COM', 1549, 'Entertainment'))
+            elif account_type == 'savings':
+                rows.append((2, 'TRANSFER FROM CHECKING', -rng.randint(5000, 60000), None))
+            for _ in range(max(0, int(rng.gauss(activity, activity ** 0.5)))):
+                description, category, low, high, _ = rng.choices(PURCHASES, cum_weights=PURCHASE_WEIGHTS)[0]
+                rows.append((rng.randint(1, 28), description, rng.randint(low, high), category))
+            rows.sort(key=lambda row: row[0])
+            for day, description, amount, category in rows:
+                external += 1
+                # about one in ten transactions is still waiting for a category
+                category_id = categories.get(category) if category and rng.random() >= 0.1 else None
+                self.add('transactions_table', description, f'gen-{external}', amount,
+                         month.replace(day=day).isoformat(), None, bank_id, category_id)
+                total = spending.setdefault((month.isoformat(), category_id or 0), [0, 0])
+                total[0] += 1
+                total[1] += amount
+
+    def budgets(self, user_id, household_id, salary, fluctuating):
+        rng = self.rng
+        expense_categories = [name for name, _, expense in CATEGORIES if expense]
+        for month in self.months:
+            actual = salary if not fluctuating else int(salary * rng.uniform(0.6, 1.4))
+            items = rng.sample(expense_categories, rng.randint(3, min(8, len(expense_categories))))
+            planned = [(name, int(salary * rng.uniform(0.03, 0.3))) for name in items]
+            budget_id = self.add('monthly_expenses_table', month.isoformat(), False, salary, actual,
+                                 sum(amount for _, amount in planned), fluctuating, user_id, household_id)
+            for name, amount in planned:
+                self.add('expense_item_table', name, f'{name} for {month:%B %Y}', amount, budget_id,
+                         self.categories[name])
+
+    def goals(self, household_id, members):
+        rng = self.rng
+        count = self._choice(GOALS_PER_HOUSEHOLD)
+        totals = [0, 0]
+        nearest = None
+        for _ in range(count):
+            target = rng.randrange(50000, 2000000, 100)
+            current = target if rng.random() < 0.1 else int(target * rng.betavariate(2, 3))
+            deadline = _month_add(self.months[-1], rng.randint(1, 36)) + timedelta(days=rng.randrange(28))
+            self.add('goals_table', rng.random() < 0.4, rng.choice(GOAL_NAMES), 'Generated goal', target, current,
+                     deadline.isoformat(), rng.choice(members), household_id)
+            totals[0] += target
+            totals[1] += current
+            if current < target and (nearest is None or deadline < nearest):
+                nearest = deadline
+        if count:
+            self.add('household_goal_summary_table', household_id, count, totals[0], totals[1],
+                     nearest.isoformat() if nearest else None)
+
+
+def generate_shard(path, chunk, first_household, households, options):
+    start = time.perf_counter()
+    shard = Shard(path, chunk, first_household, options)
+    for i in range(households):
+        shard.household(first_household + i)
+    counts = shard.close()
+    return chunk, path, counts, time.perf_counter() - start
+
+
+def _offsets(connection):
+    return {name: connection.execute(select(func.coalesce(func.max(db.metadata.tables[name].c.id), 0))).scalar()
+            for name, (columns, _) in TABLES.items() if columns[0] == 'id'}
+
+
+def merge_shard(connection, path, offsets):
+    # copies a shard into the target, shifting ids and foreign keys by the offsets
+    for name, (columns, references) in TABLES.items():
+        shift = {column: offsets[table] for column, table in references.items()}
+        if columns[0] == 'id':
+            shift['id'] = offsets[name]
+        if connection.dialect.name == 'sqlite':
+            expressions = ', '.join(f'"{c}" + {shift[c]}' if c in shift else f'"{c}"' for c in columns)
+            names = ', '.join(f'"{c}"' for c in columns)
+            connection.exec_driver_sql(f'INSERT INTO main.{name} ({names}) SELECT {expressions} FROM shard.{name}')
+            continue
+        table = db.metadata.tables[name]
+        source = create_engine(f'sqlite:///{path}')
+        with source.connect() as shard:
+            result = shard.execution_options(yield_per=FLUSH_ROWS).execute(select(*(table.c[c] for c in columns)))
+            for rows in result.partitions():
+                multi_row_insert(connection, table, columns,
+                                 [tuple(v + shift[c] if c in shift and v is not None else v
+                                        for c, v in zip(columns, row)) for row in rows])
+        source.dispose()
+
+
+def ensure_categories(connection):
+    table = Categories.__table__
+    existing = dict(connection.execute(select(table.c.categories_name, table.c.id)).all())
+    missing = [{'categories_name': name, 'categories_description': description, 'categories_type': expense}
+               for name, description, expense in CATEGORIES if name not in existing]
+    if missing:
+        connection.execute(insert(table), missing)
+        existing = dict(connection.execute(select(table.c.categories_name, table.c.id)).all())
+    return {name: existing[name] for name, _, _ in CATEGORIES}
+
+
+def generate(households, workers=None, chunk_size=2000, seed=0, months=12, through='2024-12-01', activity=20,
+             tmp_dir=None, echo=print):
+    from concurrent.futures import ProcessPoolExecutor
+
+    report = {'households': households, 'phases': {}}
+    engine = db.engine
+    tables = [db.metadata.tables[name] for name in TABLES]
+    db.metadata.create_all(engine, tables=tables + [Categories.__table__])
+    with engine.begin() as connection:
+        categories = ensure_categories(connection)
+        offsets = _offsets(connection)
+    options = {'seed': seed, 'months': months, 'through': through, 'activity': activity,
+               'categories': categories, 'password_hash': hasher.hash(FAKE_PASSWORD)}
+
+    workdir = tempfile.mkdtemp(prefix='generate-', dir=tmp_dir)
+    chunks = [(os.path.join(workdir, f'shard-{chunk:05d}.db'), chunk, offsets['household_table'] + start + 1,
+               min(chunk_size, households - start), options)
+              for chunk, start in enumerate(range(0, households, chunk_size))]
+    indexes = [index for table in tables for index in table.indexes]
+    dropped = False
+    try:
+        start = time.perf_counter()
+        shards = []
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for result in pool.map(generate_shard, *zip(*chunks)):
+                shards.append(result)
+                echo(f'generated chunk {result[0] + 1}/{len(chunks)}')
+        rows = sum(sum(counts.values()) for _, _, counts, _ in shards)
+        elapsed = time.perf_counter() - start
+        report['phases']['generate'] = {'seconds': elapsed, 'rows': rows, 'rows_per_second': rows / elapsed}
+
+        start = time.perf_counter()
+        with engine.connect() as connection:
+            dropped = True
+            for index in indexes:
+                index.drop(connection, checkfirst=True)
+            connection.commit()
+            for chunk, path, counts, _ in shards:
+                if connection.dialect.name == 'sqlite':
+                    connection.exec_driver_sql('ATTACH DATABASE ? AS shard', (path,))
+                merge_shard(connection, path, offsets)
+                connection.commit()
+                if connection.dialect.name == 'sqlite':
+                    connection.exec_driver_sql('DETACH DATABASE shard')
+                for name in offsets:
+                    offsets[name] += counts[name]
+                os.remove(path)
+        elapsed = time.perf_counter() - start
+        report['phases']['merge'] = {'seconds': elapsed, 'rows': rows, 'rows_per_second': rows / elapsed}
+
+        start = time.perf_counter()
+        with engine.begin() as connection:
+            for index in indexes:
+                index.create(connection)
+        dropped = False
+        report['phases']['index'] = {'seconds': time.perf_counter() - start, 'indexes': len(indexes)}
+    finally:
+        if dropped:
+            try:
+                with engine.begin() as connection:
+                    for index in indexes:
+                        index.create(connection, checkfirst=True)
+            except Exception as e:
+                echo(f'could not rebuild the indexes, recreate them before using the database: {e}')
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report['rows'] = {name: sum(counts[name] for _, _, counts, _ in shards) for name in TABLES}
+    report['seconds'] = sum(phase['seconds'] for phase in report['phases'].values())
+    report['rows_per_second'] = rows / report['seconds']
+    return report
+
+
+def register_cli(app):
+
+    @app.cli.command('generate-data')
+    @click.option('--households', type=int, default=10000)
+    @click.option('--workers', type=int, default=None, help='generator processes (default: one per CPU)')
+    @click.option('--chunk-size', type=int, default=2000, help='households per shard, part of what --seed reproduces')
+    @click.option('--seed', type=int, default=0)
+    @click.option('--months', type=int, default=12, help='months of history per user')
+    @click.option('--through', default='2024-12', help='last month of history, YYYY-MM')
+    @click.option('--activity', type=float, default=20, help='mean card purchases per account per month')
+    @click.option('--tmp-dir', type=click.Path(file_okay=False), default=None, help='where the shards are written')
+    def generate_command(households, workers, chunk_size, seed, months, through, activity, tmp_dir):
+        """Generate a large deterministic synthetic dataset for capacity testing."""
+        report = generate(households, workers, chunk_size, seed, months, f'{through[:7]}-01', activity, tmp_dir,
+                          echo=lambda message: click.echo(message, err=True))
+        click.echo(json.dumps(report, indent=2))
+        click.echo(f'{sum(report["rows"].values())} rows in {report["seconds"]:.1f}s '
+                   f'({report["rows_per_second"]:.0f} rows/s), every password is {FAKE_PASSWORD!r}'
+                   f' and every household key {FAKE_HOUSEHOLD_KEY!r}')
@@ -0,0 +1,205 @@
+from datetime import date, datetime
+
+import click
+from sqlalchemy import case, event, inspect, select
+
+import dashboard
+from config import db
+from models import Goals, HouseholdGoalSummary
+
+
+# per-household goal totals, maintained incrementally
+# every Goals insert/update/delete flushed through the ORM applies its delta to the
+# household's HouseholdGoalSummary row on the same connection, so the summary commits
+# (or rolls back) together with the goal. sums move by the delta; the nearest deadline
+# only needs a re-scan of that household's goals when the goal that held it goes away.
+# writes that bypass the ORM aren't seen; `flask check-goal-summary` rebuilds the
+# table from the goals and reports any drift.
+
+
+def parse_deadline(value):
+    # deadlines are free-form strings, 'YYYY-MM-DD...' and 'M/D/YYYY' are understood
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return date.fromisoformat(value[:10])
+    except ValueError:
+        pass
+    try:
+        return datetime.strptime(value, '%m/%d/%Y').date()
+    except ValueError:
+        return None
+
+
+def _open_deadline(deadline, target, current):
+    # only goals still in progress count toward the nearest deadline
+    return parse_deadline(deadline) if current < target else None
+
+
+def _upsert(connection, household_id, goals, target, current, deadline):
+    table = HouseholdGoalSummary.__table__
+    values = {'household_id': household_id, 'goals': goals, 'target_amount_cents': target,
+              'current_amount_cents': current, 'nearest_deadline': deadline}
+    dialect = connection.dialect.name
+    if dialect in ('postgresql', 'sqlite'):
+        # only the dialect in use is imported
+        if dialect == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+        insert = insert(table).values(**values)
+        excluded = insert.excluded
+        connection.execute(insert.on_conflict_do_update(index_elements=['household_id'], set_={
+            'goals': table.c.goals + excluded.goals,
+            'target_amount_cents': table.c.target_amount_cents + excluded.target_amount_cents,
+            'current_amount_cents': table.c.current_amount_cents + excluded.current_amount_cents,
+            'nearest_deadline': case(
+                (excluded.nearest_deadline.is_(None), table.c.nearest_deadline),
+                (table.c.nearest_deadline.is_(None), excluded.nearest_deadline),
+                (excluded.nearest_deadline < table.c.nearest_deadline, excluded.nearest_deadline),
+                else_=table.c.nearest_deadline),
+        }))
+        return
+    updated = connection.execute(table.update().where(table.c.household_id == household_id).values(
+        goals=table.c.goals + goals,
+        target_amount_cents=table.c.target_amount_cents + target,
+        current_amount_cents=table.c.current_amount_cents + current))
+    if updated.rowcount == 0:
+        connection.execute(table.insert().values(**values))
+    elif deadline is not None:
+        connection.execute(table.update().where(
+            table.c.household_id == household_id,
+            (table.c.nearest_deadline.is_(None)) | (table.c.nearest_deadline > deadline)
+        ).values(nearest_deadline=deadline))
+
+
+def _rescan_deadline(connection, household_id, removed):
+    # the removed deadline may have been the nearest one, if so find the next
+    table = HouseholdGoalSummary.__table__
+    nearest = connection.execute(select(table.c.nearest_deadline).where(
+        table.c.household_id == household_id)).scalar()
+    if nearest is None or nearest != removed:
+        return
+    goals = Goals.__table__
+    rows = connection.execute(select(goals.c.deadline, goals.c.target_amount_cents, goals.c.current_amount_cents)
+                              .where(goals.c.household_id == household_id))
+    deadlines = [d for d in (_open_deadline(*row) for row in rows) if d is not None]
+    connection.execute(table.update().where(table.c.household_id == household_id)
+                       .values(nearest_deadline=min(deadlines, default=None)))
+
+
+def _apply(connection, household_id, goals, target, current, added=None, removed=None):
+    if household_id is None:
+        return
+    if goals or target or current or added is not None:
+        _upsert(connection, household_id, goals, target, current, added)
+    if removed is not None and removed != added:
+        _rescan_deadline(connection, household_id, removed)
+
+
+@event.listens_for(Goals, 'after_insert')
+def _goal_inserted(mapper, connection, goal):
+    _apply(connection, goal.household_id, 1, goal.target_amount_cents, goal.current_amount_cents,
+           added=_open_deadline(goal.deadline, goal.target_amount_cents, goal.current_amount_cents))
+
+
+GOAL_FIELDS = ('household_id', 'target_amount_cents', 'current_amount_cents', 'deadline')
+
+
+def _committed(state, key):
+    # the value as last flushed, whatever the goal was changed to since
+    history = state.attrs[key].history
+    if history.deleted:
+        return history.deleted[0]
+    if history.unchanged:
+        return history.unchanged[0]
+    return getattr(state.object, key)
+
+
+@event.listens_for(Goals, 'after_delete')
+def _goal_deleted(mapper, connection, goal):
+    # the row deleted holds the committed values, not any unflushed edits to the object
+    state = inspect(goal)
+    household_id, target, current, deadline = (_committed(state, key) for key in GOAL_FIELDS)
+    _apply(connection, household_id, -1, -target, -current, removed=_open_deadline(deadline, target, current))
+
+
+@event.listens_for(Goals, 'after_update')
+def _goal_updated(mapper, connection, goal):
+    state = inspect(goal)
+    old = tuple(_committed(state, key) for key in GOAL_FIELDS)
+    new = (goal.household_id, goal.target_amount_cents, goal.current_amount_cents, goal.deadline)
+    if old == new:
+        return
+    old_deadline = _open_deadline(old[3], old[1], old[2])
+    new_deadline = _open_deadline(new[3], new[1], new[2])
+    if old[0] != new[0]:
+        # moved between households
+        _apply(connection, old[0], -1, -old[1], -old[2], removed=old_deadline)
+        _apply(connection, new[0], 1, new[1], new[2], added=new_deadline)
+    else:
+        _apply(connection, new[0], 0, new[1] - old[1], new[2] - old[2], added=new_deadline, removed=old_deadline)
+
+
+def summary(household_id):
+    # reads the maintained row only, no goal is loaded
+    row = db.session.get(HouseholdGoalSummary, household_id)
+    goals, target, current, deadline = ((row.goals, row.target_amount_cents, row.current_amount_cents,
+                                         row.nearest_deadline) if row else (0, 0, 0, None))
+    return {'household_id': household_id,
+            'goals': goals,
+            'target_cents': target,
+            'current_cents': current,
+            'percent_complete': round(current * 100 / target, 2) if target else None,
+            'nearest_deadline': deadline.isoformat() if deadline else None}
+
+
+def compute():
+    # the summary rebuilt from scratch, {household_id: (goals, target, current, nearest_deadline)}
+    totals = {}
+    rows = db.session.execute(select(Goals.household_id, Goals.target_amount_cents,
+                                     Goals.current_amount_cents, Goals.deadline)
+                              .where(Goals.household_id.is_not(None)))
+    for household_id, target, current, deadline in rows:
+        goals, target_sum, current_sum, nearest = totals.get(household_id, (0, 0, 0, None))
+        deadline = _open_deadline(deadline, target, current)
+        if deadline is not None and (nearest is None or deadline < nearest):
+            nearest = deadline
+        totals[household_id] = (goals + 1, target_sum + target, current_sum + current, nearest)
+    return totals
+
+
+def check(fix=True):
+    # returns {household_id: (stored, rebuilt)} for every household that drifted
+    rebuilt = compute()
+    stored = {row.household_id: (row.goals, row.target_amount_cents, row.current_amount_cents, row.nearest_deadline)
+              for row in db.session.query(HouseholdGoalSummary)}
+    empty = (0, 0, 0, None)
+    drift = {household_id: (stored.get(household_id), rebuilt.get(household_id, empty))
+             for household_id in stored.keys() | rebuilt.keys()
+             if stored.get(household_id, empty) != rebuilt.get(household_id, empty)}
+    if fix and drift:
+        table = HouseholdGoalSummary.__table__
+        db.session.execute(table.delete().where(table.c.household_id.in_(drift)))
+        rows = [{'household_id': household_id, 'goals': goals, 'target_amount_cents': target,
+                 'current_amount_cents': current, 'nearest_deadline': nearest}
+                for household_id, (goals, target, current, nearest) in rebuilt.items() if household_id in drift]
+        if rows:
+            db.session.execute(table.insert(), rows)
+        dashboard.bump(db.session.connection(), household_ids=list(drift))
+        db.session.commit()
+    return drift
+
+
+def register_cli(app):
+    @app.cli.command('check-goal-summary')
+    @click.option('--dry-run', is_flag=True, help='only report drift, leave the table as it is')
+    def check_command(dry_run):
+        """Rebuild the household goal summary from the goals and report any drift."""
+        drift = check(fix=not dry_run)
+        for household_id, (stored, rebuilt) in sorted(drift.items()):
+            click.echo(f'household {household_id}: stored {stored} rebuilt {rebuilt}')
+        click.echo(f'{len(drift)} households drifted' + ('' if dry_run or not drift else ', fixed'))
+        if dry_run and drift:
+            raise SystemExit(1)
@@ -0,0 +1,30 @@
+import os
+
+
+# gunicorn settings, every value can be overridden from the environment
+#
+#   cd server && gunicorn -c gunicorn.conf.py wsgi:app
+#   cd server && GUNICORN_WORKER_CLASS=uvicorn.workers.UvicornWorker gunicorn -c gunicorn.conf.py asgi:application
+#
+# bcrypt runs in each worker's own process pool (PASSWORD_HASH_WORKERS), so keep
+# workers * pool size around the number of cores.
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:5555')
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+threads = int(os.environ.get('GUNICORN_THREADS', 8))
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+# how long a worker gets to finish in-flight requests and drain the audit queue
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', 5))
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 0))
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER', 0))
+accesslog = os.environ.get('GUNICORN_ACCESS_LOG')
+# the app starts threads (audit writer) and pools at import, which don't survive a fork
+preload_app = False
+
+
+def worker_exit(server, worker):
+    # runs in the worker after it stops accepting requests
+    import app
+    app.shutdown()
@@ -0,0 +1,155 @@
+import csv
+import io
+import json
+import time
+from datetime import date
+from itertools import islice
+
+import click
+
+import dashboard
+import spending
+from config import db
+from models import Transactions
+from money import to_cents, whole_cents
+import fake_aggregator
+from categorize import matcher_for_bank
+
+
+# bulk transaction ingestion for bank feeds
+# records are read as a stream (NDJSON or CSV), parsed in fixed-size batches and
+# written with one multi-row INSERT per batch. rows whose (bank_id, external_id)
+# already exists are skipped by the database, and the whole import is one transaction.
+# the household's monthly spending rollup moves by the rows actually inserted.
+#
+# a record looks like
+#   {"external_id": "tx_123", "date": "2024-01-31", "amount": "12.50", "description": "COFFEE"}
+# "amount_cents" can be sent instead of "amount".
+
+MAX_REPORTED_ERRORS = 20
+
+
+def read_ndjson(lines):
+    for line in lines:
+        if isinstance(line, bytes):
+            line = line.decode('utf-8')
+        line = line.strip()
+        if line:
+            yield json.loads(line)
+
+
+def read_csv(lines):
+    if not isinstance(lines, io.TextIOBase):
+        lines = io.TextIOWrapper(lines, encoding='utf-8', newline='')
+    yield from csv.DictReader(lines)
+
+
+def parse_record(record, bank_id):
+    if not isinstance(record, dict):
+        raise ValueError('record must be an object')
+    external_id = record.get('external_id')
+    if not external_id:
+        raise ValueError('missing external_id')
+    if record.get('amount_cents') not in (None, ''):
+        amount = whole_cents(record['amount_cents'])
+    else:
+        amount = to_cents(record['amount'])
+    return {'bank_id': bank_id,
+            'external_id': str(external_id),
+            'amount_cents': amount,
+            'date': date.fromisoformat(record['date']),
+            'transaction_description': record.get('description') or ''}
+
+
+def _insert_ignoring_duplicates():
+    # only the dialect in use is imported
+    table = Transactions.__table__
+    if db.engine.dialect.name == 'postgresql':
+        from sqlalchemy.dialects import postgresql
+        return postgresql.insert(table).on_conflict_do_nothing(index_elements=['bank_id', 'external_id'])
+    if db.engine.dialect.name == 'sqlite':
+        from sqlalchemy.dialects import sqlite
+        return sqlite.insert(table).on_conflict_do_nothing(index_elements=['bank_id', 'external_id'])
+    return table.insert().prefix_with('IGNORE')
+
+
+def ingest(bank_id, records, batch_size=1000, matcher=None):
+    result = {'received': 0, 'inserted': 0, 'duplicates': 0, 'rejected': 0, 'errors': []}
+    statement = _insert_ignoring_duplicates()
+    table = Transactions.__table__
+    connection = db.session.connection()
+    # the inserted rows come back, so duplicates the database skipped don't count toward the rollup
+    returning = connection.dialect.insert_executemany_returning
+    if returning:
+        statement = statement.returning(table.c.date, table.c.amount_cents, table.c.categories_id)
+    householdId = spending.household_for_bank(connection, bank_id)
+    deltas = {}
+    months = set()
+    records = iter(records)
+    line = 0
+    try:
+        while batch := list(islice(records, batch_size)):
+            rows = []
+            for record in batch:
+                line += 1
+                try:
+                    row = parse_record(record, bank_id)
+                except (KeyError, TypeError, ValueError) as e:
+                    result['rejected'] += 1
+                    if len(result['errors']) < MAX_REPORTED_ERRORS:
+                        result['errors'].append({'line': line, 'error': str(e) or type(e).__name__})
+                    continue
+                if matcher is not None:
+                    row['categories_id'] = matcher.categorize(row['transaction_description'], row['amount_cents'])
+                    row['rules_version'] = matcher.version
+                rows.append(row)
+            result['received'] += len(batch)
+            if rows:
+                if returning:
+                    inserted = db.session.execute(statement, rows).all()
+                    for day, amount, categories_id in inserted:
+                        spending.add(deltas, householdId, day, categories_id, 1, amount)
+                    inserted = len(inserted)
+                else:
+                    inserted = db.session.execute(statement, rows).rowcount
+                    months.update(spending.month_of(row['date']) for row in rows)
+                result['inserted'] += inserted
+                result['duplicates'] += len(rows) - inserted
+        if result['inserted']:
+            if returning:
+                spending.apply(db.session.connection(), deltas)
+            else:
+                spending.recount(db.session.connection(), householdId, months)
+            dashboard.bump(db.session.connection(), bank_ids=[bank_id])
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return result
+
+
+def register_cli(app):
+
+    @app.cli.command('import-transactions')
+    @click.argument('bank_id', type=int)
+    @click.argument('path', required=False)
+    @click.option('--format', 'fmt', type=click.Choice(['ndjson', 'csv']), default='ndjson')
+    @click.option('--batch-size', type=int, default=None)
+    @click.option('--fake', type=int, default=0, help='import this many transactions from the fake aggregator instead of a file')
+    @click.option('--categorize/--no-categorize', default=True, help='apply the owner\'s category rules while importing')
+    def import_transactions(bank_id, path, fmt, batch_size, fake, categorize):
+        """Bulk import transactions for a bank from an NDJSON/CSV file."""
+        batch_size = batch_size or app.config.get('INGEST_BATCH_SIZE', 1000)
+        matcher = matcher_for_bank(bank_id) if categorize else None
+        start = time.perf_counter()
+        if fake:
+            result = ingest(bank_id, fake_aggregator.FakeAggregator().records(bank_id, fake), batch_size, matcher)
+        elif path:
+            with open(path, newline='') as f:
+                records = read_csv(f) if fmt == 'csv' else read_ndjson(f)
+                result = ingest(bank_id, records, batch_size, matcher)
+        else:
+            raise click.UsageError('give a file path or --fake N')
+        elapsed = time.perf_counter() - start
+        click.echo(json.dumps(result))
+        click.echo(f'{result["received"]} records in {elapsed:.2f}s ({result["received"] / elapsed:.0f}/s)')
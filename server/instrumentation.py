@@ -0,0 +1,244 @@
+import cProfile
+import heapq
+import itertools
+import os
+import random
+import re
+import threading
+from bisect import bisect_left
+from collections import Counter
+from contextlib import contextmanager
+from time import perf_counter
+
+from flask import Response, g, has_app_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+# opt-in request instrumentation (INSTRUMENTATION=1)
+# every request gets its wall time, SQL statement count/time and any named phases
+# (see phase()) reported in a Server-Timing header and aggregated into prometheus
+# style counters served from /metrics. statements whose shape repeats more than
+# N_PLUS_ONE_THRESHOLD times in one request are logged as a likely N+1.
+# with PROFILE_SLOWEST=N a sample of requests run under cProfile and the N slowest
+# are kept as .prof files in PROFILE_DIR (open with `python -m pstats` or snakeviz).
+
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_literals = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_whitespace = re.compile(r'\s+')
+
+
+def statement_shape(statement):
+    # literals are folded so statements that only differ by inlined values match
+    return _whitespace.sub(' ', _literals.sub('?', statement)).strip()
+
+
+@contextmanager
+def phase(name):
+    # times a block of a request, a no-op unless instrumentation is on
+    timings = g.get('phase_timings') if has_app_context() else None
+    if timings is None:
+        yield
+        return
+    start = perf_counter()
+    try:
+        yield
+    finally:
+        timings[name] = timings.get(name, 0.0) + perf_counter() - start
+
+
+class Metrics:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = Counter()
+        self.durations = {}
+        self.statements = Counter()
+        self.statement_seconds = Counter()
+        self.n_plus_one = Counter()
+        self.phase_seconds = Counter()
+        self.phase_count = Counter()
+
+    def observe(self, endpoint, method, status, duration, statements, statement_seconds, n_plus_one, phases):
+        with self._lock:
+            self.requests[(endpoint, method, status)] += 1
+            histogram = self.durations.get(endpoint)
+            if histogram is None:
+                # one slot per bucket plus +Inf, then the running sum
+                histogram = self.durations[endpoint] = [0] * (len(DURATION_BUCKETS) + 1) + [0.0]
+            histogram[bisect_left(DURATION_BUCKETS, duration)] += 1
+            histogram[-1] += duration
+            self.statements[endpoint] += statements
+            self.statement_seconds[endpoint] += statement_seconds
+            self.n_plus_one[endpoint] += n_plus_one
+            for name, seconds in phases.items():
+                self.phase_seconds[(endpoint, name)] += seconds
+                self.phase_count[(endpoint, name)] += 1
+
+    def render(self):
+        lines = []
+        with self._lock:
+            lines.append('# TYPE http_requests_total counter')
+            for (endpoint, method, status), value in sorted(self.requests.items()):
+                lines.append(f'http_requests_total{{endpoint="{endpoint}",method="{method}",status="{status}"}} {value}')
+            lines.append('# TYPE http_request_duration_seconds histogram')
+            for endpoint, histogram in sorted(self.durations.items()):
+                cumulative = 0
+                for bound, value in zip(DURATION_BUCKETS + ('+Inf',), histogram):
+                    cumulative += value
+                    lines.append(f'http_request_duration_seconds_bucket{{endpoint="{endpoint}",le="{bound}"}} {cumulative}')
+                lines.append(f'http_request_duration_seconds_sum{{endpoint="{endpoint}"}} {histogram[-1]:.6f}')
+                lines.append(f'http_request_duration_seconds_count{{endpoint="{endpoint}"}} {cumulative}')
+            lines.append('# TYPE db_statements_total counter')
+            for endpoint, value in sorted(self.statements.items()):
+                lines.append(f'db_statements_total{{endpoint="{endpoint}"}} {value}')
+            lines.append('# TYPE db_statement_seconds_total counter')
+            for endpoint, value in sorted(self.statement_seconds.items()):
+                lines.append(f'db_statement_seconds_total{{endpoint="{endpoint}"}} {value:.6f}')
+            lines.append('# TYPE db_n_plus_one_total counter')
+            for endpoint, value in sorted(self.n_plus_one.items()):
+                lines.append(f'db_n_plus_one_total{{endpoint="{endpoint}"}} {value}')
+            lines.append('# TYPE request_phase_seconds summary')
+            for (endpoint, name), value in sorted(self.phase_seconds.items()):
+                lines.append(f'request_phase_seconds_sum{{endpoint="{endpoint}",phase="{name}"}} {value:.6f}')
+                lines.append(f'request_phase_seconds_count{{endpoint="{endpoint}",phase="{name}"}} {self.phase_count[(endpoint, name)]}')
+        return '\n'.join(lines) + '\n'
+
+
+class SlowestProfiles:
+    # keeps the cProfile output of the `keep` slowest sampled requests on disk
+
+    def __init__(self, directory, keep, sample_rate):
+        self.directory = directory
+        self.keep = keep
+        self.sample_rate = sample_rate
+        self._heap = []
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+        # only one cProfile can be active per process
+        self._active = threading.Lock()
+
+    def start(self):
+        if random.random() >= self.sample_rate or not self._active.acquire(blocking=False):
+            return None
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # another profiler (a debugger, say) already owns the hook
+            self._active.release()
+            return None
+        return profiler
+
+    def discard(self, profiler):
+        profiler.disable()
+        self._active.release()
+
+    def finish(self, profiler, duration, method, path):
+        self.discard(profiler)
+        with self._lock:
+            if len(self._heap) >= self.keep and duration <= self._heap[0][0]:
+                return
+            os.makedirs(self.directory, exist_ok=True)
+            name = f'{duration * 1000:09.1f}ms-{method}-{path.strip("/").replace("/", "_") or "root"}-{next(self._counter)}.prof'
+            filename = os.path.join(self.directory, name)
+            profiler.dump_stats(filename)
+            heapq.heappush(self._heap, (duration, filename))
+            if len(self._heap) > self.keep:
+                _, dropped = heapq.heappop(self._heap)
+                if os.path.exists(dropped):
+                    os.remove(dropped)
+
+
+class Instrumentation:
+
+    def __init__(self, app, n_plus_one_threshold=5, profiles=None, authorize=None):
+        self.app = app
+        self.n_plus_one_threshold = n_plus_one_threshold
+        self.profiles = profiles
+        # called for /metrics, which is served only when it returns True
+        self.authorize = authorize
+        self.metrics = Metrics()
+
+    def install(self):
+        event.listen(Engine, 'before_cursor_execute', self._before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', self._after_cursor_execute)
+        self.app.before_request(self._before_request)
+        self.app.after_request(self._after_request)
+        self.app.teardown_request(self._teardown_request)
+        self.app.add_url_rule('/metrics', 'metrics', self._metrics_view)
+        return self
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if has_app_context() and g.get('sql_shapes') is not None:
+            conn.info.setdefault('instrumentation_start', []).append(perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if not has_app_context():
+            return
+        shapes = g.get('sql_shapes')
+        starts = conn.info.get('instrumentation_start')
+        if shapes is None or not starts:
+            return
+        g.sql_seconds += perf_counter() - starts.pop()
+        shapes[statement_shape(statement)] += 1
+
+    def _before_request(self):
+        g.request_start = perf_counter()
+        g.phase_timings = {}
+        g.sql_shapes = Counter()
+        g.sql_seconds = 0.0
+        g.profiler = self.profiles.start() if self.profiles else None
+
+    def _after_request(self, response):
+        start = g.get('request_start')
+        if start is None:
+            return response
+        duration = perf_counter() - start
+        if (profiler := g.pop('profiler', None)) is not None:
+            self.profiles.finish(profiler, duration, request.method, request.path)
+
+        endpoint = request.endpoint or 'unmatched'
+        shapes = g.sql_shapes
+        statements = sum(shapes.values())
+        repeated = [(shape, n) for shape, n in shapes.items() if n > self.n_plus_one_threshold]
+        for shape, n in repeated:
+            self.app.logger.warning('possible N+1 on %s %s: %d x %s', request.method, request.path, n, shape)
+        self.metrics.observe(endpoint, request.method, response.status_code, duration,
+                             statements, g.sql_seconds, len(repeated), g.phase_timings)
+
+        timings = [f'{name};dur={seconds * 1000:.2f}' for name, seconds in g.phase_timings.items()]
+        timings.append(f'db;dur={g.sql_seconds * 1000:.2f};desc="{statements} queries"')
+        if repeated:
+            timings.append(f'nplusone;desc="{len(repeated)} repeated statements"')
+        timings.append(f'total;dur={duration * 1000:.2f}')
+        response.headers['Server-Timing'] = ', '.join(timings)
+        # stop counting statements run after the response (session teardown, etc.)
+        g.sql_shapes = None
+        return response
+
+    def _teardown_request(self, exc):
+        # after_request is skipped when a view raises, the profiler must not stay on
+        if (profiler := g.pop('profiler', None)) is not None:
+            self.profiles.discard(profiler)
+        g.sql_shapes = None
+
+    def _metrics_view(self):
+        if self.authorize is not None and not self.authorize():
+            return {'message': '401: Not Authorized'}, 401
+        return Response(self.metrics.render(), mimetype='text/plain; version=0.0.4')
+
+
+def configure(app, authorize=None):
+    if not app.config.get('INSTRUMENTATION', False):
+        return None
+    profiles = None
+    if keep := app.config.get('PROFILE_SLOWEST', 0):
+        profiles = SlowestProfiles(app.config.get('PROFILE_DIR', 'profiles'), keep,
+                                   app.config.get('PROFILE_SAMPLE_RATE', 0.1))
+    return Instrumentation(app,
+                           n_plus_one_threshold=app.config.get('N_PLUS_ONE_THRESHOLD', 5),
+                           profiles=profiles,
+                           authorize=authorize).install()
@@ -0,0 +1,108 @@
+import threading
+import time
+from collections import OrderedDict
+
+from sqlalchemy import event, inspect, select
+from sqlalchemy.orm import Session
+
+from config import db
+from models import Household, User, join_code
+
+
+# identity lookups on the signup and login paths
+# user_name -> user id and household join code -> household id are kept in a small LRU,
+# so a repeat login is a primary key get and a repeat signup doesn't look the household
+# up at all. entries are dropped whenever a flush renames or deletes the user or
+# household, and expire after a TTL so a change made through another worker is picked
+# up. a cached user id is always checked against the row it loads.
+
+
+class LookupCache:
+
+    def __init__(self, max_entries=4096, ttl=300):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'invalidations': 0}
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] <= time.monotonic():
+                self._entries.pop(key, None)
+                self.stats['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats['hits'] += 1
+            return entry[0]
+
+    def set(self, key, value):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.stats['evictions'] += 1
+
+    def discard(self, keys):
+        with self._lock:
+            for key in keys:
+                if self._entries.pop(key, None) is not None:
+                    self.stats['invalidations'] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def listen(self):
+        event.listen(Session, 'after_flush', self._after_flush)
+
+    def _after_flush(self, db_session, flush_context):
+        keys = []
+        for obj in (*db_session.dirty, *db_session.deleted):
+            if isinstance(obj, User):
+                keys += [('user', name) for name in _values(obj, 'user_name')]
+            elif isinstance(obj, Household):
+                keys += [('household', code) for code in _values(obj, 'join_code_hash')]
+        if keys:
+            self.discard(keys)
+
+
+def _values(obj, key):
+    # the current value plus the one it replaced
+    history = inspect(obj).attrs[key].history
+    return {getattr(obj, key), *history.deleted} - {None}
+
+
+def user_by_name(cache, user_name):
+    user_id = cache.get(('user', user_name))
+    if user_id is not None:
+        user = db.session.get(User, user_id)
+        if user is not None and user.user_name == user_name:
+            return user
+        cache.discard([('user', user_name)])
+    user = User.query.filter(User.user_name == user_name).first()
+    if user is not None:
+        cache.set(('user', user_name), user.id)
+    return user
+
+
+def household_id_by_code(cache, name, key):
+    code = join_code(name, key)
+    household_id = cache.get(('household', code))
+    if household_id is not None:
+        return household_id
+    # the key itself is never stored, the digest is all there is to look up
+    household_id = db.session.execute(select(Household.id).where(Household.join_code_hash == code)).scalar()
+    if household_id is not None:
+        cache.set(('household', code), household_id)
+    return household_id
+
+
+def create_lookup_cache(app):
+    cache = LookupCache(app.config.get('LOOKUP_CACHE_SIZE', 4096), app.config.get('LOOKUP_CACHE_TTL', 300))
+    cache.listen()
+    return cache
@@ -0,0 +1,41 @@
+"""drop household_table.key, the join code is only kept as join_code_hash
+
+Revision ID: 2b7d4f9a1c68
+Revises: f1c8a3e6d259
+Create Date: 2026-10-18 21:12:47.905311
+
+"""
+import hashlib
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '2b7d4f9a1c68'
+down_revision = 'f1c8a3e6d259'
+branch_labels = None
+depends_on = None
+
+
+def _join_code(name, key):
+    # same digest as models.join_code
+    return hashlib.sha256(f'{name}\x00{key}'.encode('utf-8')).hexdigest()
+
+
+def upgrade():
+    # rows written around the listener (raw inserts) may not have their digest yet
+    bind = op.get_bind()
+    rows = bind.execute(sa.text('SELECT id, name, key FROM household_table WHERE join_code_hash IS NULL')).all()
+    if rows:
+        bind.execute(sa.text('UPDATE household_table SET join_code_hash = :code WHERE id = :id'),
+                     [{'id': household_id, 'code': _join_code(name, key)} for household_id, name, key in rows])
+
+    with op.batch_alter_table('household_table', schema=None) as batch_op:
+        batch_op.drop_column('key')
+
+
+def downgrade():
+    # the keys themselves are gone, the column comes back empty
+    with op.batch_alter_table('household_table', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('key', sa.String(), nullable=True))
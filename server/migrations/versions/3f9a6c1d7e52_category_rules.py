@@ -0,0 +1,51 @@
+"""add category rules and transactions.rules_version
+
+Revision ID: 3f9a6c1d7e52
+Revises: e7b3f0c25a84
+Create Date: 2026-10-18 11:40:12.904371
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f9a6c1d7e52'
+down_revision = 'e7b3f0c25a84'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('category_rule_table',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('match_type', sa.String(), nullable=False),
+    sa.Column('pattern', sa.String(), nullable=False),
+    sa.Column('min_amount_cents', sa.Integer(), nullable=True),
+    sa.Column('max_amount_cents', sa.Integer(), nullable=True),
+    sa.Column('priority', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=True),
+    sa.Column('household_id', sa.Integer(), nullable=True),
+    sa.Column('categories_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['categories_id'], ['categories_table.id'], name=op.f('fk_category_rule_table_categories_id_categories_table')),
+    sa.ForeignKeyConstraint(['household_id'], ['household_table.id'], name=op.f('fk_category_rule_table_household_id_household_table')),
+    sa.ForeignKeyConstraint(['user_id'], ['users_table.id'], name=op.f('fk_category_rule_table_user_id_users_table')),
+    sa.PrimaryKeyConstraint('id', name=op.f('pk_category_rule_table'))
+    )
+    with op.batch_alter_table('category_rule_table', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_category_rule_table_household_id'), ['household_id'], unique=False)
+        batch_op.create_index(batch_op.f('ix_category_rule_table_user_id'), ['user_id'], unique=False)
+
+    with op.batch_alter_table('transactions_table', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('rules_version', sa.String(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('transactions_table', schema=None) as batch_op:
+        batch_op.drop_column('rules_version')
+
+    with op.batch_alter_table('category_rule_table', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_category_rule_table_user_id'))
+        batch_op.drop_index(batch_op.f('ix_category_rule_table_household_id'))
+
+    op.drop_table('category_rule_table')
@@ -0,0 +1,64 @@
+"""add household_goal_summary_table, backfilled from goals_table
+
+Revision ID: 4d8f2b7e1a96
+Revises: b6e19d4a2c73
+Create Date: 2026-10-18 14:02:37.118604
+
+"""
+from datetime import date, datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4d8f2b7e1a96'
+down_revision = 'b6e19d4a2c73'
+branch_labels = None
+depends_on = None
+
+
+def _parse_deadline(value):
+    # same rules as goal_summary.parse_deadline
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return date.fromisoformat(value[:10])
+    except ValueError:
+        pass
+    try:
+        return datetime.strptime(value, '%m/%d/%Y').date()
+    except ValueError:
+        return None
+
+
+def upgrade():
+    summary = op.create_table('household_goal_summary_table',
+    sa.Column('household_id', sa.Integer(), nullable=False),
+    sa.Column('goals', sa.Integer(), nullable=False),
+    sa.Column('target_amount_cents', sa.Integer(), nullable=False),
+    sa.Column('current_amount_cents', sa.Integer(), nullable=False),
+    sa.Column('nearest_deadline', sa.Date(), nullable=True),
+    sa.ForeignKeyConstraint(['household_id'], ['household_table.id'], name=op.f('fk_household_goal_summary_table_household_id_household_table'), ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('household_id', name=op.f('pk_household_goal_summary_table'))
+    )
+
+    totals = {}
+    rows = op.get_bind().execute(sa.text(
+        'SELECT household_id, target_amount_cents, current_amount_cents, deadline '
+        'FROM goals_table WHERE household_id IS NOT NULL'))
+    for household_id, target, current, deadline in rows:
+        goals, target_sum, current_sum, nearest = totals.get(household_id, (0, 0, 0, None))
+        deadline = _parse_deadline(deadline) if current < target else None
+        if deadline is not None and (nearest is None or deadline < nearest):
+            nearest = deadline
+        totals[household_id] = (goals + 1, target_sum + target, current_sum + current, nearest)
+    if totals:
+        op.bulk_insert(summary, [{'household_id': household_id, 'goals': goals, 'target_amount_cents': target,
+                                  'current_amount_cents': current, 'nearest_deadline': nearest}
+                                 for household_id, (goals, target, current, nearest) in totals.items()])
+
+
+def downgrade():
+    op.drop_table('household_goal_summary_table')
@@ -0,0 +1,25 @@
+"""add composite index for login attempt lookups
+
+Revision ID: 5d2e8a1f9c3b
+Revises: cbfcee4f71a6
+Create Date: 2026-10-18 09:12:31.402117
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '5d2e8a1f9c3b'
+down_revision = 'cbfcee4f71a6'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('loggin_attempts_table', schema=None) as batch_op:
+        batch_op.create_index('ix_loggin_attempts_table_ip_date_time', ['ip_address', 'attempt_date', 'attempt_time'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('loggin_attempts_table', schema=None) as batch_op:
+        batch_op.drop_index('ix_loggin_attempts_table_ip_date_time')
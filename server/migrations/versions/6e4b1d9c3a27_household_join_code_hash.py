@@ -0,0 +1,45 @@
+"""add household_table.join_code_hash, replacing the (name, key) index
+
+Revision ID: 6e4b1d9c3a27
+Revises: c2f7a9d4e083
+Create Date: 2026-10-18 16:40:12.384106
+
+"""
+import hashlib
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '6e4b1d9c3a27'
+down_revision = 'c2f7a9d4e083'
+branch_labels = None
+depends_on = None
+
+
+def _join_code(name, key):
+    # same digest as models.join_code
+    return hashlib.sha256(f'{name}\x00{key}'.encode('utf-8')).hexdigest()
+
+
+def upgrade():
+    with op.batch_alter_table('household_table', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('join_code_hash', sa.String(length=64), nullable=True))
+
+    bind = op.get_bind()
+    rows = bind.execute(sa.text('SELECT id, name, key FROM household_table')).all()
+    if rows:
+        bind.execute(sa.text('UPDATE household_table SET join_code_hash = :code WHERE id = :id'),
+                     [{'id': household_id, 'code': _join_code(name, key)} for household_id, name, key in rows])
+
+    with op.batch_alter_table('household_table', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_household_table_join_code_hash'), ['join_code_hash'], unique=False)
+        batch_op.drop_index('ix_household_table_name_key')
+
+
+def downgrade():
+    with op.batch_alter_table('household_table', schema=None) as batch_op:
+        batch_op.create_index('ix_household_table_name_key', ['name', 'key'], unique=False)
+        batch_op.drop_index(batch_op.f('ix_household_table_join_code_hash'))
+        batch_op.drop_column('join_code_hash')
@@ -0,0 +1,27 @@
+"""add indexes for paginated transaction listing
+
+Revision ID: 8c05d4e1b6fa
+Revises: 3f9a6c1d7e52
+Create Date: 2026-10-18 12:15:38.227410
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '8c05d4e1b6fa'
+down_revision = '3f9a6c1d7e52'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('transactions_table', schema=None) as batch_op:
+        batch_op.create_index('ix_transactions_table_bank_date_id', ['bank_id', 'date', 'id'], unique=False)
+        batch_op.create_index('ix_transactions_table_categories_id', ['categories_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('transactions_table', schema=None) as batch_op:
+        batch_op.drop_index('ix_transactions_table_categories_id')
+        batch_op.drop_index('ix_transactions_table_bank_date_id')
@@ -0,0 +1,26 @@
+"""add household_table.version for dashboard ETags
+
+Revision ID: 9a3e5c7b2f18
+Revises: 4d8f2b7e1a96
+Create Date: 2026-10-18 14:48:09.530217
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9a3e5c7b2f18'
+down_revision = '4d8f2b7e1a96'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('household_table', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('version', sa.Integer(), server_default='0', nullable=False))
+
+
+def downgrade():
+    with op.batch_alter_table('household_table', schema=None) as batch_op:
+        batch_op.drop_column('version')
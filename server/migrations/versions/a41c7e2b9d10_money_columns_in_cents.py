@@ -0,0 +1,74 @@
+"""store money columns as integer cents and add monthly_expenses.month
+
+Revision ID: a41c7e2b9d10
+Revises: 5d2e8a1f9c3b
+Create Date: 2026-10-18 10:31:05.118264
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a41c7e2b9d10'
+down_revision = '5d2e8a1f9c3b'
+branch_labels = None
+depends_on = None
+
+
+MONEY_COLUMNS = {
+    'goals_table': ['target_amount', 'current_amount'],
+    'monthly_expenses_table': ['user_expected_income', 'actual_income', 'user_expected_monthly_expenses_total'],
+}
+
+
+def _dollars_to_cents(column):
+    return f"CAST(ROUND(CAST(REPLACE(REPLACE({column}, '$', ''), ',', '') AS REAL) * 100) AS INTEGER)"
+
+
+def upgrade():
+    for table, columns in MONEY_COLUMNS.items():
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            for column in columns:
+                batch_op.add_column(sa.Column(f'{column}_cents', sa.Integer(), nullable=True))
+        op.execute(f"UPDATE {table} SET " + ', '.join(
+            f'{column}_cents = {_dollars_to_cents(column)}' for column in columns))
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            for column in columns:
+                batch_op.alter_column(f'{column}_cents', existing_type=sa.Integer(), nullable=False)
+                batch_op.drop_column(column)
+
+    with op.batch_alter_table('expense_item_table', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('planned_amount_cents', sa.Integer(), nullable=True))
+    op.execute('UPDATE expense_item_table SET planned_amount_cents = planned_amount * 100')
+    with op.batch_alter_table('expense_item_table', schema=None) as batch_op:
+        batch_op.alter_column('planned_amount_cents', existing_type=sa.Integer(), nullable=False)
+        batch_op.drop_column('planned_amount')
+
+    with op.batch_alter_table('monthly_expenses_table', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('month', sa.Date(), nullable=True))
+        batch_op.create_index('ix_monthly_expenses_table_household_month', ['household_id', 'month'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('monthly_expenses_table', schema=None) as batch_op:
+        batch_op.drop_index('ix_monthly_expenses_table_household_month')
+        batch_op.drop_column('month')
+
+    with op.batch_alter_table('expense_item_table', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('planned_amount', sa.Integer(), nullable=True))
+    op.execute('UPDATE expense_item_table SET planned_amount = planned_amount_cents / 100')
+    with op.batch_alter_table('expense_item_table', schema=None) as batch_op:
+        batch_op.alter_column('planned_amount', existing_type=sa.Integer(), nullable=False)
+        batch_op.drop_column('planned_amount_cents')
+
+    for table, columns in MONEY_COLUMNS.items():
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            for column in columns:
+                batch_op.add_column(sa.Column(column, sa.String(), nullable=True))
+        op.execute(f"UPDATE {table} SET " + ', '.join(
+            f"{column} = printf('%.2f', {column}_cents / 100.0)" for column in columns))
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            for column in columns:
+                batch_op.alter_column(column, existing_type=sa.String(), nullable=False)
+                batch_op.drop_column(f'{column}_cents')
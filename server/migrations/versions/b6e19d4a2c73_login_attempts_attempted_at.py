@@ -0,0 +1,65 @@
+"""replace login attempt date/hour columns with an indexed UTC attempted_at
+
+Revision ID: b6e19d4a2c73
+Revises: 8c05d4e1b6fa
+Create Date: 2026-10-18 13:05:51.716230
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b6e19d4a2c73'
+down_revision = '8c05d4e1b6fa'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('loggin_attempts_table', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('attempted_at', sa.DateTime(), nullable=True))
+
+    # the old columns hold the app server's local date and hour, converted to UTC here.
+    # both branches read "local" as the zone the migration runs in: the migrating host's
+    # zone on sqlite, the session TimeZone on postgres (set PGTZ to the app
+    # server's zone if the database's default differs)
+    if op.get_bind().dialect.name == 'sqlite':
+        op.execute("UPDATE loggin_attempts_table SET attempted_at = "
+                   "datetime(substr(attempt_date, 1, 10) || ' ' || printf('%02d:00:00', attempt_time), 'utc')")
+    else:
+        op.execute("UPDATE loggin_attempts_table SET attempted_at = "
+                   "((CAST(substr(CAST(attempt_date AS VARCHAR), 1, 10) AS DATE) + attempt_time * interval '1 hour') "
+                   "AT TIME ZONE current_setting('TimeZone')) AT TIME ZONE 'UTC'")
+
+    with op.batch_alter_table('loggin_attempts_table', schema=None) as batch_op:
+        batch_op.alter_column('attempted_at', existing_type=sa.DateTime(), nullable=False)
+        batch_op.drop_index('ix_loggin_attempts_table_ip_date_time')
+        batch_op.drop_column('attempt_date')
+        batch_op.drop_column('attempt_time')
+        batch_op.create_index('ix_loggin_attempts_table_ip_attempted_at', ['ip_address', 'attempted_at'], unique=False)
+        batch_op.create_index('ix_loggin_attempts_table_attempted_at', ['attempted_at'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('loggin_attempts_table', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('attempt_date', sa.String(), nullable=True))
+        batch_op.add_column(sa.Column('attempt_time', sa.Integer(), nullable=True))
+
+    # back to local time, in the same zone the upgrade used
+    if op.get_bind().dialect.name == 'sqlite':
+        op.execute("UPDATE loggin_attempts_table SET "
+                   "attempt_date = date(attempted_at, 'localtime'), "
+                   "attempt_time = CAST(strftime('%H', attempted_at, 'localtime') AS INTEGER)")
+    else:
+        op.execute("UPDATE loggin_attempts_table SET "
+                   "attempt_date = CAST(CAST((attempted_at AT TIME ZONE 'UTC') AT TIME ZONE current_setting('TimeZone') AS DATE) AS VARCHAR), "
+                   "attempt_time = EXTRACT(HOUR FROM (attempted_at AT TIME ZONE 'UTC') AT TIME ZONE current_setting('TimeZone'))")
+
+    with op.batch_alter_table('loggin_attempts_table', schema=None) as batch_op:
+        batch_op.alter_column('attempt_date', existing_type=sa.String(), nullable=False)
+        batch_op.alter_column('attempt_time', existing_type=sa.Integer(), nullable=False)
+        batch_op.drop_index('ix_loggin_attempts_table_attempted_at')
+        batch_op.drop_index('ix_loggin_attempts_table_ip_attempted_at')
+        batch_op.drop_column('attempted_at')
+        batch_op.create_index('ix_loggin_attempts_table_ip_date_time', ['ip_address', 'attempt_date', 'attempt_time'], unique=False)
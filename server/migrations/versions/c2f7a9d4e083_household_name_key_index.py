@@ -0,0 +1,25 @@
+"""index household_table on (name, key) for household lookups
+
+Revision ID: c2f7a9d4e083
+Revises: 9a3e5c7b2f18
+Create Date: 2026-10-18 15:21:44.802913
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'c2f7a9d4e083'
+down_revision = '9a3e5c7b2f18'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('household_table', schema=None) as batch_op:
+        batch_op.create_index('ix_household_table_name_key', ['name', 'key'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('household_table', schema=None) as batch_op:
+        batch_op.drop_index('ix_household_table_name_key')
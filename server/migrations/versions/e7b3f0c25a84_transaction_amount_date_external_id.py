@@ -0,0 +1,32 @@
+"""add amount, date and external id to transactions
+
+Revision ID: e7b3f0c25a84
+Revises: a41c7e2b9d10
+Create Date: 2026-10-18 11:02:47.583920
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e7b3f0c25a84'
+down_revision = 'a41c7e2b9d10'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('transactions_table', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('external_id', sa.String(), nullable=True))
+        batch_op.add_column(sa.Column('amount_cents', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('date', sa.Date(), nullable=True))
+        batch_op.create_unique_constraint('uq_transactions_table_bank_id_external_id', ['bank_id', 'external_id'])
+
+
+def downgrade():
+    with op.batch_alter_table('transactions_table', schema=None) as batch_op:
+        batch_op.drop_constraint('uq_transactions_table_bank_id_external_id', type_='unique')
+        batch_op.drop_column('date')
+        batch_op.drop_column('amount_cents')
+        batch_op.drop_column('external_id')
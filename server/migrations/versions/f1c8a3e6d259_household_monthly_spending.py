@@ -0,0 +1,34 @@
+"""add household_monthly_spending_table
+
+Revision ID: f1c8a3e6d259
+Revises: 6e4b1d9c3a27
+Create Date: 2026-10-18 19:12:45.502917
+
+the table starts empty, fill it from the existing transactions with `flask backfill-spending`
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f1c8a3e6d259'
+down_revision = '6e4b1d9c3a27'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('household_monthly_spending_table',
+    sa.Column('household_id', sa.Integer(), nullable=False),
+    sa.Column('month', sa.Date(), nullable=False),
+    sa.Column('categories_id', sa.Integer(), nullable=False),
+    sa.Column('transactions', sa.Integer(), nullable=False),
+    sa.Column('amount_cents', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['household_id'], ['household_table.id'], name=op.f('fk_household_monthly_spending_table_household_id_household_table'), ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('household_id', 'month', 'categories_id', name=op.f('pk_household_monthly_spending_table'))
+    )
+
+
+def downgrade():
+    op.drop_table('household_monthly_spending_table')
@@ -1,11 +1,25 @@
-from sqlalchemy.orm import validates
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import validates, selectinload, joinedload
 from sqlalchemy.ext.associationproxy import association_proxy
 from sqlalchemy_serializer import SerializerMixin
 from sqlalchemy.ext.hybrid import hybrid_property
-from datetime import datetime
+from datetime import datetime, timezone
+from functools import cache
+import hashlib
 
 
-from config import db, bcrypt
+from config import db, hasher
+from money import to_cents
+
+
+def utcnow():
+    # naive UTC, evaluated per row (not once at import)
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def join_code(name, key):
+    # what members type to join a household, stored and looked up only as this digest
+    return hashlib.sha256(f'{name}\x00{key}'.encode('utf-8')).hexdigest()
 
 
 class Household(db.Model, SerializerMixin):
@@ -14,8 +28,13 @@ class Household(db.Model, SerializerMixin):
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String, nullable=False)
-    key = db.Column(db.String, nullable=False)
-    key_date = db.Column(db.DateTime, default=datetime.now())
+    # the key is never stored, only join_code(name, key), set by the listener below
+    # from the key given to the constructor (or assigned) before the flush
+    _key = None
+    join_code_hash = db.Column(db.String(64), index=True)
+    key_date = db.Column(db.DateTime, default=utcnow)
+    # bumped by dashboard.py whenever the household or anything under it changes
+    version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
 
     # relationships
     goals = db.relationship('Goals', back_populates='household',
@@ -28,10 +47,33 @@ class Household(db.Model, SerializerMixin):
     # serialize rule
     serialize_rules = ['-goals.household', '-monthly_expenses.household', '-user.household']
 
+    @property
+    def key(self):
+        return self._key
+
+    @key.setter
+    def key(self, value):
+        self._key = value
+        # a new key has to reach the flush even when nothing else changed,
+        # the listener then works the digest out again from the final name
+        if value is not None:
+            self.join_code_hash = join_code(self.name, value)
+
     def __repr__(self):
         return f'<Household {self.id}>'
 
 
+@event.listens_for(Household, 'before_insert')
+@event.listens_for(Household, 'before_update')
+def _set_join_code(mapper, connection, household):
+    if household.key is not None:
+        household.join_code_hash = join_code(household.name, household.key)
+        household.key = None
+    elif household.join_code_hash is None or inspect(household).attrs.name.history.has_changes():
+        # the join code covers the name, it can't be recomputed without the key
+        raise ValueError('a household needs its key to set or change its join code')
+
+
 class User(db.Model, SerializerMixin):
     # using specific table names for now
     __tablename__ = 'users_table'
@@ -68,15 +110,16 @@ class User(db.Model, SerializerMixin):
 
     @password_hash.setter
     def password_hash(self, password):
-        print(password)
-        # utf-8 encoding and decoding is required in python 3
-        password_hash = bcrypt.generate_password_hash(
-            password.encode('utf-8'))
-        self._password_hash = password_hash.decode('utf-8')
+        # hashing runs in the shared pool, raises passwords.HashingBusy when it's saturated
+        self._password_hash = hasher.hash(password)
 
     def authenticate(self, password):
-        return bcrypt.check_password_hash(
-            self._password_hash, password.encode('utf-8'))
+        if not hasher.check(self._password_hash, password):
+            return False
+        # transparently upgrade the hash when BCRYPT_LOG_ROUNDS has changed
+        if hasher.needs_rehash(self._password_hash):
+            self.password_hash = password
+        return True
     
     def __repr__(self):
         return f'<User {self.id}>'
@@ -84,12 +127,16 @@ class User(db.Model, SerializerMixin):
 class LoginAttempts(db.Model, SerializerMixin):
     # using specific table names for now
     __tablename__ = 'loggin_attempts_table'
+    __table_args__ = (
+        # sliding window per ip, and date-based pruning
+        db.Index('ix_loggin_attempts_table_ip_attempted_at', 'ip_address', 'attempted_at'),
+        db.Index('ix_loggin_attempts_table_attempted_at', 'attempted_at'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     ip_address = db.Column(db.String, nullable=False)
     success = db.Column(db.Boolean, nullable=False)
-    attempt_date = db.Column(db.String, nullable=False, default=datetime.today().date())
-    attempt_time = db.Column(db.Integer, nullable=False, default=datetime.now().time().hour)
+    attempted_at = db.Column(db.DateTime, nullable=False, default=utcnow)
 
     def __repr__(self):
         return f'<Login Attempts {self.id}>'
@@ -122,9 +169,22 @@ class Bank(db.Model, SerializerMixin):
 class Transactions(db.Model, SerializerMixin):
     # using specific table names for now
     __tablename__ = 'transactions_table'
+    __table_args__ = (
+        # ids from the aggregator, used to skip transactions we've already imported
+        db.UniqueConstraint('bank_id', 'external_id', name='uq_transactions_table_bank_id_external_id'),
+        # keyset pagination of a bank's history, newest first
+        db.Index('ix_transactions_table_bank_date_id', 'bank_id', 'date', 'id'),
+        db.Index('ix_transactions_table_categories_id', 'categories_id'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     transaction_description = db.Column(db.String, nullable=False)
+    external_id = db.Column(db.String)
+    # positive amounts are money leaving the account
+    amount_cents = db.Column(db.Integer)
+    date = db.Column(db.Date)
+    # version of the category rules that set categories_id, null when set by hand
+    rules_version = db.Column(db.String)
 
     # foreign keys
     bank_id = db.Column(db.Integer, db.ForeignKey("bank_table.id"))
@@ -164,6 +224,37 @@ class Categories(db.Model, SerializerMixin):
         return f'<Categories {self.id}>'
 
 
+class CategoryRule(db.Model, SerializerMixin):
+    # using specific table names for now
+    __tablename__ = 'category_rule_table'
+
+    id = db.Column(db.Integer, primary_key=True)
+    # 'substring' or 'regex', matched case-insensitively against transaction_description
+    match_type = db.Column(db.String, nullable=False)
+    pattern = db.Column(db.String, nullable=False)
+    min_amount_cents = db.Column(db.Integer)
+    max_amount_cents = db.Column(db.Integer)
+    # lower numbers win
+    priority = db.Column(db.Integer, nullable=False, default=100)
+
+    # foreign keys, a rule belongs to either a user or a whole household
+    user_id = db.Column(db.Integer, db.ForeignKey("users_table.id"), index=True)
+    household_id = db.Column(db.Integer, db.ForeignKey("household_table.id"), index=True)
+    categories_id = db.Column(db.Integer, db.ForeignKey("categories_table.id"), nullable=False)
+
+    # relationships
+    categories = db.relationship('Categories')
+
+    @validates('match_type')
+    def validate_match_type(self, key, value):
+        if value not in ('substring', 'regex'):
+            raise ValueError('match_type must be substring or regex')
+        return value
+
+    def __repr__(self):
+        return f'<Category Rule {self.id}>'
+
+
 class Goals(db.Model, SerializerMixin):
     # using specific table names for now
     __tablename__ = 'goals_table'
@@ -172,13 +263,14 @@ class Goals(db.Model, SerializerMixin):
     household_budget = db.Column(db.Boolean, nullable=False)
     name = db.Column(db.String, nullable=False)
     description = db.Column(db.String, nullable=False)
-    target_amount = db.Column(db.String, nullable=False)
-    current_amount = db.Column(db.String, nullable=False)
-    deadline = db.Column(db.String, nullable=False)
+    # active_history loads the old value before a change, goal_summary needs it for the delta
+    target_amount_cents = db.column_property(db.Column(db.Integer, nullable=False), active_history=True)
+    current_amount_cents = db.column_property(db.Column(db.Integer, nullable=False), active_history=True)
+    deadline = db.column_property(db.Column(db.String, nullable=False), active_history=True)
 
     # foreign keys
     user_id = db.Column(db.Integer, db.ForeignKey("users_table.id"))
-    household_id = db.Column(db.Integer, db.ForeignKey("household_table.id"))
+    household_id = db.column_property(db.Column(db.Integer, db.ForeignKey("household_table.id")), active_history=True)
 
     # relationships
     user = db.relationship('User', back_populates='goals')
@@ -187,19 +279,59 @@ class Goals(db.Model, SerializerMixin):
     # serialize rule
     serialize_rules = ['-user.goals', '-household.goals']
 
+    @validates('target_amount_cents', 'current_amount_cents')
+    def validate_amount(self, key, value):
+        return to_cents(value)
+
     def __repr__(self):
         return f'<Goals {self.id}>'
 
+
+class HouseholdGoalSummary(db.Model):
+    # one row per household, kept up to date by the Goals mapper events in goal_summary.py
+    __tablename__ = 'household_goal_summary_table'
+
+    household_id = db.Column(db.Integer, db.ForeignKey("household_table.id", ondelete='CASCADE'), primary_key=True)
+    goals = db.Column(db.Integer, nullable=False, default=0)
+    target_amount_cents = db.Column(db.Integer, nullable=False, default=0)
+    current_amount_cents = db.Column(db.Integer, nullable=False, default=0)
+    # earliest deadline among goals that haven't reached their target
+    nearest_deadline = db.Column(db.Date)
+
+    def __repr__(self):
+        return f'<Household Goal Summary {self.household_id}>'
+
+
+class HouseholdMonthlySpending(db.Model):
+    # transaction count and total per household, month and category, kept up to date by spending.py
+    __tablename__ = 'household_monthly_spending_table'
+
+    household_id = db.Column(db.Integer, db.ForeignKey("household_table.id", ondelete='CASCADE'), primary_key=True)
+    # first day of the month
+    month = db.Column(db.Date, primary_key=True)
+    # 0 for uncategorized transactions, a key column can't be NULL
+    categories_id = db.Column(db.Integer, primary_key=True)
+    transactions = db.Column(db.Integer, nullable=False, default=0)
+    amount_cents = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<Household Monthly Spending {self.household_id} {self.month} {self.categories_id}>'
+
       
 class MonthlyExpenses(db.Model, SerializerMixin):
     # using specific table names for now
     __tablename__ = 'monthly_expenses_table'
+    __table_args__ = (
+        db.Index('ix_monthly_expenses_table_household_month', 'household_id', 'month'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
+    # first day of the month the budget is for
+    month = db.Column(db.Date)
     is_household_budget = db.Column(db.Boolean, nullable=False)
-    user_expected_income = db.Column(db.String, nullable=False)
-    actual_income = db.Column(db.String, nullable=False)
-    user_expected_monthly_expenses_total = db.Column(db.String, nullable=False)
+    user_expected_income_cents = db.Column(db.Integer, nullable=False)
+    actual_income_cents = db.Column(db.Integer, nullable=False)
+    user_expected_monthly_expenses_total_cents = db.Column(db.Integer, nullable=False)
     is_fluctuating_income = db.Column(db.Boolean, nullable=False)
 
     # foreign keys
@@ -217,6 +349,10 @@ class MonthlyExpenses(db.Model, SerializerMixin):
                        '-household.monthly_expenses',
                        '-expense_items.monthly_expenses']
 
+    @validates('user_expected_income_cents', 'actual_income_cents', 'user_expected_monthly_expenses_total_cents')
+    def validate_amount(self, key, value):
+        return to_cents(value)
+
     def __repr__(self):
         return f'<Monthly Expenses {self.id}>'
 
@@ -228,7 +364,7 @@ class ExpenseItem(db.Model, SerializerMixin):
     id = db.Column(db.Integer, primary_key=True)
     item_name = db.Column(db.String, nullable=False)
     item_desc = db.Column(db.String)
-    planned_amount = db.Column(db.Integer, nullable=False)
+    planned_amount_cents = db.Column(db.Integer, nullable=False)
 
     # foreign keys
     monthly_expenses_id = db.Column(
@@ -244,5 +380,40 @@ class ExpenseItem(db.Model, SerializerMixin):
     serialize_rules = ['-monthly_expenses.expense_items',
                        '-categories.expense_items']
 
+    @validates('planned_amount_cents')
+    def validate_amount(self, key, value):
+        return to_cents(value)
+
     def __repr__(self):
-        return f'<Expense Item {self.id}>'
\ No newline at end of file
+        return f'<Expense Item {self.id}>'
+
+
+# loader profiles
+# named sets of eager-loading options, picked per endpoint so a fetch followed by
+# serialization costs a fixed number of round trips instead of one per relationship.
+# built on first use, creating loader options configures every mapper, which is
+# startup time a worker that never loads a profile shouldn't pay.
+# usage: User.query.options(*loader_profile(User, 'full'))
+@cache
+def _loader_profiles():
+    return {
+        (User, 'summary'): (),
+        (User, 'full'): (
+            selectinload(User.bank).selectinload(Bank.transactions).joinedload(Transactions.categories),
+            selectinload(User.goals),
+            selectinload(User.monthly_expenses).selectinload(MonthlyExpenses.expense_items),
+            joinedload(User.household),
+        ),
+        (Household, 'members'): (
+            selectinload(Household.user),
+            selectinload(Household.goals),
+            selectinload(Household.monthly_expenses).selectinload(MonthlyExpenses.expense_items),
+        ),
+        (Bank, 'transactions'): (
+            selectinload(Bank.transactions).joinedload(Transactions.categories),
+        ),
+    }
+
+
+def loader_profile(model, name):
+    return _loader_profiles()[(model, name)]
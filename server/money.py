@@ -0,0 +1,43 @@
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+
+
+# money is stored as integer cents so totals can be summed in SQL
+# ints are taken as cents already; strings, floats and Decimals are dollar amounts
+
+# no amount comes close to 10**15 dollars
+MAX_DIGITS = 15
+
+
+def _decimal(value, text):
+    if value is None or isinstance(value, bool):
+        raise ValueError(f'Invalid amount: {value!r}')
+    try:
+        amount = Decimal(text)
+    except InvalidOperation:
+        raise ValueError(f'Invalid amount: {value!r}')
+    # Decimal parses "Infinity" and "NaN", neither is an amount. the size check keeps
+    # int() from building a number with a billion digits out of "1e999999999"
+    if not amount.is_finite() or amount.adjusted() > MAX_DIGITS:
+        raise ValueError(f'Invalid amount: {value!r}')
+    return amount
+
+
+def to_cents(value):
+    if isinstance(value, int) and not isinstance(value, bool):
+        return value
+    dollars = _decimal(value, str(value).replace('$', '').replace(',', '').strip())
+    return int((dollars * 100).quantize(Decimal('1'), rounding=ROUND_HALF_UP))
+
+
+def whole_cents(value):
+    # an amount that is already in cents, which must be a whole number
+    if isinstance(value, int) and not isinstance(value, bool):
+        return value
+    cents = _decimal(value, str(value).strip())
+    if cents != cents.to_integral_value():
+        raise ValueError(f'Amount in cents must be a whole number: {value!r}')
+    return int(cents)
+
+
+def to_dollars(cents):
+    return None if cents is None else cents / 100
@@ -0,0 +1,133 @@
+import os
+import threading
+from concurrent.futures import BrokenExecutor, TimeoutError
+
+import bcrypt as _bcrypt
+
+
+# password hashing service
+# bcrypt runs in a bounded process pool so a burst of logins can't pin every
+# request worker. once max_pending jobs are queued new requests fail fast with
+# HashingBusy, which the views turn into a 503. a pool whose worker died (OOM,
+# SIGKILL) is broken for good, so it's replaced by a fresh one on the next job.
+
+
+class HashingBusy(Exception):
+    pass
+
+
+def _hash(password, rounds):
+    return _bcrypt.hashpw(password, _bcrypt.gensalt(rounds)).decode('utf-8')
+
+
+def _check(password_hash, password):
+    try:
+        return _bcrypt.checkpw(password, password_hash.encode('utf-8'))
+    except ValueError:
+        return False
+
+
+class PasswordHasher:
+
+    def __init__(self, rounds=12, workers=None, max_pending=32, timeout=10):
+        self.rounds = rounds
+        # workers=0 hashes inline on the calling thread (handy for seeding and the shell)
+        self.workers = os.cpu_count() if workers is None else workers
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._pool = None
+        self._pool_lock = threading.Lock()
+
+    def _get_pool(self):
+        if self._pool is None:
+            with self._pool_lock:
+                if self._pool is None:
+                    # imported here, it's a noticeable part of startup
+                    from concurrent.futures import ProcessPoolExecutor
+                    self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        return self._pool
+
+    def _discard_pool(self, pool):
+        # only the broken pool, another thread may already have started its replacement
+        with self._pool_lock:
+            if self._pool is pool:
+                self._pool = None
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    def _submit(self, pool, fn, *args):
+        # the slot is held until the job itself finishes, not until the caller stops
+        # waiting, so jobs that timed out still count against max_pending
+        try:
+            future = pool.submit(fn, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def _run(self, fn, *args):
+        if not self.workers:
+            return fn(*args)
+        # one retry on a fresh pool if the current one turns out to be broken
+        for _ in range(2):
+            if not self._slots.acquire(blocking=False):
+                raise HashingBusy()
+            pool = self._get_pool()
+            try:
+                return self._submit(pool, fn, *args).result(timeout=self.timeout)
+            except TimeoutError:
+                raise HashingBusy()
+            except BrokenExecutor:
+                self._discard_pool(pool)
+        raise HashingBusy()
+
+    def hash(self, password):
+        return self._run(_hash, password.encode('utf-8'), self.rounds)
+
+    def hash_many(self, passwords):
+        # bulk provisioning. jobs go to the pool one wave (one per worker) at a time,
+        # so a login submitted meanwhile waits behind at most one wave, not the whole batch.
+        # every job takes a slot like a login does, waiting up to the timeout for one
+        encoded = [password.encode('utf-8') for password in passwords]
+        if not self.workers:
+            return [_hash(password, self.rounds) for password in encoded]
+        hashes = []
+        pool = self._get_pool()
+        try:
+            for i in range(0, len(encoded), self.workers):
+                wave = []
+                for password in encoded[i:i + self.workers]:
+                    if not self._slots.acquire(timeout=self.timeout):
+                        raise HashingBusy()
+                    wave.append(self._submit(pool, _hash, password, self.rounds))
+                hashes.extend(future.result(timeout=self.timeout) for future in wave)
+        except TimeoutError:
+            raise HashingBusy()
+        except BrokenExecutor:
+            # the batch isn't retried, the caller gets a 503 and the next job a fresh pool
+            self._discard_pool(pool)
+            raise HashingBusy()
+        return hashes
+
+    def check(self, password_hash, password):
+        return self._run(_check, password_hash, password.encode('utf-8'))
+
+    def needs_rehash(self, password_hash):
+        # bcrypt hashes look like $2b$12$..., the second field is the cost factor
+        try:
+            return int(password_hash.split('$')[2]) != self.rounds
+        except (IndexError, ValueError):
+            return True
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+            self._pool = None
+
+
+def create_hasher(app):
+    workers = app.config.get('PASSWORD_HASH_WORKERS')
+    return PasswordHasher(rounds=app.config.get('BCRYPT_LOG_ROUNDS', 12),
+                          workers=workers,
+                          max_pending=app.config.get('PASSWORD_HASH_MAX_PENDING', 32),
+                          timeout=app.config.get('PASSWORD_HASH_TIMEOUT', 10))
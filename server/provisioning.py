@@ -0,0 +1,178 @@
+import json
+import os
+
+import click
+from sqlalchemy import insert, select
+
+import dashboard
+import two_factor
+from config import db, hasher
+from ingest import read_csv, read_ndjson
+from models import Household, User, join_code
+
+
+# bulk onboarding of users and households
+# a batch is validated up front (required fields, duplicate and taken user names,
+# households that don't exist) with a fixed number of queries, then every valid row's
+# password is hashed across the hashing pool, TOTP secrets are generated in one go,
+# and households and users go in with one multi-row INSERT each, in a single
+# transaction. invalid rows are reported by row number and skipped.
+#
+# a member looks like
+#   {"user_name": "jdoe", "password": "...", "first_name": "Jane", "last_name": "Doe",
+#    "email": "jdoe@example.com", "date_of_birth": "1/1/1990",
+#    "household_name": "Doe Family", "key": "secret", "create_household": false}
+# with create_household the household is created if no household has that name and key,
+# and the first member listed for it becomes its admin.
+
+REQUIRED = ('user_name', 'password', 'first_name', 'last_name', 'email', 'date_of_birth', 'household_name', 'key')
+
+MAX_REPORTED_ERRORS = 100
+
+
+def _truthy(value):
+    return value is True or str(value).strip().lower() in ('1', 'true', 'yes', 'y')
+
+
+def _find_households(pairs):
+    # one query for every (name, key) pair in the batch, served by ix_household_table_join_code_hash
+    found = {}
+    codes = {join_code(name, key): (name, key) for name, key in pairs}
+    ordered = sorted(codes)
+    for i in range(0, len(ordered), 500):
+        rows = db.session.execute(select(Household.id, Household.join_code_hash)
+                                  .where(Household.join_code_hash.in_(ordered[i:i + 500])))
+        for household_id, code in rows:
+            found.setdefault(codes[code], household_id)
+    return found
+
+
+def _taken_user_names(user_names):
+    taken = set()
+    user_names = sorted(user_names)
+    for i in range(0, len(user_names), 500):
+        taken.update(db.session.execute(select(User.user_name)
+                                        .where(User.user_name.in_(user_names[i:i + 500]))).scalars())
+    return taken
+
+
+def provision(members, dry_run=False):
+    result = {'received': 0, 'created': 0, 'households_created': 0, 'rejected': 0, 'errors': [], 'users': []}
+    errors = {}
+    rows = []
+    for number, member in enumerate(members, start=1):
+        result['received'] += 1
+        if not isinstance(member, dict):
+            errors[number] = 'expected an object'
+            continue
+        member = {k: (v.strip() if isinstance(v, str) else v) for k, v in member.items()}
+        if missing := [field for field in REQUIRED if not member.get(field)]:
+            errors[number] = f'missing {", ".join(missing)}'
+            continue
+        if wrong := [field for field in REQUIRED if not isinstance(member[field], str)]:
+            errors[number] = f'{", ".join(wrong)} must be text'
+            continue
+        rows.append((number, member))
+
+    seen = {}
+    for number, member in rows:
+        if member['user_name'] in seen:
+            errors[number] = f'user_name also used on row {seen[member["user_name"]]}'
+        else:
+            seen[member['user_name']] = number
+    taken = _taken_user_names(seen)
+    for number, member in rows:
+        if member['user_name'] in taken:
+            errors[number] = 'user_name already exists'
+
+    pairs = {(member['household_name'], member['key']) for number, member in rows if number not in errors}
+    households = _find_households(pairs)
+    new_households = {}
+    for number, member in rows:
+        pair = (member['household_name'], member['key'])
+        if number in errors or pair in households:
+            continue
+        if _truthy(member.get('create_household')):
+            new_households.setdefault(pair, number)
+        elif pair not in new_households:
+            errors[number] = 'household not found'
+
+    valid = [(number, member) for number, member in rows if number not in errors]
+    result['rejected'] = len(errors)
+    result['errors'] = [{'row': number, 'error': error} for number, error in sorted(errors.items())[:MAX_REPORTED_ERRORS]]
+    if dry_run or not valid:
+        return result
+
+    hashes = hasher.hash_many([member['password'] for _, member in valid])
+    secrets = two_factor.createNewURIs([member['user_name'] for _, member in valid])
+    try:
+        if new_households:
+            codes = {join_code(name, key): (name, key) for name, key in new_households}
+            created = db.session.execute(
+                insert(Household).returning(Household.id, Household.join_code_hash),
+                [{'name': name, 'join_code_hash': code} for code, (name, key) in codes.items()])
+            for household_id, code in created:
+                households[codes[code]] = household_id
+        users = [{'user_name': member['user_name'],
+                  '_password_hash': password_hash,
+                  'admin': new_households.get((member['household_name'], member['key'])) == number,
+                  'first_name': member['first_name'],
+                  'last_name': member['last_name'],
+                  'email': member['email'],
+                  'date_of_birth': member['date_of_birth'],
+                  'OTPkey': key,
+                  'household_id': households[(member['household_name'], member['key'])]}
+                 for (number, member), password_hash, (key, _) in zip(valid, hashes, secrets)]
+        ids = db.session.execute(insert(User).returning(User.id, sort_by_parameter_order=True), users).scalars().all()
+        joined = {user['household_id'] for user in users} - {households[pair] for pair in new_households}
+        if joined:
+            dashboard.bump(db.session.connection(), household_ids=list(joined))
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    result['created'] = len(users)
+    result['households_created'] = len(new_households)
+    result['users'] = [{'row': number, 'id': user_id, 'user_name': user['user_name'],
+                        'household_id': user['household_id'], 'admin': user['admin'], 'otp_uri': uri}
+                       for (number, _), user_id, user, (_, uri) in zip(valid, ids, users, secrets)]
+    return result
+
+
+def read_members(stream, fmt):
+    if fmt == 'csv':
+        return read_csv(stream)
+    if fmt == 'ndjson':
+        return read_ndjson(stream)
+    data = json.load(stream)
+    members = data.get('members', []) if isinstance(data, dict) else data
+    if not isinstance(members, list) or not all(isinstance(member, dict) for member in members):
+        raise ValueError('members must be a list of objects')
+    return members
+
+
+def register_cli(app):
+
+    @app.cli.command('provision-members')
+    @click.argument('path', type=click.File('rb'))
+    @click.option('--format', 'fmt', type=click.Choice(['csv', 'json', 'ndjson']), default=None,
+                  help='defaults to the file extension')
+    @click.option('--dry-run', is_flag=True, help='validate only, create nothing')
+    @click.option('--output', type=click.File('w'), default=None,
+                  help='write each created user (with their otp uri) here as NDJSON')
+    @click.option('--qr-dir', type=click.Path(file_okay=False), default=None,
+                  help='also save a QR code PNG per created user (needs qrcode)')
+    def provision_command(path, fmt, dry_run, output, qr_dir):
+        """Create users (and households) in bulk from a CSV/JSON member list."""
+        fmt = fmt or os.path.splitext(path.name)[1].lstrip('.').lower() or 'json'
+        result = provision(read_members(path, fmt), dry_run=dry_run)
+        users = result.pop('users')
+        if output:
+            for user in users:
+                output.write(json.dumps(user) + '\n')
+        if qr_dir and users:
+            import qrcode
+            os.makedirs(qr_dir, exist_ok=True)
+            for user in users:
+                qrcode.make(user['otp_uri']).save(os.path.join(qr_dir, f'{user["user_name"]}.png'))
+        click.echo(json.dumps(result))
@@ -0,0 +1,39 @@
+from contextlib import contextmanager
+
+from sqlalchemy import event
+
+
+# counts the SQL statements sent to an engine, for checking that an endpoint
+# stays within a fixed number of round trips
+#
+#   with count_queries(db.engine) as queries:
+#       client.get('/check_session')
+#   assert len(queries) <= 2, queries
+
+
+class QueryLog(list):
+
+    def __str__(self):
+        return '\n'.join(self)
+
+
+@contextmanager
+def count_queries(engine):
+    queries = QueryLog()
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        queries.append(statement)
+
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield queries
+    finally:
+        event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+
+
+@contextmanager
+def assert_max_queries(engine, limit):
+    with count_queries(engine) as queries:
+        yield queries
+    if len(queries) > limit:
+        raise AssertionError(f'expected at most {limit} queries, got {len(queries)}:\n{queries}')
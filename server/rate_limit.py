@@ -0,0 +1,184 @@
+import sqlite3
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+
+from sqlalchemy import func
+
+
+# sliding-window login limiter
+# every login attempt is recorded against the caller's ip, and every failed one against
+# the user_name it tried; an attempt is rejected once either key has hit the limit
+# inside the window. successful logins don't count against the user_name, so the
+# owner's own logins never use up the limit.
+# rejected attempts are not recorded, so they cost one lookup per key and no ORM work.
+
+
+class MemoryBackend:
+    # per-process backend, one deque of timestamps per key
+
+    def __init__(self, max_attempts):
+        self.max_attempts = max_attempts
+        self._hits = {}
+        self._lock = threading.Lock()
+        self._last_sweep = time.monotonic()
+
+    def _trim(self, hits, now, window):
+        cutoff = now - window
+        while hits and hits[0] <= cutoff:
+            hits.popleft()
+
+    def count(self, key, now, window):
+        with self._lock:
+            hits = self._hits.get(key)
+            if not hits:
+                return 0
+            self._trim(hits, now, window)
+            return len(hits)
+
+    def hit(self, key, now, window):
+        with self._lock:
+            hits = self._hits.get(key)
+            if hits is None:
+                # the deque never needs more than max_attempts entries
+                hits = self._hits[key] = deque(maxlen=self.max_attempts)
+            self._trim(hits, now, window)
+            hits.append(now)
+            self._sweep(now, window)
+
+    def _sweep(self, now, window):
+        # drop idle keys so the table doesn't grow with every ip we have ever seen
+        if now - self._last_sweep < window:
+            return
+        self._last_sweep = now
+        cutoff = now - window
+        for key in [k for k, v in self._hits.items() if not v or v[-1] <= cutoff]:
+            del self._hits[key]
+
+    def reset(self):
+        with self._lock:
+            self._hits.clear()
+
+
+class SQLiteBackend:
+    # shared backend for multi-worker deployments
+    # counts are kept in fixed buckets (like a redis INCR + EXPIRE per bucket),
+    # so the window is approximated to bucket_seconds precision
+
+    def __init__(self, path, bucket_seconds=60):
+        self.path = path
+        self.bucket_seconds = bucket_seconds
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS rate_limit_hits ('
+                         'key TEXT NOT NULL, bucket INTEGER NOT NULL, hits INTEGER NOT NULL, '
+                         'PRIMARY KEY (key, bucket)) WITHOUT ROWID')
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def _bucket(self, now):
+        return int(now // self.bucket_seconds)
+
+    def count(self, key, now, window):
+        first = self._bucket(now - window) + 1
+        row = self._connect().execute(
+            'SELECT COALESCE(SUM(hits), 0) FROM rate_limit_hits WHERE key = ? AND bucket >= ?',
+            (key, first)).fetchone()
+        return row[0]
+
+    def hit(self, key, now, window):
+        bucket = self._bucket(now)
+        conn = self._connect()
+        conn.execute('INSERT INTO rate_limit_hits (key, bucket, hits) VALUES (?, ?, 1) '
+                     'ON CONFLICT (key, bucket) DO UPDATE SET hits = hits + 1',
+                     (key, bucket))
+        # prune expired buckets for this key while we're here
+        conn.execute('DELETE FROM rate_limit_hits WHERE key = ? AND bucket <= ?',
+                     (key, self._bucket(now - window)))
+
+    def reset(self):
+        self._connect().execute('DELETE FROM rate_limit_hits')
+
+
+class DatabaseBackend:
+    # fallback that asks the LoginAttempts table with a single COUNT
+    # only ip keys can be answered here, since the table has no user_name column.
+    # only committed rows are counted: with AUDIT_ASYNC the attempts still queued in the
+    # audit writer (up to AUDIT_FLUSH_INTERVAL old) are not seen, so a fast burst can get
+    # past the limit. use the memory or sqlite backend where that matters
+
+    def count(self, key, now, window):
+        from config import db
+        from models import LoginAttempts
+
+        kind, _, value = key.partition(':')
+        if kind != 'ip':
+            return 0
+        start = datetime.fromtimestamp(now - window, timezone.utc).replace(tzinfo=None)
+        return db.session.query(func.count(LoginAttempts.id)).filter(
+            LoginAttempts.ip_address == value,
+            LoginAttempts.attempted_at > start).scalar()
+
+    def hit(self, key, now, window):
+        # the LoginAttempts row written by the login view is the record
+        pass
+
+    def reset(self):
+        pass
+
+
+class LoginRateLimiter:
+
+    def __init__(self, backend, max_attempts=4, window_seconds=3 * 60 * 60):
+        self.backend = backend
+        self.max_attempts = max_attempts
+        self.window_seconds = window_seconds
+
+    def _keys(self, ip_address, user_name):
+        keys = [f'ip:{ip_address}']
+        if user_name:
+            keys.append(f'user:{user_name.lower()}')
+        return keys
+
+    def is_limited(self, ip_address, user_name=None, now=None):
+        now = time.time() if now is None else now
+        return any(self.backend.count(key, now, self.window_seconds) >= self.max_attempts
+                   for key in self._keys(ip_address, user_name))
+
+    def record(self, ip_address, now=None):
+        # every attempt, before the password is checked
+        now = time.time() if now is None else now
+        self.backend.hit(f'ip:{ip_address}', now, self.window_seconds)
+
+    def record_failure(self, user_name, now=None):
+        now = time.time() if now is None else now
+        if user_name:
+            self.backend.hit(f'user:{user_name.lower()}', now, self.window_seconds)
+
+    def reset(self):
+        self.backend.reset()
+
+
+def create_limiter(app):
+    # RATE_LIMIT_BACKEND is 'memory', 'database' or 'sqlite:///path/to/file.db'
+    setting = app.config.get('RATE_LIMIT_BACKEND', 'memory')
+    max_attempts = app.config.get('LOGIN_MAX_ATTEMPTS', 4)
+    if setting == 'memory':
+        backend = MemoryBackend(max_attempts)
+    elif setting == 'database':
+        backend = DatabaseBackend()
+    elif setting.startswith('sqlite:///'):
+        backend = SQLiteBackend(setting[len('sqlite:///'):])
+    else:
+        raise ValueError(f'Unknown RATE_LIMIT_BACKEND: {setting}')
+    return LoginRateLimiter(backend,
+                            max_attempts=max_attempts,
+                            window_seconds=app.config.get('LOGIN_WINDOW_SECONDS', 3 * 60 * 60))
@@ -1,60 +1,123 @@
 # Standard library imports
+import argparse
 from random import randint, choice as rc
 
-# Remote library imports
-from faker import Faker
+from config import db, app, hasher
 
-from config import db, app
-
-from models import User, Household
+from models import User, Household, Bank
 
 import two_factor
+import ingest
+import fake_aggregator
 
-import qrcode
+FAKE_PASSWORD = "password123"
+# households only keep a digest of their key, so fake ones share this one
+FAKE_HOUSEHOLD_KEY = "fakehouseholdkey"
 
-if __name__ == '__main__':
-    with app.app_context():
-        # fake = Faker()
 
-        # print("Starting seed...")
+def seed_test_user():
+    #two factor test
+    import qrcode
 
-        # for _ in range(15):
-        #     u = User(
-        #         name=fake.name(),
-        #         password_hash="123abc",
-        #     )
-        #     db.session.add(u)
-        #     db.session.commit()
+    User.query.delete()
+    Household.query.delete()
 
-    #two factor test
-        User.query.delete()
-        Household.query.delete()
+    newHousehold = Household(name = "Test Family", key = "secretkey")
 
-        newHousehold = Household(name = "Test Family", key = "secretkey")
+    db.session.add(newHousehold)
+    db.session.commit()
 
-        db.session.add(newHousehold)
-        db.session.commit()
+    print(newHousehold)
+
+    uri = two_factor.createNewURI(user_name = "JoeTest")
 
-        print(newHousehold)
+    newUser = User(user_name = "JoeTest",
+                   admin = False,
+                   first_name = "John",
+                   last_name = "Doe",
+                   email = "johndoe@gmail.com",
+                   date_of_birth = "1/1/1980",
+                   OTPkey = uri[0],
+                   household_id = newHousehold.id)
 
-        uri = two_factor.createNewURI(user_name = "JoeTest")
+    newUser.password_hash = "JohnDoeSecretPassword"
 
-        newUser = User(user_name = "JoeTest", 
-                       admin = False, 
-                       first_name = "John", 
-                       last_name = "Doe", 
-                       email = "johndoe@gmail.com", 
-                       date_of_birth = "1/1/1980", 
-                       OTPkey = uri[0],
-                       household_id = newHousehold.id)
-    
-        newUser.password_hash = "JohnDoeSecretPassword"
+    qrcode.make(uri[1]).save("test_totp.png")
 
-        qrcode.make(uri[1]).save("test_totp.png")
+    db.session.add(newUser)
+    db.session.commit()
 
-        db.session.add(newUser)
-        db.session.commit()
-        
-        
 
+def seed_fake(households=10, users_per_household=3, banks_per_user=1, transactions_per_bank=100, seed=0):
+    # generates households/users/banks/transactions with Faker
+    # every user gets FAKE_PASSWORD and every household FAKE_HOUSEHOLD_KEY,
+    # returns {user_name: OTPkey} so callers can log in
+    from faker import Faker
 
+    fake = Faker()
+    Faker.seed(seed)
+    # hashing once and sharing it keeps large seeds fast
+    password_hash = hasher.hash(FAKE_PASSWORD)
+    aggregator = fake_aggregator.FakeAggregator(seed=seed)
+    credentials = {}
+
+    for _ in range(households):
+        last_name = fake.last_name()
+        newHousehold = Household(name = f"{last_name} Family", key = FAKE_HOUSEHOLD_KEY)
+        db.session.add(newHousehold)
+        db.session.flush()
+
+        users = []
+        for i in range(users_per_household):
+            # suffixed with a counter so large seeds never run out of unique names
+            user_name = f"{fake.user_name()}{len(credentials)}"
+            key, _ = two_factor.createNewURI(user_name = user_name)
+            newUser = User(user_name = user_name,
+                           admin = i == 0,
+                           first_name = fake.first_name(),
+                           last_name = last_name,
+                           email = fake.email(),
+                           date_of_birth = fake.date_of_birth(minimum_age = 18).strftime("%-m/%-d/%Y"),
+                           OTPkey = key,
+                           household_id = newHousehold.id,
+                           _password_hash = password_hash)
+            users.append(newUser)
+            credentials[user_name] = key
+        db.session.add_all(users)
+        db.session.flush()
+
+        banks = [Bank(public_token = fake.uuid4(),
+                      link_token = fake.uuid4(),
+                      persistent_token = fake.uuid4(),
+                      bank_name = fake.company(),
+                      account_type = fake.random_element(["checking", "savings", "credit"]),
+                      user_id = user.id)
+                 for user in users for _ in range(banks_per_user)]
+        db.session.add_all(banks)
+        db.session.flush()
+
+        for bank in banks:
+            ingest.ingest(bank.id, aggregator.records(bank.id, transactions_per_bank))
+
+    db.session.commit()
+    return credentials
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--households", type = int, default = 0,
+                        help = "generate this many fake households instead of the single test user")
+    parser.add_argument("--users-per-household", type = int, default = 3)
+    parser.add_argument("--banks-per-user", type = int, default = 1)
+    parser.add_argument("--transactions-per-bank", type = int, default = 100)
+    parser.add_argument("--seed", type = int, default = 0)
+    args = parser.parse_args()
+
+    with app.app_context():
+        if args.households:
+            print("Starting seed...")
+            credentials = seed_fake(args.households, args.users_per_household, args.banks_per_user,
+                                    args.transactions_per_bank, args.seed)
+            print(f"Seeded {len(credentials)} users, password {FAKE_PASSWORD!r}")
+        else:
+            seed_test_user()
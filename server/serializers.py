@@ -0,0 +1,100 @@
+import json
+from datetime import date, datetime, time
+
+from flask import Response
+from sqlalchemy import inspect
+
+from models import Household, User, Bank, Transactions, Categories, CategoryRule, Goals, MonthlyExpenses, ExpenseItem
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+# compiled serializers
+# each View works out which columns it reads (and how to convert them) once, on
+# first use, so dumping an object is a flat loop over attributes instead of
+# re-parsing serialize_rules and walking every relationship on each call.
+
+
+def _isoformat(value):
+    return None if value is None else value.isoformat()
+
+
+class View:
+
+    def __init__(self, model, exclude=(), nested=None):
+        self.model = model
+        self.exclude = exclude
+        self.nested_views = nested or {}
+        # compiled on the first dump, reading the mapper configures every model
+        self._compiled = None
+
+    def _compile(self):
+        mapper = inspect(self.model)
+        fields = []
+        for attr in mapper.column_attrs:
+            if attr.key in self.exclude:
+                continue
+            python_type = None
+            try:
+                python_type = attr.columns[0].type.python_type
+            except NotImplementedError:
+                pass
+            convert = _isoformat if python_type in (datetime, date, time) else None
+            fields.append((attr.key, convert))
+        nested = tuple((name, view, mapper.relationships[name].uselist)
+                       for name, view in self.nested_views.items())
+        self._compiled = (tuple(fields), nested)
+        return self._compiled
+
+    @property
+    def fields(self):
+        return (self._compiled or self._compile())[0]
+
+    def dump(self, obj):
+        if obj is None:
+            return None
+        fields, nested = self._compiled or self._compile()
+        out = {}
+        for key, convert in fields:
+            value = getattr(obj, key)
+            out[key] = convert(value) if convert else value
+        for name, view, many in nested:
+            value = getattr(obj, name)
+            out[name] = [view.dump(v) for v in value] if many else view.dump(value)
+        return out
+
+    def dump_many(self, objs):
+        return [self.dump(obj) for obj in objs]
+
+
+def dumps(data):
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, separators=(',', ':'))
+
+
+def respond(view, obj, status=200):
+    return Response(dumps(view.dump(obj)), status=status, mimetype='application/json')
+
+
+# shallow views, columns only
+HouseholdSummary = View(Household, exclude=('join_code_hash',))
+CategorySummary = View(Categories)
+GoalSummary = View(Goals)
+ExpenseItemSummary = View(ExpenseItem)
+UserSummary = View(User, exclude=('_password_hash', 'OTPkey'))
+CategoryRuleSummary = View(CategoryRule)
+
+# deep views
+TransactionFull = View(Transactions, nested={'categories': CategorySummary})
+BankFull = View(Bank, exclude=('persistent_token',), nested={'transactions': TransactionFull})
+MonthlyExpensesFull = View(MonthlyExpenses, nested={'expense_items': ExpenseItemSummary})
+UserFull = View(User, exclude=('_password_hash', 'OTPkey'), nested={
+    'bank': BankFull,
+    'goals': GoalSummary,
+    'monthly_expenses': MonthlyExpensesFull,
+    'household': HouseholdSummary,
+})
@@ -0,0 +1,183 @@
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from models import User
+
+
+# cache of the serialized /check_session payload keyed by user id
+# entries are dropped on capacity (LRU), on age (TTL) and when a transaction that
+# changed the user commits. the payload is User columns only, so nothing else evicts.
+# users touched by a flush are remembered on the session and evicted after commit
+# (forgotten on rollback), so a rolled back change doesn't evict and a read between
+# flush and commit can't leave the old row cached.
+
+
+class MemoryBackend:
+
+    def __init__(self, max_entries=1024, ttl=60):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id, count):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            payload, expires = entry
+            if expires <= time.monotonic():
+                del self._entries[user_id]
+                count('expired')
+                return None
+            self._entries.move_to_end(user_id)
+            return payload
+
+    def set(self, user_id, payload, count):
+        with self._lock:
+            self._entries.pop(user_id, None)
+            self._entries[user_id] = (payload, time.monotonic() + self.ttl)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                count('evictions')
+
+    def delete(self, user_ids):
+        with self._lock:
+            for user_id in user_ids:
+                self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class SQLiteBackend:
+    # shared between workers on the same host, so an update in one worker
+    # invalidates the cached payload for all of them
+
+    def __init__(self, path, ttl=60):
+        self.path = path
+        self.ttl = ttl
+        self._local = threading.local()
+        self._connect().execute('CREATE TABLE IF NOT EXISTS session_cache ('
+                                'user_id INTEGER PRIMARY KEY, payload BLOB NOT NULL, expires REAL NOT NULL)')
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def get(self, user_id, count):
+        row = self._connect().execute('SELECT payload, expires FROM session_cache WHERE user_id = ?',
+                                      (user_id,)).fetchone()
+        if row is None:
+            return None
+        if row[1] <= time.time():
+            count('expired')
+            return None
+        return row[0]
+
+    def set(self, user_id, payload, count):
+        self._connect().execute('INSERT OR REPLACE INTO session_cache (user_id, payload, expires) VALUES (?, ?, ?)',
+                                (user_id, payload, time.time() + self.ttl))
+
+    def delete(self, user_ids):
+        self._connect().executemany('DELETE FROM session_cache WHERE user_id = ?', [(i,) for i in user_ids])
+
+    def clear(self):
+        self._connect().execute('DELETE FROM session_cache')
+
+
+class NullBackend:
+
+    def get(self, user_id, count):
+        return None
+
+    def set(self, user_id, payload, count):
+        pass
+
+    def delete(self, user_ids):
+        pass
+
+    def clear(self):
+        pass
+
+
+class SessionCache:
+
+    def __init__(self, backend):
+        self.backend = backend
+        self._stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'expired': 0, 'invalidations': 0}
+        self._stats_lock = threading.Lock()
+
+    @property
+    def stats(self):
+        with self._stats_lock:
+            return dict(self._stats)
+
+    def _count(self, name):
+        # request threads (and the asgi event loop) all count here
+        with self._stats_lock:
+            self._stats[name] += 1
+
+    def get(self, user_id):
+        payload = self.backend.get(user_id, self._count)
+        self._count('hits' if payload is not None else 'misses')
+        return payload
+
+    def set(self, user_id, payload):
+        self.backend.set(user_id, payload, self._count)
+
+    def invalidate(self, user_ids):
+        if user_ids:
+            self._count('invalidations')
+            self.backend.delete(user_ids)
+
+    def clear(self):
+        self.backend.clear()
+
+    def listen(self):
+        event.listen(Session, 'after_flush', self._after_flush)
+        event.listen(Session, 'after_commit', self._after_commit)
+        event.listen(Session, 'after_rollback', self._after_rollback)
+
+    def _after_flush(self, db_session, flush_context):
+        user_ids = {obj.id for obj in (*db_session.new, *db_session.dirty, *db_session.deleted)
+                    if isinstance(obj, User)}
+        user_ids.discard(None)
+        if user_ids:
+            db_session.info.setdefault('session_cache_users', set()).update(user_ids)
+
+    def _after_commit(self, db_session):
+        user_ids = db_session.info.pop('session_cache_users', None)
+        if user_ids:
+            self.invalidate(user_ids)
+
+    def _after_rollback(self, db_session):
+        db_session.info.pop('session_cache_users', None)
+
+
+def create_session_cache(app):
+    # SESSION_CACHE_BACKEND is 'memory', 'none' or 'sqlite:///path/to/file.db'
+    setting = app.config.get('SESSION_CACHE_BACKEND', 'memory')
+    ttl = app.config.get('SESSION_CACHE_TTL', 60)
+    if setting == 'memory':
+        backend = MemoryBackend(app.config.get('SESSION_CACHE_SIZE', 1024), ttl)
+    elif setting == 'none':
+        backend = NullBackend()
+    elif setting.startswith('sqlite:///'):
+        backend = SQLiteBackend(setting[len('sqlite:///'):], ttl)
+    else:
+        raise ValueError(f'Unknown SESSION_CACHE_BACKEND: {setting}')
+    cache = SessionCache(backend)
+    cache.listen()
+    return cache
@@ -0,0 +1,199 @@
+import time
+from datetime import date, datetime
+from functools import partial
+
+import click
+from sqlalchemy import func, select
+
+from config import db
+from models import Bank, Categories, HouseholdMonthlySpending, Transactions, User
+
+
+# per-household spending by month and category, read from a rollup table
+# HouseholdMonthlySpending holds one row per (household, month, category) with the
+# transaction count and amount total, so a range query never touches transactions.
+# the rollup moves by deltas on the same connection as the write that caused them:
+# ingest adds the rows it actually inserted (RETURNING, or a re-count of the touched
+# months where the dialect can't return rows from a bulk insert), recategorize moves
+# each changed row from its old category to its new one. uncategorized is stored as
+# categories_id 0. `flask backfill-spending` rebuilds the table from the transactions,
+# aggregating chunks of banks in parallel.
+
+
+def month_of(day):
+    return day.replace(day=1)
+
+
+def _month_start(column, dialect):
+    # first day of the month in SQL, only the backfill and re-count group by it
+    if dialect == 'postgresql':
+        return func.date_trunc('month', column)
+    if dialect == 'sqlite':
+        return func.strftime('%Y-%m-01', column)
+    return func.date_format(column, '%Y-%m-01')
+
+
+def _as_month(value):
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, str):
+        return date.fromisoformat(value[:10])
+    return value
+
+
+def add(deltas, household_id, day, categories_id, transactions, amount_cents):
+    # deltas is {(household_id, month, categories_id): [transactions, amount_cents]}
+    if household_id is None or day is None:
+        return
+    delta = deltas.setdefault((household_id, month_of(day), categories_id or 0), [0, 0])
+    delta[0] += transactions
+    delta[1] += amount_cents or 0
+
+
+def household_for_bank(connection, bank_id):
+    return connection.execute(select(User.household_id).join(Bank, Bank.user_id == User.id)
+                              .where(Bank.id == bank_id)).scalar()
+
+
+def apply(connection, deltas):
+    # adds the deltas onto the rollup, rows whose count drops to zero are removed
+    table = HouseholdMonthlySpending.__table__
+    rows = [{'household_id': household_id, 'month': month, 'categories_id': categories_id,
+             'transactions': transactions, 'amount_cents': amount}
+            for (household_id, month, categories_id), (transactions, amount) in deltas.items()
+            if transactions or amount]
+    if not rows:
+        return
+    dialect = connection.dialect.name
+    if dialect in ('postgresql', 'sqlite'):
+        # only the dialect in use is imported
+        if dialect == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+        insert = insert(table)
+        connection.execute(insert.on_conflict_do_update(
+            index_elements=['household_id', 'month', 'categories_id'],
+            set_={'transactions': table.c.transactions + insert.excluded.transactions,
+                  'amount_cents': table.c.amount_cents + insert.excluded.amount_cents}), rows)
+    else:
+        for row in rows:
+            updated = connection.execute(table.update().where(
+                table.c.household_id == row['household_id'], table.c.month == row['month'],
+                table.c.categories_id == row['categories_id']
+            ).values(transactions=table.c.transactions + row['transactions'],
+                     amount_cents=table.c.amount_cents + row['amount_cents']))
+            if updated.rowcount == 0:
+                connection.execute(table.insert().values(**row))
+    emptied = {row['household_id'] for row in rows if row['transactions'] < 0}
+    if emptied:
+        connection.execute(table.delete().where(table.c.household_id.in_(emptied), table.c.transactions <= 0))
+
+
+def totals(connection, *criteria):
+    # the rollup computed from the transactions that match the criteria
+    month = _month_start(Transactions.date, connection.dialect.name)
+    category = func.coalesce(Transactions.categories_id, 0)
+    query = select(User.household_id, month, category, func.count(Transactions.id),
+                   func.coalesce(func.sum(Transactions.amount_cents), 0)
+                   ).select_from(Transactions).join(Bank, Transactions.bank_id == Bank.id
+                   ).join(User, Bank.user_id == User.id
+                   ).where(User.household_id.is_not(None), Transactions.date.is_not(None), *criteria
+                   ).group_by(User.household_id, month, category)
+    return {(household_id, _as_month(month), categories_id): [count, amount]
+            for household_id, month, categories_id, count, amount in connection.execute(query)}
+
+
+def recount(connection, household_id, months):
+    # replaces the household's rows for these months with a fresh count, for writes
+    # whose exact rows aren't known
+    if household_id is None or not months:
+        return
+    first, last = min(months), max(months)
+    following = date(last.year + last.month // 12, last.month % 12 + 1, 1)
+    table = HouseholdMonthlySpending.__table__
+    connection.execute(table.delete().where(table.c.household_id == household_id,
+                                            table.c.month >= first, table.c.month <= last))
+    apply(connection, totals(connection, User.household_id == household_id,
+                             Transactions.date >= first, Transactions.date < following))
+
+
+def monthly_spending(household_id, start=None, end=None):
+    # reads the rollup only, months without transactions are left out
+    query = db.session.query(
+        HouseholdMonthlySpending.month,
+        HouseholdMonthlySpending.categories_id,
+        Categories.categories_name,
+        HouseholdMonthlySpending.transactions,
+        HouseholdMonthlySpending.amount_cents,
+    ).outerjoin(Categories, HouseholdMonthlySpending.categories_id == Categories.id
+    ).filter(HouseholdMonthlySpending.household_id == household_id)
+    if start:
+        query = query.filter(HouseholdMonthlySpending.month >= start)
+    if end:
+        query = query.filter(HouseholdMonthlySpending.month <= end)
+    query = query.order_by(HouseholdMonthlySpending.month, HouseholdMonthlySpending.categories_id)
+    months = {}
+    categories = {}
+    for month, categories_id, name, count, amount in query:
+        categories_id = categories_id or None
+        entry = months.setdefault(month, {'month': month.isoformat(), 'transactions': 0, 'amount_cents': 0,
+                                          'categories': []})
+        entry['transactions'] += count
+        entry['amount_cents'] += amount
+        entry['categories'].append({'categories_id': categories_id, 'categories_name': name,
+                                    'transactions': count, 'amount_cents': amount})
+        total = categories.setdefault(categories_id, {'categories_id': categories_id, 'categories_name': name,
+                                                      'transactions': 0, 'amount_cents': 0})
+        total['transactions'] += count
+        total['amount_cents'] += amount
+    return {'household_id': household_id,
+            'start': start.isoformat() if start else None,
+            'end': end.isoformat() if end else None,
+            'transactions': sum(entry['transactions'] for entry in months.values()),
+            'amount_cents': sum(entry['amount_cents'] for entry in months.values()),
+            'categories': sorted(categories.values(), key=lambda total: -total['amount_cents']),
+            'months': list(months.values())}
+
+
+def _chunk_totals(engine, low, high):
+    with engine.connect() as connection:
+        return totals(connection, Transactions.bank_id.between(low, high))
+
+
+def backfill(workers=4, chunk_size=500, echo=None):
+    # rebuilds the whole rollup. banks are split into id ranges and aggregated on
+    # worker threads, each with its own connection; the partial totals are added in
+    # one chunk (and one commit) at a time, so a household whose banks land in
+    # different chunks is summed correctly. writes made while it runs can be counted
+    # twice, run it while ingest is paused.
+    from concurrent.futures import ThreadPoolExecutor
+
+    start = time.perf_counter()
+    bank_ids = db.session.execute(select(Bank.id).order_by(Bank.id)).scalars().all()
+    chunks = [(bank_ids[i], bank_ids[min(i + chunk_size, len(bank_ids)) - 1])
+              for i in range(0, len(bank_ids), chunk_size)]
+    result = {'banks': len(bank_ids), 'chunks': len(chunks), 'transactions': 0}
+    db.session.execute(HouseholdMonthlySpending.__table__.delete())
+    db.session.commit()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for n, chunk in enumerate(pool.map(partial(_chunk_totals, db.engine), *zip(*chunks)), 1):
+            apply(db.session.connection(), chunk)
+            db.session.commit()
+            result['transactions'] += sum(count for count, _ in chunk.values())
+            if echo:
+                echo(f'chunk {n}/{len(chunks)}')
+    result['rows'] = db.session.query(func.count()).select_from(HouseholdMonthlySpending).scalar()
+    result['seconds'] = time.perf_counter() - start
+    return result
+
+
+def register_cli(app):
+    @app.cli.command('backfill-spending')
+    @click.option('--workers', type=int, default=4, help='bank chunks aggregated at once')
+    @click.option('--chunk-size', type=int, default=500, help='banks per chunk')
+    def backfill_command(workers, chunk_size):
+        """Rebuild the monthly spending rollup from the transactions."""
+        result = backfill(workers, chunk_size, echo=lambda message: click.echo(message, err=True))
+        click.echo(f'{result["transactions"]} transactions from {result["banks"]} banks ({result["chunks"]} chunks) '
+                   f'into {result["rows"]} rollup rows in {result["seconds"]:.1f}s')
@@ -0,0 +1,115 @@
+import os
+import shutil
+import sys
+import tempfile
+from itertools import count
+
+import pytest
+
+# config builds the app on import, so the test settings go in first:
+# a throwaway sqlite file, cheap bcrypt inline and a synchronous audit log
+_tmp = tempfile.mkdtemp(prefix='money-magnet-tests-')
+os.environ['DATABASE_URL'] = f'sqlite:///{os.path.join(_tmp, "test.db")}'
+os.environ.pop('DATABASE_REPLICA_URL', None)
+os.environ['BCRYPT_LOG_ROUNDS'] = '4'
+os.environ['PASSWORD_HASH_WORKERS'] = '0'
+os.environ['AUDIT_ASYNC'] = '0'
+os.environ['AUDIT_SPILL_PATH'] = os.path.join(_tmp, 'login_attempts.spill')
+os.environ['SECRET_KEY'] = 'test'
+# per-process state only, whatever the developer's environment points at
+for name in ('RATE_LIMIT_BACKEND', 'SESSION_CACHE_BACKEND', 'TOTP_REPLAY_BACKEND'):
+    os.environ[name] = 'memory'
+os.environ['INSTRUMENTATION'] = '0'
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as server  # noqa: E402
+from config import db  # noqa: E402
+from models import Bank, Categories, Household, User  # noqa: E402
+
+PASSWORD = 'testpassword'
+
+# every row the tests create gets a fresh number, ids and names are never reused,
+# so the per-process caches keyed on them stay valid across tests sharing the database
+_serial = count(1)
+
+
+@pytest.fixture(scope='session')
+def app():
+    with server.app.app_context():
+        db.create_all()
+        yield server.app
+        db.session.remove()
+        db.drop_all()
+        db.engine.dispose()
+    shutil.rmtree(_tmp, ignore_errors=True)
+
+
+@pytest.fixture(autouse=True)
+def session(app):
+    yield db.session
+    db.session.rollback()
+    db.session.remove()
+    server.limiter.reset()
+
+
+@pytest.fixture
+def password():
+    # every user from make_user logs in with this
+    return PASSWORD
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def make_user():
+    # a user in a household of their own (or the one given) with one bank
+    import pyotp
+
+    def make_user(household=None, banks=1):
+        n = next(_serial)
+        if household is None:
+            household = Household(name=f'household{n}', key=f'key{n}')
+            db.session.add(household)
+            db.session.flush()
+        user = User(user_name=f'user{n}', admin=True, first_name='Test', last_name='User',
+                    email=f'user{n}@example.com', date_of_birth='1/1/1990', OTPkey=pyotp.random_base32(),
+                    household_id=household.id)
+        user.password_hash = PASSWORD
+        db.session.add(user)
+        db.session.flush()
+        for i in range(banks):
+            db.session.add(Bank(public_token=f'public{n}-{i}', link_token=f'link{n}-{i}',
+                                persistent_token=f'persistent{n}-{i}', bank_name='Test Bank',
+                                account_type='checking', user_id=user.id))
+        db.session.commit()
+        return user
+
+    return make_user
+
+
+@pytest.fixture
+def make_category():
+    def make_category(name=None):
+        category = Categories(categories_name=name or f'category{next(_serial)}', categories_description='',
+                              categories_type=False)
+        db.session.add(category)
+        db.session.commit()
+        return category
+
+    return make_category
+
+
+@pytest.fixture
+def login(client):
+    # a session cookie for the user, without going through /login
+    def login(user):
+        with client.session_transaction() as cookie:
+            cookie['user_id'] = user.id
+        return client
+
+    return login
+
@@ -0,0 +1,72 @@
+import asyncio
+
+import pytest
+
+from asgi import WsgiBridge
+
+SCOPE = {'type': 'http', 'method': 'POST', 'path': '/upload', 'query_string': b'', 'http_version': '1.1',
+         'headers': [(b'content-type', b'application/x-ndjson')]}
+
+
+def call(wsgi_app, messages, received, scope=SCOPE):
+    # runs the bridge against a receive that hands out `messages` one at a time
+    sent = []
+
+    async def receive():
+        message = messages[len(received)]
+        received.append(message)
+        return message
+
+    async def send(message):
+        sent.append(message)
+
+    async def run():
+        bridge = WsgiBridge(wsgi_app, 1)
+        try:
+            await bridge(scope, receive, send)
+        finally:
+            bridge.close()
+
+    asyncio.run(run())
+    return sent
+
+
+def test_the_body_is_read_as_the_view_asks_for_it():
+    messages = [{'type': 'http.request', 'body': f'{{"line": {i}}}\n'.encode(), 'more_body': i < 9} for i in range(10)]
+    received = []
+    seen = {}
+
+    def wsgi_app(environ, start_response):
+        body = environ['wsgi.input']
+        first = body.readline()
+        # only the first message has been pulled in to answer the first line
+        seen['received'] = len(received)
+        rest = body.read()
+        start_response('200 OK', [('Content-Type', 'text/plain')])
+        return [first, rest]
+
+    sent = call(wsgi_app, messages, received)
+    assert seen['received'] == 1
+    assert sent[0] == {'type': 'http.response.start', 'status': 200, 'headers': [(b'content-type', b'text/plain')]}
+    assert b''.join(m.get('body', b'') for m in sent[1:]) == b''.join(m['body'] for m in messages)
+
+
+def test_a_disconnect_mid_body_fails_the_read():
+    messages = [{'type': 'http.request', 'body': b'partial', 'more_body': True}, {'type': 'http.disconnect'}]
+
+    def wsgi_app(environ, start_response):
+        environ['wsgi.input'].read()
+
+    with pytest.raises(ConnectionResetError):
+        call(wsgi_app, messages, [])
+
+
+def test_a_body_split_across_messages_reaches_flask(app):
+    # no content length: werkzeug reads the stream because it's marked terminated
+    messages = [{'type': 'http.request', 'body': b'{"user_name": ', 'more_body': True},
+                {'type': 'http.request', 'body': b'5}', 'more_body': False}]
+    scope = {**SCOPE, 'path': '/login', 'headers': [(b'content-type', b'application/json')]}
+    sent = call(app, messages, [], scope)
+    # the name was read as a number, so the whole body made it through
+    assert sent[0]['status'] == 400
+    assert b'must be text' in b''.join(m.get('body', b'') for m in sent[1:])
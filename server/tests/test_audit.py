@@ -0,0 +1,85 @@
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import audit
+from audit import AuditWriter
+from config import db
+from models import LoginAttempts
+
+
+@pytest.fixture
+def writer(app, tmp_path):
+    writer = AuditWriter(app, batch_size=5, flush_interval=0.05, spill_path=str(tmp_path / 'audit.spill'))
+    yield writer
+    writer.close()
+
+
+def attempts(ip_address):
+    db.session.rollback()
+    return db.session.query(LoginAttempts.success).filter(LoginAttempts.ip_address == ip_address).count()
+
+
+def database_down():
+    raise OSError('database is down')
+
+
+def test_sync_write(writer):
+    writer.record('10.1.0.1', True)
+    writer.record('10.1.0.1', False)
+    assert attempts('10.1.0.1') == 2
+
+
+def test_rows_are_spilled_while_the_database_is_down_and_replayed(writer, monkeypatch):
+    with monkeypatch.context() as patch:
+        patch.setattr(audit, 'db', SimpleNamespace(engine=SimpleNamespace(begin=database_down)))
+        writer.record('10.1.0.2', False)
+        writer.record('10.1.0.2', False)
+    assert attempts('10.1.0.2') == 0
+    assert writer._has_spill()
+    writer.record('10.1.0.2', True)
+    assert attempts('10.1.0.2') == 3
+    assert not writer._has_spill()
+
+
+def test_unreadable_spill_lines_are_set_aside(writer, tmp_path):
+    writer._spill([{'ip_address': '10.1.0.3', 'success': False, 'attempted_at': audit.utcnow()}])
+    with open(writer.spill_path, 'ab') as f:
+        f.write(b'{"ip_address": "10.1.0.3", "success": tr\n[1, 2]\n{"ip_address": "10.1.0.3"}\n\xff\n')
+    writer._spill([{'ip_address': '10.1.0.3', 'success': True, 'attempted_at': audit.utcnow()}])
+    # a crash mid-write leaves a line with no newline, the next spill starts a fresh one
+    with open(writer.spill_path, 'ab') as f:
+        f.write(b'{"ip_address": "10.1.0.3", "succ')
+    writer._spill([{'ip_address': '10.1.0.3', 'success': True, 'attempted_at': audit.utcnow()}])
+    writer.record('10.1.0.3', True)
+    assert attempts('10.1.0.3') == 4
+    assert len(open(writer.spill_path + '.bad', 'rb').readlines()) == 5
+    assert not writer._has_spill()
+
+
+def test_background_writer_survives_a_corrupt_spill(writer):
+    with open(writer.spill_path, 'wb') as f:
+        f.write(b'{"ip_address": "10.1.0.4", "success": tr')
+    writer.start()
+    writer.record('10.1.0.4', True)
+    writer.record('10.1.0.4', True)
+    deadline = time.monotonic() + 5
+    while attempts('10.1.0.4') < 2 and time.monotonic() < deadline:
+        time.sleep(0.02)
+    assert attempts('10.1.0.4') == 2
+    assert writer._thread.is_alive()
+    writer.record('10.1.0.4', False)
+    writer.close()
+    assert attempts('10.1.0.4') == 3
+
+
+def test_full_queue_spills_and_close_writes_it(app, tmp_path):
+    writer = AuditWriter(app, max_queue=2, flush_interval=0.05, spill_path=str(tmp_path / 'audit.spill'))
+    # a started writer whose thread isn't draining yet
+    writer._thread = SimpleNamespace(join=lambda timeout: None)
+    for _ in range(5):
+        writer.record('10.1.0.5', False)
+    assert writer._has_spill()
+    writer.close()
+    assert attempts('10.1.0.5') == 5
@@ -0,0 +1,92 @@
+import pytest
+
+import categorize
+from categorize import Matcher, validate_regex
+from config import db
+from models import CategoryRule
+
+
+@pytest.mark.parametrize('pattern', [r'(?i)coffee', r'(a)\1', r'(?P<r0>x)', r'(?(1)a|b)', r'coffee(', r'x(?i)'])
+def test_validate_regex_rejects_rules_that_break_the_combined_matcher(pattern):
+    with pytest.raises(ValueError):
+        validate_regex(pattern)
+
+
+@pytest.mark.parametrize('pattern', [r'(?i:coffee)', r'^STARBUCKS\b', r'[(]\d+[)]', r'\\1', r'UBER|LYFT', r'(?:a)(b)'])
+def test_validate_regex_accepts_plain_rules(pattern):
+    validate_regex(pattern)
+
+
+def rule(i, pattern, categories_id, match_type='regex', low=None, high=None):
+    return (i, match_type, pattern, low, high, categories_id)
+
+
+def test_matcher_first_matching_rule_wins():
+    matcher = Matcher([rule(1, 'coffee', 10, 'substring'), rule(2, r'^STAR', 20), rule(3, 'BUCKS', 30)])
+    assert matcher.categorize('Starbucks coffee #12') == 10
+    assert matcher.categorize('starbucks') == 20
+    assert matcher.categorize('  big   bucks ') == 30
+    assert matcher.categorize('rent') is None
+
+
+def test_matcher_amount_bounds():
+    matcher = Matcher([rule(1, 'AMAZON', 10, low=10000), rule(2, 'AMAZON', 20)])
+    assert matcher.categorize('AMAZON', 15000) == 10
+    assert matcher.categorize('AMAZON', 500) == 20
+    assert matcher.categorize('AMAZON') == 20
+
+
+def test_substring_rules_are_literal():
+    matcher = Matcher([rule(1, 'A+B (1)', 10, 'substring')])
+    assert matcher.categorize('paid a+b (1) ltd') == 10
+    assert matcher.categorize('AAB 1') is None
+
+
+@pytest.mark.parametrize('bad', [r'(?i)coffee', r'(a)\1', r'(?P<r0>x)', r'coffee('])
+def test_legacy_bad_rule_falls_back_to_one_regex_per_rule(bad):
+    # rules stored before validation existed must not take the other rules down with them
+    matcher = Matcher([rule(1, bad, 10), rule(2, 'uber', 20, 'substring'), rule(3, r'LYFT\s+\d+', 30)])
+    assert matcher.categorize('UBER TRIP') == 20
+    assert matcher.categorize('lyft 42') == 30
+    assert matcher.categorize('TEA') is None
+
+
+def test_empty_matcher():
+    assert Matcher([]).categorize('anything', 100) is None
+
+
+def test_category_rules_endpoint_refuses_bad_regex(make_user, make_category, login):
+    user = make_user()
+    category = make_category()
+    client = login(user)
+    url = f'/households/{user.household_id}/category_rules'
+    for pattern in (r'(?i)coffee', r'(a)\1', r'(?P<r0>x)'):
+        response = client.post(url, json={'match_type': 'regex', 'pattern': pattern, 'categories_id': category.id})
+        assert response.status_code == 400, pattern
+    response = client.post(url, json={'match_type': 'regex', 'pattern': r'(?i:coffee)', 'categories_id': category.id})
+    assert response.status_code == 201
+    assert db.session.query(CategoryRule).filter(CategoryRule.household_id == user.household_id).count() == 1
+
+
+def test_matcher_cache_is_bounded(make_user, monkeypatch):
+    monkeypatch.setattr(categorize, 'MATCHER_CACHE_SIZE', 2)
+    users = [make_user() for _ in range(4)]
+    for user in users:
+        categorize.matcher_for_bank(user.bank[0].id)
+    assert len(categorize._matchers) <= 2
+    # the most recent owners are the ones kept
+    assert (users[-1].id, users[-1].household_id) in categorize._matchers
+
+
+def test_matcher_is_reused_until_the_rules_change(make_user, make_category):
+    user = make_user()
+    category = make_category()
+    bank_id = user.bank[0].id
+    first = categorize.matcher_for_bank(bank_id)
+    assert categorize.matcher_for_bank(bank_id) is first
+    db.session.add(CategoryRule(match_type='substring', pattern='coffee', priority=1, categories_id=category.id,
+                                household_id=user.household_id))
+    db.session.commit()
+    changed = categorize.matcher_for_bank(bank_id)
+    assert changed is not first
+    assert changed.categorize('COFFEE SHOP') == category.id
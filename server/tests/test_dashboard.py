@@ -0,0 +1,50 @@
+from datetime import date, datetime
+
+import dashboard
+import ingest
+from config import db
+from models import Goals
+
+
+def test_etag_and_304(make_user, login):
+    user = make_user()
+    client = login(user)
+    path = f'/households/{user.household_id}/dashboard'
+    first = client.get(path)
+    assert first.status_code == 200
+    assert first.json['members'][0]['user_name'] == user.user_name
+    etag = first.headers['ETag']
+    assert client.get(path, headers={'If-None-Match': etag}).status_code == 304
+    # any write to the household is a new version, so a new ETag and a full response
+    db.session.add(Goals(household_budget=False, name='goal', description='', target_amount_cents=1000,
+                         current_amount_cents=250, deadline='2030-01-01', user_id=user.id,
+                         household_id=user.household_id))
+    db.session.commit()
+    changed = client.get(path, headers={'If-None-Match': etag})
+    assert changed.status_code == 200 and changed.headers['ETag'] != etag
+    assert changed.json['goals']['percent_complete'] == 25.0
+
+
+def test_month_to_date_spend_leaves_out_other_months(make_user, login, monkeypatch):
+    monkeypatch.setattr(dashboard, 'utcnow', lambda: datetime(2024, 12, 31, 23, 30))
+    user = make_user()
+    ingest.ingest(user.bank[0].id, [
+        {'external_id': 'nov', 'date': '2024-11-30', 'amount_cents': 1},
+        {'external_id': 'dec', 'date': '2024-12-01', 'amount_cents': 20},
+        {'external_id': 'dec2', 'date': '2024-12-31', 'amount_cents': 300},
+        {'external_id': 'future', 'date': '2025-01-01', 'amount_cents': 4000}])
+    body = login(user).get(f'/households/{user.household_id}/dashboard').json
+    assert body['month'] == '2024-12-01'
+    assert body['members'][0]['transactions_this_month'] == 2
+    assert body['spent_this_month_cents'] == 320
+
+
+def test_current_month_is_utc(monkeypatch):
+    monkeypatch.setattr(dashboard, 'utcnow', lambda: datetime(2025, 3, 1, 0, 5))
+    assert dashboard.current_month() == date(2025, 3, 1)
+
+
+def test_only_members_see_the_dashboard(make_user, login):
+    owner = make_user()
+    response = login(make_user()).get(f'/households/{owner.household_id}/dashboard')
+    assert response.status_code == 401
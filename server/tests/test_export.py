@@ -0,0 +1,85 @@
+import csv
+import io
+import json
+
+import pytest
+
+import ingest
+
+
+@pytest.fixture
+def exported(make_user, login):
+    # a household with two members and a few transactions, exported in batches of two
+    def exported(app, count=5):
+        user = make_user()
+        make_user(household=user.household)
+        ingest.ingest(user.bank[0].id, [{'external_id': f'tx{i}', 'date': '2024-03-01', 'amount_cents': i,
+                                         'description': 'SHOP'} for i in range(count)])
+        app.config['EXPORT_BATCH_SIZE'] = 2
+        return user, login(user)
+
+    return exported
+
+
+@pytest.fixture(autouse=True)
+def batch_size(app):
+    size = app.config['EXPORT_BATCH_SIZE']
+    yield
+    app.config['EXPORT_BATCH_SIZE'] = size
+
+
+def lines(response):
+    return [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+
+
+def test_ndjson_export_has_every_row_and_no_secrets(app, exported):
+    user, client = exported(app)
+    response = client.get(f'/households/{user.household_id}/export')
+    assert response.status_code == 200
+    assert response.mimetype == 'application/x-ndjson'
+    rows = lines(response)
+    assert rows[-1] == {'type': 'end'}
+    by_type = {}
+    for row in rows:
+        by_type.setdefault(row['type'], []).append(row)
+    assert [row['amount_cents'] for row in by_type['transactions']] == list(range(5))
+    assert len(by_type['users']) == 2
+    assert not {'_password_hash', 'OTPkey'} & set(by_type['users'][0])
+    assert 'persistent_token' not in by_type['banks'][0]
+    assert 'join_code_hash' not in by_type['household'][0]
+
+
+def test_ndjson_export_resumes_from_a_cursor(app, exported):
+    user, client = exported(app)
+    url = f'/households/{user.household_id}/export'
+    full = lines(client.get(url))
+    # drop the connection right after the first transactions batch
+    cursors = [i for i, row in enumerate(full) if row['type'] == 'cursor']
+    cut = next(i for i in cursors if full[i - 1]['type'] == 'transactions')
+    resumed = lines(client.get(url, query_string={'cursor': full[cut]['cursor']}))
+    data = [row for row in full[:cut] + resumed if row['type'] != 'cursor']
+    assert data == [row for row in full if row['type'] != 'cursor']
+
+
+def test_csv_export_is_one_table_resumed_by_id(app, exported):
+    user, client = exported(app)
+    url = f'/households/{user.household_id}/export'
+    response = client.get(url, query_string={'format': 'csv', 'table': 'transactions'})
+    assert response.mimetype == 'text/csv'
+    rows = list(csv.DictReader(io.StringIO(response.get_data(as_text=True))))
+    assert [row['amount_cents'] for row in rows] == ['0', '1', '2', '3', '4']
+    response = client.get(url, query_string={'format': 'csv', 'table': 'transactions', 'after_id': rows[2]['id']})
+    assert [row['amount_cents'] for row in csv.DictReader(io.StringIO(response.get_data(as_text=True)))] == ['3', '4']
+
+
+@pytest.mark.parametrize('query', [{'format': 'xml'}, {'format': 'csv', 'table': 'secrets'},
+                                   {'cursor': 'not a cursor'}, {'format': 'csv', 'table': 'users', 'after_id': 'x'}])
+def test_bad_export_arguments_are_rejected(app, exported, query):
+    user, client = exported(app, count=0)
+    assert client.get(f'/households/{user.household_id}/export', query_string=query).status_code == 400
+
+
+def test_only_members_can_export(app, exported, make_user):
+    user, client = exported(app, count=0)
+    other = make_user()
+    assert client.get(f'/households/{other.household_id}/export').status_code == 401
@@ -0,0 +1,74 @@
+from datetime import date
+
+import pytest
+
+import forecast
+from config import db
+from models import ExpenseItem, MonthlyExpenses
+
+
+@pytest.fixture
+def household(make_user, make_category):
+    # six months of budgets, income alternating 1000/3000 dollars, rent of 1500 every month
+    user = make_user()
+    rent = make_category().id
+    for month in range(1, 7):
+        budget = MonthlyExpenses(month=date(2024, month, 1), is_household_budget=True,
+                                 user_expected_income_cents=200000, actual_income_cents=100000 if month % 2 else 300000,
+                                 user_expected_monthly_expenses_total_cents=150000, is_fluctuating_income=True,
+                                 user_id=user.id, household_id=user.household_id)
+        budget.expense_items = [ExpenseItem(item_name='rent', planned_amount_cents=150000, categories_id=rent)]
+        db.session.add(budget)
+    db.session.commit()
+    return user
+
+
+def test_forecast(household, login):
+    response = login(household).get(f'/households/{household.household_id}/forecast',
+                                    query_string={'window': 6, 'horizon': 3})
+    assert response.status_code == 200
+    result = response.json
+    assert (result['start'], result['end'], result['is_fluctuating_income']) == ('2024-01-01', '2024-06-01', True)
+    assert result['income'] == {'mean_cents': 200000, 'std_cents': 100000, 'low_cents': 100000, 'high_cents': 300000}
+    assert [month['month'] for month in result['projection']] == ['2024-07-01', '2024-08-01', '2024-09-01']
+    # expenses 1500 against a low band that starts just under 1000 and keeps widening
+    shortfalls = [month['shortfall_cents'] for month in result['projection']]
+    assert shortfalls == sorted(shortfalls) and shortfalls[0] > 50000
+    assert len(result['history']) == 6
+
+
+def test_a_write_is_a_new_cache_key(household, login):
+    client = login(household)
+    path = f'/households/{household.household_id}/forecast'
+    before = client.get(path).json
+    db.session.add(MonthlyExpenses(month=date(2024, 7, 1), is_household_budget=True,
+                                   user_expected_income_cents=0, actual_income_cents=900000,
+                                   user_expected_monthly_expenses_total_cents=0, is_fluctuating_income=True,
+                                   user_id=household.id, household_id=household.household_id))
+    db.session.commit()
+    assert client.get(path).json['end'] == '2024-07-01' != before['end']
+
+
+@pytest.mark.parametrize('query', [{'start': '2024-06', 'end': '2024-01'}, {'start': '0001-01', 'end': '9999-12'},
+                                   {'start': '2024-13'}, {'window': 0}, {'horizon': 121}])
+def test_bad_ranges_are_rejected(household, login, query):
+    response = login(household).get(f'/households/{household.household_id}/forecast', query_string=query)
+    assert response.status_code == 400
+
+
+def test_open_ended_ranges_are_capped(household, login):
+    client = login(household)
+    response = client.get(f'/households/{household.household_id}/forecast', query_string={'end': '9000-12'})
+    assert response.status_code == 200
+    # the latest MAX_HISTORY_MONTHS before 9000-12 hold no budgets
+    assert response.json['income'] is None
+    # no room left for the projection
+    response = client.get(f'/households/{household.household_id}/forecast', query_string={'end': '9999-12'})
+    assert response.status_code == 400
+    result = forecast.forecast_households([household.household_id], start=date(1, 1, 1))[household.household_id]
+    assert result['history'][0]['month'] == '2024-01-01'
+
+
+def test_only_members_get_a_forecast(household, make_user, login):
+    response = login(make_user()).get(f'/households/{household.household_id}/forecast')
+    assert response.status_code == 401
@@ -0,0 +1,25 @@
+import pytest
+from sqlalchemy import inspect
+
+import generate
+from config import db
+
+
+def index_names():
+    inspector = inspect(db.engine)
+    return {index['name'] for name in generate.TABLES for index in inspector.get_indexes(name)}
+
+
+def test_a_failed_merge_puts_the_indexes_back(app, monkeypatch, tmp_path):
+    before = index_names()
+    assert before
+
+    def merge_shard(connection, path, offsets):
+        raise RuntimeError('merge interrupted')
+
+    monkeypatch.setattr(generate, 'merge_shard', merge_shard)
+    with pytest.raises(RuntimeError):
+        generate.generate(1, workers=1, chunk_size=1, months=1, tmp_dir=str(tmp_path), echo=lambda message: None)
+    assert index_names() == before
+    # the shards went with the work directory
+    assert list(tmp_path.iterdir()) == []
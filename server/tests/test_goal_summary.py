@@ -0,0 +1,56 @@
+import random
+
+import goal_summary
+from config import db
+from models import Goals
+
+
+def goal(rng, household_id):
+    return Goals(household_budget=True, name='goal', description='', household_id=household_id,
+                 target_amount_cents=rng.randint(1, 1000), current_amount_cents=rng.randint(0, 1000),
+                 deadline=rng.choice([f'2025-0{rng.randint(1, 9)}-01', f'{rng.randint(1, 12)}/1/2026', 'someday']))
+
+
+def test_goal_summary_matches_goals_after_random_writes(make_user):
+    rng = random.Random(17)
+    households = [make_user().household_id for _ in range(3)]
+    db.session.add_all(goal(rng, rng.choice(households)) for _ in range(10))
+    db.session.commit()
+    for _ in range(300):
+        goals = db.session.query(Goals).filter(Goals.household_id.in_(households)).all()
+        choice = rng.random()
+        if choice < 0.25 or not goals:
+            db.session.add(goal(rng, rng.choice(households)))
+        else:
+            target = rng.choice(goals)
+            # edits, household moves, and edits followed by a delete in the same flush
+            target.current_amount_cents = rng.randint(0, 1000)
+            if rng.random() < 0.5:
+                target.target_amount_cents = rng.randint(1, 1000)
+                target.deadline = f'2025-0{rng.randint(1, 9)}-01'
+            if rng.random() < 0.2:
+                target.household_id = rng.choice(households)
+            if choice > 0.75:
+                db.session.delete(target)
+        if rng.random() < 0.1:
+            db.session.rollback()
+        else:
+            db.session.commit()
+    assert goal_summary.check(fix=False) == {}
+    for household_id in households:
+        goals, target, current, nearest = goal_summary.compute().get(household_id, (0, 0, 0, None))
+        summary = goal_summary.summary(household_id)
+        assert (summary['goals'], summary['target_cents'], summary['current_cents']) == (goals, target, current)
+        assert summary['nearest_deadline'] == (nearest.isoformat() if nearest else None)
+
+
+def test_check_goal_summary_repairs_drift(make_user):
+    household_id = make_user().household_id
+    db.session.add(goal(random.Random(1), household_id))
+    db.session.commit()
+    # a write that bypasses the ORM listeners
+    db.session.execute(Goals.__table__.update().where(Goals.household_id == household_id)
+                       .values(target_amount_cents=Goals.target_amount_cents + 5))
+    db.session.commit()
+    assert set(goal_summary.check(fix=True)) == {household_id}
+    assert goal_summary.check(fix=False) == {}
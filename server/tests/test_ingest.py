@@ -0,0 +1,86 @@
+import json
+
+import pytest
+
+import ingest
+from config import db
+from models import Transactions
+
+
+def ndjson(records):
+    return '\n'.join(json.dumps(record) for record in records)
+
+
+def stored(bank_id):
+    rows = db.session.query(Transactions).filter(Transactions.bank_id == bank_id).order_by(Transactions.external_id)
+    return [(row.external_id, row.date.isoformat(), row.amount_cents, row.transaction_description) for row in rows]
+
+
+def test_ndjson_import(make_user, login):
+    user = make_user()
+    bank_id = user.bank[0].id
+    records = [{'external_id': 'a', 'date': '2024-01-31', 'amount': '12.50', 'description': 'COFFEE'},
+               {'external_id': 'b', 'date': '2024-02-01', 'amount_cents': 999}]
+    response = login(user).post(f'/banks/{bank_id}/transactions/import', data=ndjson(records))
+    assert response.json == {'received': 2, 'inserted': 2, 'duplicates': 0, 'rejected': 0, 'errors': []}
+    assert stored(bank_id) == [('a', '2024-01-31', 1250, 'COFFEE'), ('b', '2024-02-01', 999, '')]
+
+
+def test_csv_import(make_user, login):
+    user = make_user()
+    bank_id = user.bank[0].id
+    body = 'external_id,date,amount,description\nc1,2024-03-01,$1.05,RENT\nc2,2024-03-02,-2,REFUND\n'
+    response = login(user).post(f'/banks/{bank_id}/transactions/import', data=body, content_type='text/csv')
+    assert response.json['inserted'] == 2
+    assert stored(bank_id) == [('c1', '2024-03-01', 105, 'RENT'), ('c2', '2024-03-02', -200, 'REFUND')]
+
+
+def test_duplicates_are_skipped_across_batches_and_imports(make_user):
+    bank_id = make_user().bank[0].id
+    records = [{'external_id': f'tx{i % 5}', 'date': '2024-01-01', 'amount_cents': i} for i in range(8)]
+    assert ingest.ingest(bank_id, records, batch_size=3) == {
+        'received': 8, 'inserted': 5, 'duplicates': 3, 'rejected': 0, 'errors': []}
+    again = ingest.ingest(bank_id, records[:5], batch_size=3)
+    assert (again['inserted'], again['duplicates']) == (0, 5)
+    # the first copy of each external id is the one kept
+    assert [amount for _, _, amount, _ in stored(bank_id)] == [0, 1, 2, 3, 4]
+
+
+def test_same_external_id_on_another_bank_is_not_a_duplicate(make_user):
+    user = make_user(banks=2)
+    for bank in user.bank:
+        result = ingest.ingest(bank.id, [{'external_id': 'shared', 'date': '2024-01-01', 'amount_cents': 1}])
+        assert result['inserted'] == 1
+
+
+def test_bad_records_are_reported_good_ones_kept(make_user):
+    bank_id = make_user().bank[0].id
+    records = [{'external_id': 'ok', 'date': '2024-01-01', 'amount': '1'}, {'date': '2024-01-01', 'amount': '1'},
+               {'external_id': 'no date', 'amount': '1'}, {'external_id': 'bad date', 'date': '31/01/2024', 'amount': 1},
+               ['not', 'an', 'object']]
+    result = ingest.ingest(bank_id, records)
+    assert (result['inserted'], result['rejected']) == (1, 4)
+    assert [error['line'] for error in result['errors']] == [2, 3, 4, 5]
+
+
+def test_malformed_feed_is_a_400_and_imports_nothing(make_user, login):
+    user = make_user()
+    bank_id = user.bank[0].id
+    body = ndjson([{'external_id': 'a', 'date': '2024-01-01', 'amount': '1'}]) + '\n{not json\n'
+    response = login(user).post(f'/banks/{bank_id}/transactions/import', data=body)
+    assert response.status_code == 400
+    assert stored(bank_id) == []
+
+
+def test_a_failed_import_rolls_back_earlier_batches(make_user):
+    bank_id = make_user().bank[0].id
+    lines = [json.dumps({'external_id': f'tx{i}', 'date': '2024-01-01', 'amount': '1'}) for i in range(3)]
+    with pytest.raises(ValueError):
+        ingest.ingest(bank_id, ingest.read_ndjson(lines + ['{not json']), batch_size=1)
+    assert stored(bank_id) == []
+
+
+def test_only_the_owner_can_import(make_user, login):
+    owner, other = make_user(), make_user()
+    response = login(other).post(f'/banks/{owner.bank[0].id}/transactions/import', data=ndjson([]))
+    assert response.status_code == 401
@@ -0,0 +1,50 @@
+import pytest
+from flask import Flask
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from instrumentation import Instrumentation, SlowestProfiles
+
+
+@pytest.fixture
+def instrumented(tmp_path):
+    app = Flask('instrumented')
+    app.testing = True
+    allowed = {'metrics': False}
+    instruments = Instrumentation(app, profiles=SlowestProfiles(str(tmp_path), keep=2, sample_rate=1.0),
+                                  authorize=lambda: allowed['metrics']).install()
+
+    @app.route('/ok')
+    def ok():
+        return 'ok'
+
+    @app.route('/boom')
+    def boom():
+        raise RuntimeError('boom')
+
+    yield app, instruments, allowed
+    event.remove(Engine, 'before_cursor_execute', instruments._before_cursor_execute)
+    event.remove(Engine, 'after_cursor_execute', instruments._after_cursor_execute)
+
+
+def test_a_failing_view_releases_the_profiler(instrumented):
+    app, instruments, _ = instrumented
+    client = app.test_client()
+    with pytest.raises(RuntimeError):
+        client.get('/boom')
+    assert not instruments.profiles._active.locked()
+    # the next request is profiled again
+    response = client.get('/ok')
+    assert 'total;dur=' in response.headers['Server-Timing']
+    assert len(instruments.profiles._heap) == 1
+
+
+def test_metrics_need_authorization(instrumented):
+    app, _, allowed = instrumented
+    client = app.test_client()
+    client.get('/ok')
+    assert client.get('/metrics').status_code == 401
+    allowed['metrics'] = True
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    assert 'endpoint="ok"' in response.get_data(as_text=True)
@@ -0,0 +1,76 @@
+import pytest
+
+import app as server
+import lookup
+from config import db
+from models import Household, User, join_code
+
+
+@pytest.fixture
+def cache():
+    return lookup.LookupCache(max_entries=2, ttl=60)
+
+
+def household(name, key):
+    household = Household(name=name, key=key)
+    db.session.add(household)
+    db.session.commit()
+    return household
+
+
+def test_household_is_found_by_name_and_key_only(cache):
+    home = household('lookup home', 'secret')
+    assert home.join_code_hash == join_code('lookup home', 'secret')
+    assert lookup.household_id_by_code(cache, 'lookup home', 'secret') == home.id
+    assert lookup.household_id_by_code(cache, 'lookup home', 'wrong') is None
+    assert lookup.household_id_by_code(cache, 'other home', 'secret') is None
+    # the second time comes from the cache
+    lookup.household_id_by_code(cache, 'lookup home', 'secret')
+    assert cache.stats['hits'] == 1
+
+
+def test_changing_the_key_drops_the_cached_code():
+    # the app's cache, the one listening to flushes
+    cache = server.lookupCache
+    home = household('rekeyed home', 'old')
+    assert lookup.household_id_by_code(cache, 'rekeyed home', 'old') == home.id
+    home.key = 'new'
+    db.session.commit()
+    assert lookup.household_id_by_code(cache, 'rekeyed home', 'old') is None
+    assert lookup.household_id_by_code(cache, 'rekeyed home', 'new') == home.id
+
+
+def test_renaming_a_user_drops_the_cached_name(make_user):
+    cache = server.lookupCache
+    user = make_user()
+    name = user.user_name
+    assert lookup.user_by_name(cache, name) is user
+    user.user_name = f'{name}-renamed'
+    db.session.commit()
+    assert lookup.user_by_name(cache, name) is None
+    assert lookup.user_by_name(cache, f'{name}-renamed') is user
+
+
+def test_a_stale_user_id_is_checked_against_the_row(cache, make_user):
+    user, other = make_user(), make_user()
+    cache.set(('user', user.user_name), other.id)
+    assert lookup.user_by_name(cache, user.user_name) is user
+
+
+def test_least_recently_used_entries_are_evicted(cache):
+    for key in 'abc':
+        cache.set(key, key)
+    assert cache.get('a') is None
+    assert cache.get('c') == 'c'
+    assert cache.stats['evictions'] == 1
+
+
+def test_create_user_joins_the_household_by_name_and_key(client):
+    home = household('joinable home', 'letmein')
+    body = {'user_name': 'joiner1', 'password_hash': 'secret', 'first_name': 'New', 'last_name': 'User',
+            'email': 'joiner@example.com', 'date_of_birth': '1/1/1990', 'household_name': 'joinable home'}
+    assert client.post('/create_user', json={**body, 'key': 'wrong'}).status_code == 402
+    assert User.query.filter(User.user_name == 'joiner1').first() is None
+    response = client.post('/create_user', json={**body, 'key': 'letmein'})
+    assert response.status_code == 200
+    assert User.query.filter(User.user_name == 'joiner1').one().household_id == home.id
@@ -0,0 +1,49 @@
+import json
+
+import pytest
+
+from models import Goals
+from money import to_cents, whole_cents
+
+
+@pytest.mark.parametrize('value, cents', [(1250, 1250), ('12.50', 1250), ('$1,000.005', 100001), (0.1, 10),
+                                          ('-3', -300)])
+def test_to_cents(value, cents):
+    assert to_cents(value) == cents
+
+
+@pytest.mark.parametrize('value', [None, True, '', 'abc', 'Infinity', '-inf', 'NaN', 'sNaN', float('inf'),
+                                   float('nan'), '1e999999999'])
+def test_to_cents_rejects_what_is_not_an_amount(value):
+    with pytest.raises(ValueError):
+        to_cents(value)
+
+
+@pytest.mark.parametrize('value, cents', [(12, 12), ('12', 12), ('-7', -7), (12.0, 12), ('1e3', 1000)])
+def test_whole_cents(value, cents):
+    assert whole_cents(value) == cents
+
+
+@pytest.mark.parametrize('value', [12.9, '12.5', 'NaN', 'Infinity', True, 'x'])
+def test_whole_cents_rejects_fractions_and_non_numbers(value):
+    with pytest.raises(ValueError):
+        whole_cents(value)
+
+
+def test_model_validators_raise_value_error():
+    with pytest.raises(ValueError):
+        Goals(target_amount_cents='Infinity')
+
+
+def test_import_rejects_non_finite_and_fractional_amounts(make_user, login):
+    user = make_user()
+    bank_id = user.bank[0].id
+    records = [{'external_id': 'ok', 'date': '2024-01-01', 'amount': '1.25'},
+               {'external_id': 'inf', 'date': '2024-01-01', 'amount': 'Infinity'},
+               {'external_id': 'nan', 'date': '2024-01-01', 'amount': 'NaN'},
+               {'external_id': 'part', 'date': '2024-01-01', 'amount_cents': 12.9}]
+    response = login(user).post(f'/banks/{bank_id}/transactions/import',
+                                data='\n'.join(json.dumps(record) for record in records))
+    assert response.status_code == 200
+    assert (response.json['inserted'], response.json['rejected']) == (1, 3)
+    assert [error['line'] for error in response.json['errors']] == [2, 3, 4]
@@ -0,0 +1,45 @@
+import os
+import signal
+
+import pytest
+
+from passwords import HashingBusy, PasswordHasher
+
+
+@pytest.fixture
+def hasher():
+    hasher = PasswordHasher(rounds=4, workers=1, max_pending=2, timeout=10)
+    yield hasher
+    hasher.shutdown()
+
+
+def test_hash_and_check_in_the_pool(hasher):
+    password_hash = hasher.hash('secret')
+    assert hasher.check(password_hash, 'secret')
+    assert not hasher.check(password_hash, 'wrong')
+    assert not hasher.check('not a bcrypt hash', 'secret')
+    assert not hasher.needs_rehash(password_hash)
+    assert PasswordHasher(rounds=5, workers=0).needs_rehash(password_hash)
+
+
+def test_hash_many(hasher):
+    hashes = hasher.hash_many(['a', 'b', 'c'])
+    assert [hasher.check(h, p) for h, p in zip(hashes, 'abc')] == [True, True, True]
+
+
+def test_busy_when_every_slot_is_taken(hasher):
+    for _ in range(2):
+        hasher._slots.acquire()
+    with pytest.raises(HashingBusy):
+        hasher.hash('secret')
+
+
+def test_a_killed_worker_does_not_break_hashing(hasher):
+    password_hash = hasher.hash('secret')
+    pool = hasher._get_pool()
+    for pid in list(pool._processes):
+        os.kill(pid, signal.SIGKILL)
+    # the job fails on the dead pool and is retried on a new one
+    assert hasher.check(password_hash, 'secret')
+    assert hasher._get_pool() is not pool
+    assert hasher.hash_many(['a', 'b'])
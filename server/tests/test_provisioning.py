@@ -0,0 +1,86 @@
+from itertools import count
+
+import pytest
+
+import lookup
+from config import db, hasher
+from models import Household, User
+
+_names = count(1)
+
+
+def member(**fields):
+    n = next(_names)
+    return {'user_name': f'member{n}', 'password': f'password{n}', 'first_name': 'New', 'last_name': 'Member',
+            'email': f'member{n}@example.com', 'date_of_birth': '1/1/1990', **fields}
+
+
+@pytest.fixture
+def admin(make_user, login):
+    return login(make_user())
+
+
+def test_creates_households_and_joins_existing_ones(make_user, admin):
+    household = Household(name='Existing Family', key='existing key')
+    db.session.add(household)
+    db.session.flush()
+    existing = make_user(household=household)
+    joining = member(household_name='Existing Family', key='existing key')
+    founder = member(household_name='Provisioned Family', key='family key', create_household=True)
+    second = member(household_name='Provisioned Family', key='family key')
+    response = admin.post('/provision', json={'members': [joining, founder, second]})
+    assert response.status_code == 200
+    body = response.json
+    assert (body['created'], body['households_created'], body['rejected']) == (3, 1, 0)
+    users = {user['user_name']: user for user in body['users']}
+    assert users[joining['user_name']]['household_id'] == existing.household_id
+    assert users[founder['user_name']]['admin'] is True and users[second['user_name']]['admin'] is False
+    assert users[founder['user_name']]['household_id'] == users[second['user_name']]['household_id']
+    assert all(user['otp_uri'].startswith('otpauth://') for user in body['users'])
+    created = User.query.filter(User.user_name == founder['user_name']).one()
+    assert hasher.check(created.password_hash, founder['password'])
+    family = Household.query.filter(Household.name == 'Provisioned Family').one()
+    assert lookup.household_id_by_code(lookup.LookupCache(), 'Provisioned Family', 'family key') == family.id
+
+
+def test_bad_rows_are_reported_and_skipped(make_user, admin):
+    taken = make_user().user_name
+    good = member(household_name='Rows Family', key='k', create_household=True)
+    rows = [good, member(user_name=good['user_name'], household_name='Rows Family', key='k'),
+            member(user_name=taken, household_name='Rows Family', key='k'),
+            member(household_name='Nowhere', key='k'),
+            member(household_name='Rows Family', key='k', email=''),
+            member(household_name='Rows Family', key=5)]
+    body = admin.post('/provision', json=rows).json
+    assert (body['created'], body['rejected']) == (1, 5)
+    assert [(error['row'], error['error']) for error in body['errors']] == [
+        (2, 'user_name also used on row 1'), (3, 'user_name already exists'), (4, 'household not found'),
+        (5, 'missing email'), (6, 'key must be text')]
+
+
+def test_dry_run_creates_nothing(admin):
+    row = member(household_name='Dry Family', key='k', create_household=True)
+    body = admin.post('/provision?dry_run=1', json=[row]).json
+    assert (body['created'], body['rejected']) == (0, 0)
+    assert User.query.filter(User.user_name == row['user_name']).first() is None
+
+
+def test_csv(admin):
+    rows = [member(household_name='Csv Family', key='k', create_household='yes') for _ in range(2)]
+    fields = list(rows[0])
+    body = '\n'.join([','.join(fields)] + [','.join(str(row[f]) for f in fields) for row in rows]) + '\n'
+    response = admin.post('/provision', data=body, content_type='text/csv')
+    assert response.json['created'] == 2
+
+
+@pytest.mark.parametrize('body', ['{"members": {"user_name": "x"}}', '[1, 2]', '{not json'])
+def test_malformed_member_lists(admin, body):
+    assert admin.post('/provision', data=body, content_type='application/json').status_code == 400
+
+
+def test_admins_only(make_user, login, client):
+    assert client.post('/provision', json=[]).status_code == 401
+    user = make_user()
+    user.admin = False
+    db.session.commit()
+    assert login(user).post('/provision', json=[]).status_code == 401
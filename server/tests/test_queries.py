@@ -0,0 +1,108 @@
+from datetime import date
+from types import SimpleNamespace
+
+import pyotp
+import pytest
+from sqlalchemy import update
+
+import ingest
+import serializers
+import two_factor
+from config import db
+from models import ExpenseItem, Goals, Household, MonthlyExpenses, Transactions, User, loader_profile
+from query_counter import assert_max_queries, count_queries
+from two_factor import TOTPVerifier
+
+NOW = 1_700_000_000
+
+
+@pytest.fixture
+def populate(make_user, make_category):
+    # a user with `size` of everything, so a lazy load per row shows up as a growing query count
+    def populate(size, household=None):
+        user = make_user(household=household, banks=size)
+        categories = [make_category().id for _ in range(size)]
+        for bank in user.bank:
+            ingest.ingest(bank.id, [{'external_id': f'tx{i}', 'date': f'2024-0{i % 9 + 1}-01', 'amount_cents': 100 * i,
+                                     'description': 'SHOP'} for i in range(size * 5)])
+        db.session.execute(update(Transactions).where(Transactions.categories_id.is_(None))
+                           .values(categories_id=categories[0]))
+        for i in range(size):
+            db.session.add(Goals(household_budget=False, name=f'goal{i}', description='', target_amount_cents=1000,
+                                 current_amount_cents=0, deadline='2025-01-01', user_id=user.id,
+                                 household_id=user.household_id))
+            budget = MonthlyExpenses(month=date(2024, i % 12 + 1, 1), is_household_budget=False,
+                                     user_expected_income_cents=100000, actual_income_cents=90000,
+                                     user_expected_monthly_expenses_total_cents=50000, is_fluctuating_income=False,
+                                     user_id=user.id, household_id=user.household_id)
+            budget.expense_items = [ExpenseItem(item_name=f'item{j}', planned_amount_cents=100,
+                                                categories_id=categories[j]) for j in range(size)]
+            db.session.add(budget)
+        db.session.commit()
+        fields = SimpleNamespace(id=user.id, user_name=user.user_name, OTPkey=user.OTPkey,
+                                 household_id=user.household_id)
+        # nothing is left in the identity map for the code under test to find
+        db.session.expunge_all()
+        return fields
+
+    return populate
+
+
+def login_queries(client, user, password, monkeypatch):
+    monkeypatch.setattr(two_factor, 'time', SimpleNamespace(time=lambda: NOW))
+    monkeypatch.setattr(two_factor, 'verifier', TOTPVerifier())
+    with count_queries(db.engine) as queries:
+        response = client.post('/login', json={'user_name': user.user_name, 'password': password,
+                                               'otpCode': pyotp.TOTP(user.OTPkey).at(NOW)})
+    assert response.status_code == 200
+    return response, queries
+
+
+def test_login_does_not_lazy_load_per_row(populate, client, password, monkeypatch):
+    small, small_queries = login_queries(client, populate(1), password, monkeypatch)
+    large, large_queries = login_queries(client, populate(6), password, monkeypatch)
+    assert len(large.json['bank']) == 6
+    assert sum(len(bank['transactions']) for bank in large.json['bank']) == 6 * 30
+    assert len(large_queries) == len(small_queries), large_queries
+
+
+def test_login_query_budget(populate, client, password, monkeypatch):
+    user = populate(4)
+    # the user_name lookup and the audit row, then the full profile: user + household,
+    # banks, transactions + categories, goals, budgets, expense items
+    with assert_max_queries(db.engine, 8):
+        login_queries(client, user, password, monkeypatch)
+
+
+def test_full_profile_loads_in_fixed_round_trips(populate):
+    user_id = populate(5).id
+    # user + household, banks, transactions + categories, goals, budgets, expense items
+    with assert_max_queries(db.engine, 6):
+        user = User.query.options(*loader_profile(User, 'full')).filter(User.id == user_id).one()
+        dumped = serializers.UserFull.dump(user)
+    assert len(dumped['bank']) == 5
+
+
+def test_members_profile_loads_in_fixed_round_trips(populate):
+    first = populate(3)
+    populate(3, household=db.session.get(Household, first.household_id))
+    db.session.expunge_all()
+    # household, members, goals, budgets, expense items
+    with assert_max_queries(db.engine, 5):
+        household = Household.query.options(*loader_profile(Household, 'members')
+                                            ).filter(Household.id == first.household_id).one()
+        assert len(household.user) == 2
+        assert sum(len(budget.expense_items) for budget in household.monthly_expenses) == 2 * 3 * 3
+
+
+@pytest.mark.parametrize('path', ['dashboard', 'spending', 'goal_summary', 'budget_summary'])
+def test_household_views_do_not_grow_with_the_household(populate, login, path):
+    counts = []
+    for size in (1, 5):
+        user = populate(size)
+        client = login(user)
+        with count_queries(db.engine) as queries:
+            response = client.get(f'/households/{user.household_id}/{path}')
+        assert response.status_code == 200, response.json
+        counts.append(len(queries))
+    assert counts[0] == counts[1], counts
@@ -0,0 +1,65 @@
+from types import SimpleNamespace
+
+import pyotp
+import pytest
+
+import two_factor
+from rate_limit import LoginRateLimiter, MemoryBackend, SQLiteBackend
+from two_factor import TOTPVerifier
+
+NOW = 1_700_000_000
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def limiter(request, tmp_path):
+    if request.param == 'memory':
+        backend = MemoryBackend(3)
+    else:
+        backend = SQLiteBackend(str(tmp_path / 'limits.db'), bucket_seconds=1)
+    return LoginRateLimiter(backend, max_attempts=3, window_seconds=60)
+
+
+def test_ip_limit_slides(limiter):
+    for i in range(3):
+        assert not limiter.is_limited('1.2.3.4', now=NOW + i)
+        limiter.record('1.2.3.4', now=NOW + i)
+    assert limiter.is_limited('1.2.3.4', now=NOW + 3)
+    assert not limiter.is_limited('5.6.7.8', now=NOW + 3)
+    # the first attempt has left the window
+    assert not limiter.is_limited('1.2.3.4', now=NOW + 61)
+
+
+def test_user_name_limit_counts_failures_across_ips(limiter):
+    for i in range(3):
+        limiter.record_failure('Alice', now=NOW)
+    assert limiter.is_limited('9.9.9.9', 'alice', now=NOW)
+    assert not limiter.is_limited('9.9.9.9', 'bob', now=NOW)
+
+
+def login(client, user, password, ip, otp=True):
+    return client.post('/login', environ_base={'REMOTE_ADDR': ip}, json={
+        'user_name': user.user_name, 'password': password,
+        'otpCode': pyotp.TOTP(user.OTPkey).at(NOW) if otp else '000000'})
+
+
+@pytest.mark.parametrize('body', [{'user_name': 5, 'password': 'x', 'otpCode': '1'}, {'user_name': None}, [1]])
+def test_login_rejects_a_non_text_user_name(client, body):
+    assert client.post('/login', json=body).status_code == 400
+
+
+def test_successful_logins_do_not_lock_the_user_name(make_user, client, password, monkeypatch):
+    monkeypatch.setattr(two_factor, 'time', SimpleNamespace(time=lambda: NOW))
+    user = make_user()
+    for i in range(6):
+        # a fresh verifier each time, the same code would otherwise be a replay
+        monkeypatch.setattr(two_factor, 'verifier', TOTPVerifier())
+        assert login(client, user, password, f'10.0.0.{i}').status_code == 200
+
+
+def test_failed_logins_lock_the_user_name(make_user, client, password):
+    user = make_user()
+    for i in range(4):
+        assert login(client, user, 'wrong', f'10.0.1.{i}').status_code == 401
+    # the right password from a new ip is still turned away
+    response = login(client, user, password, '10.0.1.99')
+    assert response.json == {'error': 'Too Many Attempts'}
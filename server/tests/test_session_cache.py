@@ -0,0 +1,77 @@
+import threading
+
+import pytest
+
+from app import sessionCache
+from config import db
+from query_counter import assert_max_queries
+from session_cache import MemoryBackend, SessionCache, SQLiteBackend
+
+
+def test_check_session_is_served_from_the_cache(make_user, login):
+    client = login(make_user())
+    with assert_max_queries(db.engine, 1):
+        assert client.get('/check_session').status_code == 200
+    with assert_max_queries(db.engine, 0):
+        assert client.get('/check_session').status_code == 200
+
+
+def test_a_committed_change_evicts_a_rolled_back_one_does_not(make_user, login):
+    user = make_user()
+    client = login(user)
+    client.get('/check_session')
+    user.first_name = 'Changed'
+    db.session.flush()
+    db.session.rollback()
+    assert sessionCache.get(user.id) is not None
+    user.first_name = 'Changed'
+    db.session.commit()
+    assert sessionCache.get(user.id) is None
+    assert client.get('/check_session').json['first_name'] == 'Changed'
+
+
+@pytest.mark.parametrize('backend', ['memory', 'sqlite'])
+def test_backends_expire_and_delete(backend, tmp_path):
+    if backend == 'memory':
+        cache = SessionCache(MemoryBackend(max_entries=2, ttl=60))
+    else:
+        cache = SessionCache(SQLiteBackend(str(tmp_path / 'sessions.db'), ttl=60))
+    cache.set(1, b'one')
+    cache.set(2, b'two')
+    assert cache.get(1) == b'one'
+    cache.invalidate({1})
+    assert cache.get(1) is None
+    cache.backend.ttl = -1
+    cache.set(3, b'three')
+    assert cache.get(3) is None
+    assert cache.stats == {**cache.stats, 'hits': 1, 'misses': 2, 'expired': 1, 'invalidations': 1}
+
+
+def test_memory_backend_is_bounded():
+    cache = SessionCache(MemoryBackend(max_entries=2))
+    for user_id in range(5):
+        cache.set(user_id, b'x')
+    assert [cache.get(user_id) for user_id in range(5)] == [None, None, None, b'x', b'x']
+    assert cache.stats['evictions'] == 3
+
+
+def test_counters_are_exact_under_threads():
+    cache = SessionCache(MemoryBackend())
+    cache.set(1, b'x')
+    threads = [threading.Thread(target=lambda: [cache.get(i % 2) for i in range(2000)]) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert (cache.stats['hits'], cache.stats['misses']) == (8000, 8000)
+
+
+def test_stats_are_for_admins_only(make_user, login, client):
+    assert client.get('/session_cache_stats').status_code == 401
+    user = make_user()
+    user.admin = False
+    db.session.commit()
+    assert login(user).get('/session_cache_stats').status_code == 401
+    user.admin = True
+    db.session.commit()
+    assert set(login(user).get('/session_cache_stats').json) >= {'hits', 'misses', 'invalidations'}
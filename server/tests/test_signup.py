@@ -0,0 +1,19 @@
+import pyotp
+
+from models import User
+
+USER = {'user_name': None, 'password_hash': 'secret', 'first_name': 'New', 'last_name': 'User',
+        'email': 'new@example.com', 'date_of_birth': '1/1/1990'}
+
+
+def test_create_super_user_returns_the_summary_and_otp_uri(client):
+    response = client.post('/create_super_user', json={**USER, 'user_name': 'super1',
+                                                       'household_name': 'super household', 'key': 'k'})
+    assert response.status_code == 200
+    body = response.json
+    user = User.query.filter(User.user_name == 'super1').one()
+    assert body['id'] == user.id and body['admin'] is True
+    assert pyotp.parse_uri(body['otp_uri']).secret == user.OTPkey
+    # nothing private in the body, or smuggled out as headers
+    assert not {'_password_hash', 'OTPkey', 'household', 'bank'} & set(body)
+    assert 'household_id' not in response.headers
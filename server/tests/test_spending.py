@@ -0,0 +1,55 @@
+import random
+from datetime import date, timedelta
+
+import categorize
+import ingest
+import spending
+from config import db
+from models import CategoryRule, HouseholdMonthlySpending
+
+
+def rollup(household_ids):
+    rows = db.session.query(HouseholdMonthlySpending).filter(HouseholdMonthlySpending.household_id.in_(household_ids))
+    return {(row.household_id, row.month, row.categories_id): [row.transactions, row.amount_cents] for row in rows}
+
+
+def test_spending_rollup_matches_transactions_after_random_writes(make_user, make_category):
+    rng = random.Random(25)
+    users = [make_user(banks=2) for _ in range(2)]
+    users.append(make_user(household=users[0].household, banks=1))
+    households = {user.household_id for user in users}
+    banks = [bank.id for user in users for bank in user.bank]
+    categories = [make_category().id for _ in range(3)]
+    descriptions = ['COFFEE SHOP', 'UBER TRIP', 'GROCERY STORE', 'RENT', 'COFFEE BEANS ONLINE']
+    for step in range(40):
+        bank_id = rng.choice(banks)
+        if rng.random() < 0.7:
+            # external ids repeat across batches, the duplicates must not count
+            records = [{'external_id': f'tx{rng.randrange(60)}',
+                        'date': (date(2024, 1, 1) + timedelta(days=rng.randrange(120))).isoformat(),
+                        'amount_cents': rng.randint(-5000, 20000),
+                        'description': rng.choice(descriptions)} for _ in range(rng.randint(1, 15))]
+            ingest.ingest(bank_id, records, batch_size=4, matcher=categorize.matcher_for_bank(bank_id))
+        else:
+            user = rng.choice(users)
+            db.session.add(CategoryRule(match_type=rng.choice(['substring', 'regex']),
+                                        pattern=rng.choice(['COFFEE', 'UBER', '^GROCERY', 'ONLINE$']),
+                                        priority=rng.randint(1, 5), categories_id=rng.choice(categories),
+                                        household_id=user.household_id))
+            db.session.commit()
+            categorize.recategorize_bank(bank_id, batch_size=7)
+    expected = {key: value for key, value in spending.totals(db.session.connection()).items() if key[0] in households}
+    assert expected
+    assert rollup(households) == expected
+
+
+def test_backfill_rebuilds_the_rollup(make_user):
+    user = make_user()
+    bank_id = user.bank[0].id
+    ingest.ingest(bank_id, [{'external_id': f'tx{i}', 'date': f'2024-0{i % 3 + 1}-10', 'amount_cents': 100 * i,
+                             'description': 'SHOP'} for i in range(12)])
+    before = rollup({user.household_id})
+    db.session.execute(HouseholdMonthlySpending.__table__.delete())
+    db.session.commit()
+    spending.backfill(workers=2, chunk_size=1)
+    assert rollup({user.household_id}) == before
@@ -0,0 +1,120 @@
+import random
+from datetime import date, timedelta
+
+import pytest
+from sqlalchemy import event
+
+import transactions
+from config import db
+from models import Transactions
+from query_counter import assert_max_queries
+
+
+def add_transactions(bank_id, days):
+    # straight into the table, dates can be None here (the feed importer requires one)
+    rows = [{'bank_id': bank_id, 'external_id': f'{bank_id}-{i}', 'date': day, 'amount_cents': 100 + i,
+             'transaction_description': f'TX {i}'} for i, day in enumerate(days)]
+    db.session.execute(Transactions.__table__.insert(), rows)
+    db.session.commit()
+
+
+def expected_order(bank_id):
+    rows = db.session.query(Transactions.id, Transactions.date).filter(Transactions.bank_id == bank_id).all()
+    dated = sorted((row for row in rows if row.date is not None), key=lambda row: (row.date, row.id), reverse=True)
+    undated = sorted((row for row in rows if row.date is None), key=lambda row: row.id, reverse=True)
+    return [row.id for row in dated + undated]
+
+
+def walk(bank_id, limit, **filters):
+    ids, cursor, pages = [], None, 0
+    while True:
+        page = transactions.list_transactions(bank_id, cursor=cursor, limit=limit, fields=['id'], **filters)
+        ids += [item['id'] for item in page['transactions']]
+        pages += 1
+        assert pages < 1000
+        cursor = page['next_cursor']
+        if cursor is None:
+            return ids
+
+
+@pytest.fixture
+def bank_id(make_user):
+    return make_user().bank[0].id
+
+
+@pytest.mark.parametrize('limit', [1, 2, 3, 7, 50])
+def test_pages_cover_dated_then_undated_rows(bank_id, limit):
+    # repeated dates and NULL dates interleaved by id, so ties and the phase switch land mid-page
+    start = date(2024, 1, 1)
+    rng = random.Random(limit)
+    add_transactions(bank_id, [None if rng.random() < 0.3 else start + timedelta(days=rng.randrange(5))
+                               for _ in range(40)])
+    assert walk(bank_id, limit) == expected_order(bank_id)
+
+
+def test_only_undated_rows(bank_id):
+    add_transactions(bank_id, [None] * 7)
+    assert walk(bank_id, 3) == expected_order(bank_id)
+
+
+def test_page_boundary_on_the_last_dated_row(bank_id):
+    add_transactions(bank_id, [date(2024, 1, 1), date(2024, 1, 2), None, None, date(2024, 1, 3), None])
+    first = transactions.list_transactions(bank_id, limit=3, fields=['id', 'date'])
+    assert [item['date'] for item in first['transactions']] == ['2024-01-03', '2024-01-02', '2024-01-01']
+    rest = transactions.list_transactions(bank_id, cursor=first['next_cursor'], limit=3, fields=['id', 'date'])
+    assert [item['date'] for item in rest['transactions']] == [None, None, None]
+    assert rest['next_cursor'] is None
+
+
+def test_date_range_leaves_undated_rows_out(bank_id):
+    add_transactions(bank_id, [date(2024, 1, day) for day in range(1, 11)] + [None, None])
+    ids = walk(bank_id, 3, start=date(2024, 1, 3), end=date(2024, 1, 8))
+    rows = db.session.query(Transactions.date).filter(Transactions.id.in_(ids)).all()
+    assert len(ids) == 6
+    assert all(date(2024, 1, 3) <= row.date <= date(2024, 1, 8) for row in rows)
+
+
+def test_bad_cursor(bank_id):
+    with pytest.raises(ValueError):
+        transactions.list_transactions(bank_id, cursor='not a cursor')
+
+
+def test_endpoint_pages_in_bounded_queries(make_user, login):
+    user = make_user()
+    bank_id = user.bank[0].id
+    add_transactions(bank_id, [date(2024, 1, 1) + timedelta(days=i % 9) for i in range(200)] + [None] * 20)
+    client = login(user)
+    cursor, seen = None, []
+    while True:
+        # ownership check, the dated page, and the undated fill on the last dated page
+        with assert_max_queries(db.engine, 3):
+            page = client.get(f'/banks/{bank_id}/transactions', query_string={'limit': 60, 'fields': 'id',
+                                                                              **({'cursor': cursor} if cursor else {})})
+        assert page.status_code == 200
+        seen += [item['id'] for item in page.json['transactions']]
+        if (cursor := page.json['next_cursor']) is None:
+            break
+    assert seen == expected_order(bank_id)
+
+
+def test_deep_pages_seek_the_index(bank_id):
+    # every page after the first narrows the index range past bank_id, on both sides of the NULL dates
+    add_transactions(bank_id, [date(2024, 1, 1) + timedelta(days=i % 5) for i in range(20)] + [None] * 5)
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+
+    cursor = transactions.list_transactions(bank_id, limit=5, fields=['id'])['next_cursor']
+    undated = transactions.encode_cursor(None, max(expected_order(bank_id)))
+    event.listen(db.engine, 'before_cursor_execute', capture)
+    try:
+        transactions.list_transactions(bank_id, cursor=cursor, limit=5, fields=['id'])
+        transactions.list_transactions(bank_id, cursor=undated, limit=5, fields=['id'])
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', capture)
+    assert len(statements) == 2
+    for statement, parameters in statements:
+        plan = ' '.join(str(row[-1]) for row in db.session.connection().exec_driver_sql(
+            f'EXPLAIN QUERY PLAN {statement}', parameters))
+        assert 'ix_transactions_table_bank_date_id (bank_id=? AND' in plan, plan
@@ -0,0 +1,74 @@
+from types import SimpleNamespace
+
+import pyotp
+import pytest
+
+import two_factor
+from two_factor import INTERVAL, MemoryStepStore, SQLiteStepStore, TOTPVerifier
+
+KEY = pyotp.random_base32()
+NOW = 1_700_000_000
+
+
+def code(at, key=KEY):
+    return pyotp.TOTP(key).at(at)
+
+
+def test_codes_match_pyotp():
+    verifier = TOTPVerifier()
+    assert verifier.verify(1, KEY, code(NOW), now=NOW)
+    assert not verifier.verify(1, KEY, code(NOW - 5 * INTERVAL), now=NOW)
+
+
+def test_a_code_is_accepted_once():
+    verifier = TOTPVerifier()
+    assert verifier.verify(1, KEY, code(NOW), now=NOW)
+    assert not verifier.verify(1, KEY, code(NOW), now=NOW)
+    # another user's step marker is their own
+    assert verifier.verify(2, KEY, code(NOW), now=NOW)
+
+
+def test_an_older_code_is_rejected_after_a_newer_one():
+    verifier = TOTPVerifier(valid_window=1)
+    assert verifier.verify(1, KEY, code(NOW), now=NOW)
+    assert not verifier.verify(1, KEY, code(NOW - INTERVAL), now=NOW)
+    assert verifier.verify(1, KEY, code(NOW + INTERVAL), now=NOW)
+
+
+@pytest.mark.parametrize('bad', ['', '12345', '1234567', '12 456', 'abcdef', '١٢٣٤٥٦', '１２３４５６', None, 123456.0])
+def test_malformed_codes_are_rejected_without_raising(bad):
+    assert not TOTPVerifier().verify(1, KEY, bad, now=NOW)
+
+
+def test_integer_codes_are_accepted():
+    at = next(t for t in range(NOW, NOW + 1000 * INTERVAL, INTERVAL) if not code(t).startswith('0'))
+    assert TOTPVerifier().verify(1, KEY, int(code(at)), now=at)
+
+
+def test_replay_is_rejected_across_workers(tmp_path):
+    # two verifiers (one per worker process) sharing the sqlite step store
+    path = str(tmp_path / 'totp.db')
+    first = TOTPVerifier(store=SQLiteStepStore(path))
+    second = TOTPVerifier(store=SQLiteStepStore(path))
+    assert first.verify(1, KEY, code(NOW), now=NOW)
+    assert not second.verify(1, KEY, code(NOW), now=NOW)
+    assert second.verify(1, KEY, code(NOW + INTERVAL), now=NOW + INTERVAL)
+    assert not first.verify(1, KEY, code(NOW + INTERVAL), now=NOW + INTERVAL)
+
+
+def test_memory_store_only_moves_forward():
+    store = MemoryStepStore()
+    assert store.accept(1, 10)
+    assert not store.accept(1, 10)
+    assert not store.accept(1, 9)
+    assert store.accept(1, 11)
+
+
+def test_login_rejects_a_replayed_code(make_user, client, password, monkeypatch):
+    # a fixed clock, so both logins fall in the same 30s step
+    monkeypatch.setattr(two_factor, 'time', SimpleNamespace(time=lambda: NOW))
+    monkeypatch.setattr(two_factor, 'verifier', TOTPVerifier())
+    user = make_user()
+    credentials = {'user_name': user.user_name, 'password': password, 'otpCode': code(NOW, user.OTPkey)}
+    assert client.post('/login', json=credentials).status_code == 200
+    assert client.post('/login', json=credentials).status_code == 401
@@ -0,0 +1,77 @@
+import base64
+from datetime import date
+
+from sqlalchemy import tuple_
+
+from config import db
+from models import Transactions
+
+
+# keyset-paginated transaction listing, newest first
+# the cursor is the (date, id) of the last row on the previous page, so every page
+# is a range scan on ix_transactions_table_bank_date_id however deep the client goes.
+# rows without a date come after all the dated ones, as a second phase: a cursor with
+# an empty date continues through (date IS NULL, id < cursor id), which seeks on the
+# same index. each phase's predicate is a single row-value comparison the index can use.
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+FIELDS = {column.key: column for column in Transactions.__table__.columns}
+
+
+def encode_cursor(row_date, row_id):
+    raw = f'{row_date.isoformat() if row_date else ""}|{row_id}'
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8')
+        row_date, row_id = raw.split('|')
+        return (date.fromisoformat(row_date) if row_date else None), int(row_id)
+    except (ValueError, UnicodeError):
+        raise ValueError('Invalid cursor')
+
+
+def list_transactions(bank_id, cursor=None, limit=DEFAULT_PAGE_SIZE, fields=None,
+                      categories_id=None, start=None, end=None):
+    fields = list(fields or FIELDS)
+    unknown = [f for f in fields if f not in FIELDS]
+    if unknown:
+        raise ValueError(f'Unknown fields: {", ".join(unknown)}')
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+
+    columns = [FIELDS[f] for f in fields]
+    # the cursor needs date and id even when they weren't asked for
+    query = db.session.query(Transactions.date, Transactions.id, *columns
+                             ).filter(Transactions.bank_id == bank_id)
+    if categories_id == 'none':
+        query = query.filter(Transactions.categories_id.is_(None))
+    elif categories_id is not None:
+        query = query.filter(Transactions.categories_id == int(categories_id))
+    if start:
+        query = query.filter(Transactions.date >= start)
+    if end:
+        query = query.filter(Transactions.date <= end)
+    after_date, after_id = decode_cursor(cursor) if cursor else (None, None)
+    undated = query.filter(Transactions.date.is_(None)).order_by(Transactions.id.desc())
+    if cursor and after_date is None:
+        rows = undated.filter(Transactions.id < after_id).limit(limit + 1).all()
+    else:
+        dated = query.filter(Transactions.date.is_not(None))
+        if cursor:
+            dated = dated.filter(tuple_(Transactions.date, Transactions.id) < (after_date, after_id))
+        rows = dated.order_by(Transactions.date.desc(), Transactions.id.desc()).limit(limit + 1).all()
+        # the dated rows ran out on this page, fill it from the start of the undated ones
+        if len(rows) <= limit and not (start or end):
+            rows += undated.limit(limit + 1 - len(rows)).all()
+    more = len(rows) > limit
+    rows = rows[:limit]
+    items = []
+    for row in rows:
+        item = dict(zip(fields, row[2:]))
+        if item.get('date') is not None:
+            item['date'] = item['date'].isoformat()
+        items.append(item)
+    return {'transactions': items,
+            'next_cursor': encode_cursor(rows[-1][0], rows[-1][1]) if more else None}
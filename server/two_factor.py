@@ -1,12 +1,151 @@
-import pyotp
+import base64
+import hashlib
+import hmac
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
 
 def createNewURI(user_name):
+    # pyotp is only needed to enroll users, codes are checked by TOTPVerifier below
+    import pyotp
+
     key = pyotp.random_base32()
 
     uri = pyotp.totp.TOTP(key).provisioning_uri(name = user_name, issuer_name="Money Magnet")
     return key, uri
 
-def authenticateUser(OTPkey, OTPcode):
-    totp = pyotp.TOTP(OTPkey)
-    return totp.verify(OTPcode)
+def createNewURIs(user_names):
+    # bulk provisioning, one (key, uri) pair per user name, no network involved
+    return [createNewURI(user_name) for user_name in user_names]
+
+
+# last accepted time-step per user, a code is only accepted for a later step
+# so a code can't be replayed inside its window
+
+class MemoryStepStore:
+
+    def __init__(self):
+        self._steps = {}
+        self._lock = threading.Lock()
+
+    def accept(self, user_id, step):
+        with self._lock:
+            if self._steps.get(user_id, -1) >= step:
+                return False
+            self._steps[user_id] = step
+            return True
+
+    def clear(self):
+        with self._lock:
+            self._steps.clear()
+
+
+class NullStepStore:
+    # no replay protection, only for load tests that reuse codes
+
+    def accept(self, user_id, step):
+        return True
+
+    def clear(self):
+        pass
+
+
+class SQLiteStepStore:
+    # shared between workers, so a code used against one worker is rejected by the others
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._connect().execute('CREATE TABLE IF NOT EXISTS totp_steps ('
+                                'user_id TEXT PRIMARY KEY, step INTEGER NOT NULL) WITHOUT ROWID')
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            self._local.conn = conn
+        return conn
+
+    def accept(self, user_id, step):
+        # a single upsert that only moves the step forward, no read-then-write race
+        cursor = self._connect().execute(
+            'INSERT INTO totp_steps (user_id, step) VALUES (?, ?) '
+            'ON CONFLICT (user_id) DO UPDATE SET step = excluded.step WHERE excluded.step > totp_steps.step',
+            (str(user_id), step))
+        return cursor.rowcount == 1
+
+    def clear(self):
+        self._connect().execute('DELETE FROM totp_steps')
+
+
+INTERVAL = 30
+
+class TOTPVerifier:
+
+    def __init__(self, valid_window=0, cache_size=4096, store=None):
+        self.valid_window = valid_window
+        self.cache_size = cache_size
+        self.store = store or MemoryStepStore()
+        self._secrets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _secret(self, user_id, OTPkey):
+        # decoded secrets are kept per user, and replaced if the user's key changes
+        with self._lock:
+            entry = self._secrets.get(user_id)
+            if entry is not None and entry[0] == OTPkey:
+                self._secrets.move_to_end(user_id)
+                return entry[1]
+        secret = base64.b32decode(OTPkey.upper() + '=' * (-len(OTPkey) % 8))
+        with self._lock:
+            self._secrets[user_id] = (OTPkey, secret)
+            self._secrets.move_to_end(user_id)
+            if len(self._secrets) > self.cache_size:
+                self._secrets.popitem(last=False)
+        return secret
+
+    def _code(self, secret, step):
+        # RFC 4226 dynamic truncation, same codes as pyotp's default 6 digit SHA1 TOTP
+        digest = hmac.new(secret, step.to_bytes(8, 'big'), hashlib.sha1).digest()
+        offset = digest[-1] & 0x0f
+        value = int.from_bytes(digest[offset:offset + 4], 'big') & 0x7fffffff
+        return f'{value % 1000000:06d}'
+
+    def verify(self, user_id, OTPkey, OTPcode, now=None):
+        OTPcode = str(OTPcode) if OTPcode is not None else ''
+        # compare_digest only takes ASCII strings, anything but 6 digits can't match anyway
+        if len(OTPcode) != 6 or not OTPcode.isascii() or not OTPcode.isdigit():
+            return False
+        secret = self._secret(user_id, OTPkey)
+        current = int((time.time() if now is None else now) // INTERVAL)
+        # newest step first, so a fresh code moves the replay marker as far forward as possible
+        for step in range(current + self.valid_window, current - self.valid_window - 1, -1):
+            if hmac.compare_digest(self._code(secret, step), OTPcode):
+                return self.store.accept(user_id, step)
+        return False
+
+
+verifier = TOTPVerifier()
+
+def configure(app):
+    global verifier
+    # TOTP_REPLAY_BACKEND is 'memory', 'none' or 'sqlite:///path/to/file.db'
+    setting = app.config.get('TOTP_REPLAY_BACKEND', 'memory')
+    if setting == 'memory':
+        store = MemoryStepStore()
+    elif setting == 'none':
+        store = NullStepStore()
+    elif setting.startswith('sqlite:///'):
+        store = SQLiteStepStore(setting[len('sqlite:///'):])
+    else:
+        raise ValueError(f'Unknown TOTP_REPLAY_BACKEND: {setting}')
+    verifier = TOTPVerifier(valid_window=app.config.get('TOTP_VALID_WINDOW', 0),
+                            cache_size=app.config.get('TOTP_CACHE_SIZE', 4096),
+                            store=store)
+    return verifier
 
+def authenticateUser(OTPkey, OTPcode, user_id=None):
+    # without a user id the key itself identifies the user
+    return verifier.verify(OTPkey if user_id is None else user_id, OTPkey, OTPcode)
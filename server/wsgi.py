@@ -0,0 +1,9 @@
+# WSGI entry point for production servers
+#
+#   cd server && gunicorn -c gunicorn.conf.py wsgi:app
+#
+# `python app.py` is still the single-process development server.
+
+from app import app
+
+application = app